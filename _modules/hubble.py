@@ -15,6 +15,12 @@ Configuration:
     - hubblestack:nova:saltenv
     - hubblestack:nova:autoload
     - hubblestack:nova:autosync
+    - hubblestack:nova:sync_interval
+    - hubblestack:nova:workers
+    - hubblestack:nova:module_timeout
+    - hubblestack:nova:profile
+    - hubblestack:nova:result_cache
+    - hubblestack:nova:file_index_max_age
 '''
 from __future__ import absolute_import
 import logging
@@ -25,9 +31,32 @@ import imp
 import os
 import sys
 import six
+import copy
+import json
+import stat
 import inspect
+import fnmatch
+import hashlib
+import tempfile
 import yaml
+import time
+import socket
+import struct
+import threading
 import traceback
+import collections
+from multiprocessing.pool import ThreadPool
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
 
 import salt
 import salt.utils
@@ -37,6 +66,33 @@ from nova_loader import NovaLazyLoader
 __nova__ = {}
 __version__ = 'v2017.9.0'
 
+# Holds the _ModuleTimer for the nova module running in the current thread,
+# when hubble.audit is profiling
+_TIMING_LOCAL = threading.local()
+# The _TimedFunctions wrapping __salt__ for the nova modules
+_TIMED_FUNCTIONS = None
+
+# Parsed topfiles, as path -> ((mtime, size), topfile data). Like
+# _MATCH_CACHE, this is only kept in memory, so forked minion jobs each start
+# with it empty; parsing a topfile and running its matches is cheap next to
+# the audit itself, so neither is saved to disk.
+_TOP_CACHE = {}
+# Results of match.compound for the current grains/pillar, as
+# {'context': hash of grains/pillar, 'matches': {match: result}}
+_MATCH_CACHE = {'context': None, 'matches': {}}
+
+# The timing fields recorded for each module and tag, and the number of runs
+# the timing history averages over
+_TIMING_FIELDS = ('wall', 'cpu', 'subprocesses', 'file_reads')
+_TIMING_HISTORY_RUNS = 10
+
+# The file type bits of st_mode
+_S_IFMT = 0o170000
+# Directories modified this recently (in seconds) when they're indexed are
+# listed again on the next audit, as they may change again within the same
+# mtime
+_FILE_INDEX_RACY = 2
+
 
 def audit(configs=None,
           tags='*',
@@ -46,6 +102,7 @@ def audit(configs=None,
           show_profile=None,
           called_from_top=None,
           debug=None,
+          profile=None,
           **kwargs):
     '''
     Primary entry point for audit calls.
@@ -95,6 +152,12 @@ def audit(configs=None,
         False. Configurable via `hubblestack:nova:debug` in minion
         config/pillar.
 
+    profile
+        Whether to record the wall time, CPU time and number of subprocesses
+        spent in each nova module, and in each tag within those modules. The
+        numbers are returned under the `Timing` key. Defaults to False.
+        Configurable via `hubblestack:nova:profile` in minion config/pillar.
+
     **kwargs
         Any parameters & values that are not explicitly defined will be passed
         directly through to the Nova module(s).
@@ -110,7 +173,8 @@ def audit(configs=None,
     if configs is None:
         return top(verbose=verbose,
                    show_success=show_success,
-                   show_compliance=show_compliance)
+                   show_compliance=show_compliance,
+                   profile=profile)
 
     if not called_from_top and __salt__['config.get']('hubblestack:nova:autoload', True):
         load()
@@ -129,63 +193,53 @@ def audit(configs=None,
         )
     if debug is None:
         debug = __salt__['config.get']('hubblestack:nova:debug', False)
+    if profile is None:
+        profile = __salt__['config.get']('hubblestack:nova:profile', False)
 
-    if not isinstance(configs, list):
-        # Convert string
-        configs = configs.split(',')
+    configs = _config_paths(configs)
+    nova_kwargs = _nova_kwargs(kwargs)
 
-    # Convert config list to paths, with leading slashes
-    configs = [os.path.join(os.path.sep, os.path.join(*(con.split('.yaml')[0]).split('.')))
-               for con in configs]
+    ret = _run_audit(configs, tags, debug, profile=profile, **nova_kwargs)
 
-    # Pass any module parameters through to the Nova module
-    nova_kwargs = {}
-    # Get values from config first (if any) and merge into nova_kwargs
-    nova_kwargs_config =  __salt__['config.get']('hubblestack:nova:nova_kwargs', False)
-    if nova_kwargs_config is not False:
-        nova_kwargs.update(nova_kwargs_config)
-    # Now process arguments from CLI and merge into nova_kwargs_dict
-    if kwargs is not None:
-        nova_kwargs.update(kwargs)
+    results = _format_results(ret, verbose, show_success, show_compliance)
 
-    log.debug('nova_kwargs: ' + str(nova_kwargs))
-
-    ret = _run_audit(configs, tags, debug, **nova_kwargs)
-
-    terse_results = {}
-    verbose_results = {}
+    if not called_from_top and not results:
+        results['Messages'] = 'No audits matched this host in the specified profiles.'
 
-    # Pull out just the tag and description
-    terse_results['Failure'] = []
-    tags_descriptions = set()
+    for error in ret.get('Errors', []):
+      if not results.has_key('Errors'):
+        results['Errors'] = []
+      results['Errors'].append(error)
 
-    for tag_data in ret.get('Failure', []):
-        tag = tag_data['tag']
-        description = tag_data.get('description')
-        if (tag, description) not in tags_descriptions:
-            terse_results['Failure'].append({tag: description})
-            tags_descriptions.add((tag, description))
+    if ret.get('Timing'):
+        results['Timing'] = ret['Timing']
 
-    terse_results['Success'] = []
-    tags_descriptions = set()
+    return results
 
-    for tag_data in ret.get('Success', []):
-        tag = tag_data['tag']
-        description = tag_data.get('description')
-        if (tag, description) not in tags_descriptions:
-            terse_results['Success'].append({tag: description})
-            tags_descriptions.add((tag, description))
 
-    terse_results['Controlled'] = []
-    control_reasons = set()
+def _format_results(ret, verbose, show_success, show_compliance):
+    '''
+    Build the ``hubble.audit`` output from the Success/Failure/Controlled
+    results in ``ret``
+    '''
+    terse_results = {}
+    verbose_results = {}
 
-    for tag_data in ret.get('Controlled', []):
-        tag = tag_data['tag']
-        control_reason = tag_data.get('control', '')
-        description = tag_data.get('description')
-        if (tag, description, control_reason) not in control_reasons:
-            terse_results['Controlled'].append({tag: control_reason})
-            control_reasons.add((tag, description, control_reason))
+    # Build the terse output (tag and description, or control reason, with
+    # duplicates removed) and the verbose output (single-key dictionaries
+    # with tag as key) in a single pass over each set of results
+    for key in ('Failure', 'Success', 'Controlled'):
+        terse_results[key] = []
+        verbose_results[key] = []
+        seen = set()
+        for tag_data in ret.get(key, []):
+            tag = tag_data['tag']
+            terse_key, terse_value = _terse_result(key, tag_data)
+            if terse_key not in seen:
+                terse_results[key].append({tag: terse_value})
+                seen.add(terse_key)
+            if verbose:
+                verbose_results[key].append({tag: tag_data})
 
     # Calculate compliance level
     if show_compliance:
@@ -193,58 +247,227 @@ def audit(configs=None,
     else:
         compliance = False
 
-    if not show_success and 'Success' in terse_results:
+    if not show_success:
         terse_results.pop('Success')
+        verbose_results.pop('Success')
 
     if not terse_results['Controlled']:
         terse_results.pop('Controlled')
+    if not verbose_results['Controlled']:
+        verbose_results.pop('Controlled')
 
-    # Format verbose output as single-key dictionaries with tag as key
     if verbose:
-        verbose_results['Failure'] = []
+        results = verbose_results
+    else:
+        results = terse_results
 
-        for tag_data in ret.get('Failure', []):
-            tag = tag_data['tag']
-            verbose_results['Failure'].append({tag: tag_data})
+    if compliance:
+        results['Compliance'] = compliance
 
-        verbose_results['Success'] = []
+    return results
 
-        for tag_data in ret.get('Success', []):
-            tag = tag_data['tag']
-            verbose_results['Success'].append({tag: tag_data})
 
-        if not show_success and 'Success' in verbose_results:
-            verbose_results.pop('Success')
+def audit_iter(configs,
+               tags='*',
+               verbose=None,
+               show_success=None,
+               show_compliance=None,
+               debug=None,
+               **kwargs):
+    '''
+    Run the given audits like ``hubble.audit``, but yield the results one
+    check at a time as each nova module finishes, instead of building the
+    whole report in memory first. This is meant for returners and other
+    modules which can ship results as they arrive:
 
-        verbose_results['Controlled'] = []
+    .. code-block:: python
 
-        for tag_data in ret.get('Controlled', []):
-            tag = tag_data['tag']
-            verbose_results['Controlled'].append({tag: tag_data})
+        for key, result in __salt__['hubble.audit_iter']('cis.centos-7-level-1-scored-v2-1-0'):
+            ...
 
-        if not verbose_results['Controlled']:
-            verbose_results.pop('Controlled')
+    Each item is a ``(key, result)`` tuple, where ``key`` is ``Failure``,
+    ``Success``, ``Controlled`` or ``Errors`` and ``result`` is the
+    single-key dictionary ``hubble.audit`` would have put in that list, so
+    appending each ``result`` to ``results[key]`` rebuilds the
+    ``hubble.audit`` report. Compliance is counted as the results go by,
+    and is yielded last, as ``('Compliance', '<percent>%')``.
 
-        results = verbose_results
+    Arguments are the same as for ``hubble.audit``, except that ``configs``
+    is required. Profiling is not supported.
+    '''
+    if __salt__['config.get']('hubblestack:nova:autoload', True):
+        load()
+    if not __nova__:
+        yield 'Errors', {'nova': {'error': 'No nova modules/data have been loaded.'}}
+        return
+
+    if verbose is None:
+        verbose = __salt__['config.get']('hubblestack:nova:verbose', False)
+    if show_success is None:
+        show_success = __salt__['config.get']('hubblestack:nova:show_success', True)
+    if show_compliance is None:
+        show_compliance = __salt__['config.get']('hubblestack:nova:show_compliance', True)
+    if debug is None:
+        debug = __salt__['config.get']('hubblestack:nova:debug', False)
+
+    configs = _config_paths(configs)
+    nova_kwargs = _nova_kwargs(kwargs)
+
+    data_list, errors = _select_profiles(configs, debug)
+    for error in errors:
+        yield 'Errors', error
+    processed_controls = _get_controls(data_list, debug)
+
+    routes = __nova__.route(data_list)
+    _start_audit(routes)
+    # Only the terse keys are kept between modules, for de-duplication
+    seen = {'Failure': set(), 'Success': set(), 'Controlled': set()}
+    try:
+        for key, ret, error in _iter_modules(routes, tags, nova_kwargs):
+            if error is not None:
+                yield 'Errors', {key: error}
+                continue
+            for error in ret.pop('Errors', []):
+                yield 'Errors', error
+            failures = []
+            controlled = ret.pop('Controlled', [])
+            for failure in ret.pop('Failure', []):
+                if failure['tag'] in processed_controls:
+                    failure['control'] = processed_controls[failure['tag']].get('reason')
+                    controlled.append(failure)
+                else:
+                    failures.append(failure)
+            for result_key, val in (('Failure', failures),
+                                    ('Success', ret.pop('Success', [])),
+                                    ('Controlled', controlled)):
+                for tag_data in val:
+                    terse_key, terse_value = _terse_result(result_key, tag_data)
+                    is_new = terse_key not in seen[result_key]
+                    seen[result_key].add(terse_key)
+                    if result_key == 'Success' and not show_success:
+                        continue
+                    if verbose:
+                        yield result_key, {tag_data['tag']: tag_data}
+                    elif is_new:
+                        yield result_key, {tag_data['tag']: terse_value}
+    finally:
+        _finish_audit()
+
+    if show_compliance:
+        compliance = _calculate_compliance(seen)
+        if compliance:
+            yield 'Compliance', compliance
+
+
+def _config_paths(configs):
+    '''
+    Convert a comma-separated string or list of configs (e.g. ``cis.centos``)
+    to profile paths, with leading slashes (``/cis/centos``)
+    '''
+    if not isinstance(configs, list):
+        # Convert string
+        configs = configs.split(',')
+
+    return [os.path.join(os.path.sep, os.path.join(*(con.split('.yaml')[0]).split('.')))
+            for con in configs]
+
+
+def _nova_kwargs(kwargs):
+    '''
+    Merge the module parameters from ``hubblestack:nova:nova_kwargs`` with
+    the ones passed on the CLI, to be passed through to the nova modules
+    '''
+    nova_kwargs = {}
+    # Get values from config first (if any) and merge into nova_kwargs
+    nova_kwargs_config =  __salt__['config.get']('hubblestack:nova:nova_kwargs', False)
+    if nova_kwargs_config is not False:
+        nova_kwargs.update(nova_kwargs_config)
+    # Now process arguments from CLI and merge into nova_kwargs_dict
+    if kwargs is not None:
+        nova_kwargs.update(kwargs)
+
+    log.debug('nova_kwargs: ' + str(nova_kwargs))
+    return nova_kwargs
+
+
+def _terse_result(key, tag_data):
+    '''
+    Return the ``(terse_key, terse_value)`` for a result under ``key``: the
+    description (or control reason, for controlled results) is shown, and
+    results with the same terse key are only shown once
+    '''
+    tag = tag_data['tag']
+    description = tag_data.get('description')
+    if key == 'Controlled':
+        control_reason = tag_data.get('control', '')
+        return (tag, description, control_reason), control_reason
+    return (tag, description), description
+
+
+def _run_audit(configs, tags, debug, profile=False, **kwargs):
+
+    results = {}
+
+    data_list, errors = _select_profiles(configs, debug)
+    if errors:
+        results['Errors'] = errors
+
+    # Run the audits
+    # Each module only receives the profiles containing the top-level keys it
+    # declared in __nova_keys__; modules with nothing to do are skipped.
+    routes = __nova__.route(data_list)
+    _start_audit(routes)
+    if profile:
+        module_rets, results['Timing'] = _run_modules_profiled(routes, tags, kwargs)
     else:
-        results = terse_results
+        module_rets = _run_modules(routes, tags, kwargs)
+    _finish_audit()
 
-    if compliance:
-        results['Compliance'] = compliance
+    for key, ret, error in module_rets:
+        if error is not None:
+            if 'Errors' not in results:
+                results['Errors'] = []
+            results['Errors'].append({key: error})
+            continue
 
-    if not called_from_top and not results:
-        results['Messages'] = 'No audits matched this host in the specified profiles.'
+        # Merge in the results
+        for key, val in ret.iteritems():
+            if key not in results:
+                results[key] = []
+            results[key].extend(val)
 
-    for error in ret.get('Errors', []):
-      if not results.has_key('Errors'):
-        results['Errors'] = []
-      results['Errors'].append(error)
+    processed_controls = _get_controls(data_list, debug)
+
+    # Split the failed results into those which match our control config
+    # (looked up by tag) and those which don't, in a single pass
+    if processed_controls and results.get('Failure'):
+        failures = []
+        controlled = results.setdefault('Controlled', [])
+        for failure in results['Failure']:
+            failure_tag = failure['tag']
+            if failure_tag in processed_controls:
+                failure.update({
+                    'control': processed_controls[failure_tag].get('reason')
+                })
+                controlled.append(failure)
+            else:
+                failures.append(failure)
+        results['Failure'] = failures
+
+    for key in results.keys():
+        if not results[key]:
+            results.pop(key)
 
     return results
 
-def _run_audit(configs, tags, debug, **kwargs):
 
-    results = {}
+def _select_profiles(configs, debug=False):
+    '''
+    Return the list of ``(profile name, profile data)`` tuples for the loaded
+    profiles under ``configs``, and a list of errors for configs which
+    didn't match any profile
+    '''
+    errors = []
 
     # Compile a list of audit data sets which we need to run
     to_run = set()
@@ -263,10 +486,8 @@ def _run_audit(configs, tags, debug, **kwargs):
                 to_run.add(key)
         if not found_for_config:
             # No matches were found for this entry, add an error
-            if 'Errors' not in results:
-                results['Errors'] = []
-            results['Errors'].append({config: {'error': 'No matching profiles found for {0}'
-                                                        .format(config)}})
+            errors.append({config: {'error': 'No matching profiles found for {0}'
+                                             .format(config)}})
 
     # compile list of tuples with profile name and profile data
     data_list = [(key.split('.yaml')[0].split(os.path.sep)[-1],
@@ -276,36 +497,14 @@ def _run_audit(configs, tags, debug, **kwargs):
         log.debug(configs)
         log.debug('hubble.py data_list:')
         log.debug(data_list)
-    # Run the audits
-    # This is currently pretty brute-force -- we just run all the modules we
-    # have available with the data list, so data will be processed multiple
-    # times. However, for the scale we're working at this should be fine.
-    # We can revisit if this ever becomes a big bottleneck
-    for key, func in __nova__._dict.iteritems():
-        try:
-            ret = func(data_list, tags, **kwargs)
-        except Exception as exc:
-            log.error('Exception occurred in nova module:')
-            log.error(traceback.format_exc())
-            if 'Errors' not in results:
-                results['Errors'] = []
-            results['Errors'].append({key: {'error': 'exception occurred',
-                                            'data': traceback.format_exc().splitlines()[-1]}})
-            continue
-        else:
-            if not isinstance(ret, dict):
-                if 'Errors' not in results:
-                    results['Errors'] = []
-                results['Errors'].append({key: {'error': 'bad return type',
-                                                'data': ret}})
-                continue
+    return data_list, errors
 
-        # Merge in the results
-        for key, val in ret.iteritems():
-            if key not in results:
-                results[key] = []
-            results[key].extend(val)
 
+def _get_controls(data_list, debug=False):
+    '''
+    Collect the compensating controls from the profiles in ``data_list``, as
+    a mapping of tag -> control data
+    '''
     processed_controls = {}
     # Inspect the data for compensating control data
     for _, audit_data in data_list:
@@ -323,30 +522,1098 @@ def _run_audit(configs, tags, debug, **kwargs):
     if debug:
         log.debug('hubble.py control data:')
         log.debug(processed_controls)
+    return processed_controls
 
-    # Look through the failed results to find audits which match our control config
-    failures_to_remove = []
-    for i, failure in enumerate(results.get('Failure', [])):
-        failure_tag = failure['tag']
-        if failure_tag in processed_controls:
-            failures_to_remove.append(i)
-            if 'Controlled' not in results:
-                results['Controlled'] = []
-            failure.update({
-                'control': processed_controls[failure_tag].get('reason')
-            })
-            results['Controlled'].append(failure)
-
-    # Remove controlled failures from results['Failure']
-    if failures_to_remove:
-        for failure_index in reversed(sorted(set(failures_to_remove))):
-            results['Failure'].pop(failure_index)
 
-    for key in results.keys():
-        if not results[key]:
-            results.pop(key)
+def _run_top(data_by_tag, debug, profile=False, **kwargs):
+    '''
+    Run the audits for all the tag glob -> configs entries from a topfile in
+    a single pass. The profiles of all the entries are routed together, so
+    each nova module runs once, with the tag globs of all the entries it was
+    routed for. Its results are then split back out to the entries by
+    profile (``nova_profile``, where the module reports it) and tag glob.
+    Results which match none of the globs of their entries are dropped, as
+    they would never have been returned for those entries alone, except from
+    modules which don't filter by tags; those go to every entry the module
+    ran for.
+
+    Returns a list with a ``_run_audit``-style result dict for each entry,
+    and a dict of the ``Errors`` and ``Timing`` for the whole run.
+    '''
+    entries, routes, module_entries, module_tags, errors = _plan_top(data_by_tag, debug)
+    results = {}
+    if errors:
+        results['Errors'] = errors
 
-    return results
+    _start_audit(routes)
+    if profile:
+        module_rets, results['Timing'] = _run_modules_profiled(routes, module_tags, kwargs)
+    else:
+        module_rets = _run_modules(routes, module_tags, kwargs)
+    _finish_audit()
+
+    for key, ret, error in module_rets:
+        if error is not None:
+            results.setdefault('Errors', []).append({key: error})
+            continue
+
+        filters_tags = __nova__.filters_tags(key)
+        for result_key, val in ret.iteritems():
+            if result_key not in ('Success', 'Failure', 'Controlled'):
+                results.setdefault(result_key, []).extend(val)
+                continue
+            for tag_data in val:
+                candidates = [entry for entry in module_entries[key]
+                              if tag_data.get('nova_profile') in entry['profiles']]
+                candidates = candidates or module_entries[key]
+                matched = [entry for entry in candidates
+                           if __nova__.matcher.tag(tag_data['tag'], entry['tags'])]
+                if not matched and not filters_tags:
+                    matched = candidates
+                for entry in matched:
+                    entry['ret'].setdefault(result_key, []).append(tag_data)
+
+    # Apply each entry's compensating controls to its own failures
+    for entry in entries:
+        ret = entry['ret']
+        if not entry['controls'] or not ret.get('Failure'):
+            continue
+        failures = []
+        controlled = ret.setdefault('Controlled', [])
+        for failure in ret['Failure']:
+            failure_tag = failure['tag']
+            if failure_tag in entry['controls']:
+                # Results can be shared between entries with different controls
+                failure = dict(failure)
+                failure['control'] = entry['controls'][failure_tag].get('reason')
+                controlled.append(failure)
+            else:
+                failures.append(failure)
+        ret['Failure'] = failures
+
+    return [entry['ret'] for entry in entries], results
+
+
+def _plan_top(data_by_tag, debug=False):
+    '''
+    Work out how to run all the tag glob -> configs entries in
+    ``data_by_tag`` in a single pass.
+
+    Returns a list of the entries (dicts of the entry's tag glob, profiles
+    and controls), the module routes for all the entries' profiles, the
+    entries each module runs for, the tags each module runs with, and a list
+    of errors for configs which didn't match any profile.
+    '''
+    errors = []
+    entries = []
+    data_list = []
+    data_ids = set()
+    for tags, configs in data_by_tag.iteritems():
+        entry_data, entry_errors = _select_profiles(_config_paths(configs), debug)
+        errors.extend(entry_errors)
+        for profile_data in entry_data:
+            if id(profile_data[1]) not in data_ids:
+                data_ids.add(id(profile_data[1]))
+                data_list.append(profile_data)
+        entries.append({'tags': tags,
+                        'data_ids': set(id(data) for _, data in entry_data),
+                        'profiles': set(name for name, _ in entry_data),
+                        'controls': _get_controls(entry_data, debug),
+                        'ret': {}})
+
+    # Plan which entries (and so which tag globs) each module runs for
+    routes = __nova__.route(data_list)
+    module_entries = {}
+    module_tags = {}
+    for key, _, module_data in routes:
+        module_ids = set(id(data) for _, data in module_data)
+        module_entries[key] = [entry for entry in entries
+                               if entry['data_ids'] & module_ids]
+        globs = sorted(set(entry['tags'] for entry in module_entries[key]))
+        if '*' in globs:
+            module_tags[key] = '*'
+        elif len(globs) == 1:
+            module_tags[key] = globs[0]
+        else:
+            module_tags[key] = tuple(globs)
+    if debug:
+        log.debug('hubble.py top plan:')
+        log.debug(module_tags)
+    return entries, routes, module_entries, module_tags, errors
+
+
+def _run_modules(routes, tags, nova_kwargs, timings=None):
+    '''
+    Run the nova modules in ``routes`` and return the list of results from
+    ``_iter_modules``
+    '''
+    return list(_iter_modules(routes, tags, nova_kwargs, timings))
+
+
+def _run_modules_profiled(routes, tags, nova_kwargs):
+    '''
+    Run the nova modules in ``routes`` while recording their timing, and
+    return the list of results from ``_iter_modules`` and the timing data.
+    The timings are also added to the history used by ``hubble.plan``.
+    '''
+    timings = {}
+    module_rets = _run_modules(routes, tags, nova_kwargs, timings=timings)
+    timings = dict(timings)
+    _record_timings(timings)
+    return module_rets, timings
+
+
+def _iter_modules(routes, tags, nova_kwargs, timings=None):
+    '''
+    Run the nova modules in ``routes`` (as returned by
+    ``NovaLazyLoader.route``) and yield a ``(key, ret, error)`` tuple for
+    each, in the same order as ``routes``. Exactly one of ``ret`` and
+    ``error`` will be None. If a ``timings`` dict is passed, the timing data
+    for each module which finishes is stored in it, keyed by module.
+    ``tags`` may also be a dict of module -> tags, to run each module with
+    its own tags.
+
+    By default the modules are run one after the other. If
+    ``hubblestack:nova:workers`` is set higher than 1, up to that many
+    modules are run at once on a thread pool, and any module which runs
+    longer than ``hubblestack:nova:module_timeout`` seconds is reported as
+    an error instead of holding up the rest of the audit. The module itself
+    can't be stopped, and keeps running in the background until it
+    finishes; it keeps the ``__facts__`` of its own audit, and its result
+    and timing are thrown away.
+    '''
+    if isinstance(tags, dict):
+        module_tags = tags
+    else:
+        module_tags = dict((key, tags) for key, _, _ in routes)
+
+    workers = int(__salt__['config.get']('hubblestack:nova:workers', 1) or 1)
+    if workers <= 1 or len(routes) <= 1:
+        for key, func, module_data in routes:
+            yield (key,) + _run_module(key, func, module_data, module_tags[key],
+                                       nova_kwargs, timings)
+        return
+
+    timeout = __salt__['config.get']('hubblestack:nova:module_timeout', None)
+    started = {}
+
+    def _timed_run_module(key, func, module_data):
+        started[key] = time.time()
+        _FACTS.bind()
+        try:
+            return _run_module(key, func, module_data, module_tags[key], nova_kwargs, timings)
+        finally:
+            _FACTS.unbind()
+
+    pool = ThreadPool(min(workers, len(routes)))
+    timed_out = False
+    try:
+        pending = [(key, pool.apply_async(_timed_run_module, (key, func, module_data)))
+                   for key, func, module_data in routes]
+        for key, async_ret in pending:
+            # A module's timeout only starts counting once a worker picks it
+            # up, so modules queued behind slow ones aren't penalized
+            while not async_ret.ready():
+                if timeout and key in started and time.time() - started[key] > timeout:
+                    break
+                async_ret.wait(0.1)
+            if async_ret.ready():
+                yield (key,) + async_ret.get()
+            else:
+                log.error('Nova module {0} timed out after {1} seconds'
+                          .format(key, timeout))
+                timed_out = True
+                yield key, None, {'error': 'timed out',
+                                  'data': 'module did not finish within {0} seconds'
+                                          .format(timeout)}
+    finally:
+        if timed_out:
+            # Threads can't be killed; leave the stragglers to finish on
+            # their own rather than blocking on them
+            pool.terminate()
+        else:
+            pool.close()
+            pool.join()
+
+
+def _run_module(key, func, module_data, tags, nova_kwargs, timings=None):
+    '''
+    Run a single nova module's audit function, returning a ``(ret, error)``
+    tuple
+    '''
+    # Serve the whole module from the result cache, if configured
+    cache_key = None
+    ttl = _RESULT_CACHE.module_ttl(_module_name(key))
+    if ttl:
+        cache_key = _RESULT_CACHE.key(key, tags, module_data, nova_kwargs)
+        cached = _RESULT_CACHE.get(cache_key, ttl)
+        if cached is not None:
+            ret, cache_age = cached
+            for val in ret.itervalues():
+                for tag_data in val:
+                    if isinstance(tag_data, dict):
+                        tag_data['cache_age'] = cache_age
+            return ret, None
+
+    if timings is not None:
+        _TIMING_LOCAL.timer = _ModuleTimer()
+    try:
+        ret = func(module_data, tags, **nova_kwargs)
+    except Exception as exc:
+        log.error('Exception occurred in nova module:')
+        log.error(traceback.format_exc())
+        return None, {'error': 'exception occurred',
+                      'data': traceback.format_exc().splitlines()[-1]}
+    finally:
+        if timings is not None:
+            timings[key] = _TIMING_LOCAL.timer.stop()
+            _TIMING_LOCAL.timer = None
+    if not isinstance(ret, dict):
+        return None, {'error': 'bad return type',
+                      'data': ret}
+    if cache_key is not None:
+        _RESULT_CACHE.put(cache_key, ret)
+    return ret, None
+
+
+def _start_audit(routes):
+    '''
+    Set up the per-audit state before running the modules in ``routes``
+    '''
+    _FACTS.clear()
+    _RESULT_CACHE.start([_module_name(key) for key, _, _ in routes])
+
+
+def _finish_audit():
+    '''
+    Save or throw away the per-audit state once the modules have finished
+    '''
+    _RESULT_CACHE.save()
+    _FACTS.clear()
+
+
+def _module_name(key):
+    '''
+    Convert a nova module key (e.g. ``/misc.py``) to its name (``misc``)
+    '''
+    return os.path.splitext(key)[0].lstrip(os.path.sep)
+
+
+class _ResultCache(object):
+    '''
+    Cache of the results of expensive nova checks, stored in the minion
+    cachedir, and configured via ``hubblestack:nova:result_cache`` as a
+    mapping of module name or tag glob -> ttl (in seconds).
+
+    Modules named in the config have their whole result cached by
+    ``_run_module``. Tag globs apply to individual checks in modules which
+    cache their checks through ``__resultcache__.fetch()``. Results served
+    from the cache have their age (in seconds) in ``cache_age``.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.entries = None
+        self.dirty = False
+        self.module_ttls = {}
+        self.tag_ttls = []
+
+    def start(self, modules):
+        '''
+        Read the config at the start of an audit. ``modules`` is the list of
+        names of the modules which will run.
+        '''
+        config = __salt__['config.get']('hubblestack:nova:result_cache', {}) or {}
+        self.module_ttls = {}
+        self.tag_ttls = []
+        for name, ttl in config.iteritems():
+            if name in modules:
+                self.module_ttls[name] = float(ttl)
+            else:
+                self.tag_ttls.append((name, float(ttl)))
+        path = os.path.join(__opts__.get('cachedir'), 'hubble', 'nova_results')
+        if path != self.path:
+            self.path = path
+            self.entries = None
+
+    def module_ttl(self, name):
+        return self.module_ttls.get(name)
+
+    def tag_ttl(self, tag):
+        for tag_glob, ttl in self.tag_ttls:
+            if fnmatch.fnmatch(tag, tag_glob):
+                return ttl
+        return None
+
+    def fetch(self, module, tag, check, func):
+        '''
+        Return ``(result, cache_age)`` for a single check, identified by the
+        ``module``, ``tag`` and ``check`` data. The cached result is used if
+        it's younger than the ttl for ``tag``, otherwise ``func`` is called
+        to run the check, and ``cache_age`` is None.
+        '''
+        ttl = self.tag_ttl(tag)
+        if not ttl:
+            return func(), None
+        cache_key = self.key(module, tag, check)
+        cached = self.get(cache_key, ttl)
+        if cached is not None:
+            return cached
+        result = func()
+        self.put(cache_key, result)
+        return result, None
+
+    def key(self, *args):
+        return hashlib.sha1(json.dumps(args, sort_keys=True, default=str)).hexdigest()
+
+    def get(self, cache_key, ttl):
+        '''
+        Return ``(result, cache_age)`` for ``cache_key``, or None if it isn't
+        cached or is older than ``ttl``
+        '''
+        with self.lock:
+            self._load()
+            entry = self.entries.get(cache_key)
+        if entry is None:
+            return None
+        age = time.time() - entry['time']
+        if not 0 <= age < ttl:
+            return None
+        return copy.deepcopy(entry['result']), int(age)
+
+    def put(self, cache_key, result):
+        with self.lock:
+            self._load()
+            self.entries[cache_key] = {'time': time.time(),
+                                       'result': copy.deepcopy(result)}
+            self.dirty = True
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        try:
+            with open(self.path, 'rb') as fh_:
+                self.entries = pickle.load(fh_)
+        except Exception:
+            self.entries = {}
+
+    def save(self):
+        '''
+        Write any new results to disk, dropping those which are older than
+        the longest ttl
+        '''
+        with self.lock:
+            if not self.dirty:
+                return
+            ttls = self.module_ttls.values() + [ttl for _, ttl in self.tag_ttls]
+            max_ttl = max(ttls) if ttls else 0
+            now = time.time()
+            for cache_key, entry in self.entries.items():
+                if not 0 <= now - entry['time'] < max_ttl:
+                    self.entries.pop(cache_key)
+            try:
+                _write_cache(self.path, self.entries)
+            except (IOError, OSError) as exc:
+                log.error('Unable to save nova result cache: {0}'.format(exc))
+            self.dirty = False
+
+
+_RESULT_CACHE = _ResultCache()
+
+
+class _FactCache(object):
+    '''
+    Host facts which several nova modules need, injected into every module
+    as ``__facts__``. Each fact is gathered (in bulk, where salt can) the first
+    time a module asks for it during an audit, and then shared by every
+    module until the audit finishes, so it's gathered at most once per audit.
+    '''
+    def __init__(self):
+        # (lock, facts) for the current audit. clear() replaces it rather
+        # than emptying it, so threads bound to an earlier audit keep theirs
+        self.audit = (threading.RLock(), {})
+        self.local = threading.local()
+
+    def clear(self):
+        self.audit = (threading.RLock(), {})
+
+    def bind(self):
+        '''
+        Make the current thread use the facts of the current audit until
+        ``unbind`` is called, even if the audit is cleared in the meantime,
+        so a module which outlives its audit (after timing out) doesn't see
+        or fill in the facts of the next one
+        '''
+        self.local.audit = self.audit
+
+    def unbind(self):
+        self.local.audit = None
+
+    def get(self, name, func):
+        '''
+        Return the fact ``name``, calling ``func`` to gather it if it hasn't
+        been gathered yet during this audit
+        '''
+        lock, facts = getattr(self.local, 'audit', None) or self.audit
+        with lock:
+            if name not in facts:
+                facts[name] = func()
+            return facts[name]
+
+    def packages(self, versions_as_list=True):
+        '''
+        The installed packages, as returned by ``pkg.list_pkgs``. Must not be
+        modified.
+        '''
+        pkgs = self.get('packages',
+                        lambda: __salt__['pkg.list_pkgs'](versions_as_list=True))
+        if versions_as_list:
+            return pkgs
+        return self.get('packages_flat',
+                        lambda: dict((name, ','.join(versions))
+                                     for name, versions in pkgs.iteritems()))
+
+    def package_version(self, name):
+        '''
+        The installed version(s) of package ``name``, comma-separated, or an
+        empty string if it's not installed, like ``pkg.version``. As with
+        ``pkg.version``, ``name`` may be a glob, in which case the versions of
+        every matching package are given.
+        '''
+        pkgs = self.packages()
+        if not any(char in name for char in '*?['):
+            return ','.join(pkgs.get(name, []))
+        return self.get(('package_glob', name),
+                        lambda: ','.join(version
+                                         for match in sorted(fnmatch.filter(pkgs, name))
+                                         for version in pkgs[match]))
+
+    def service_running(self, name):
+        '''
+        Whether the service ``name`` is running, like ``service.status``
+        '''
+        if 'service.get_running' in __salt__:
+            running = self.get('running_services',
+                               lambda: set(__salt__['service.get_running']()))
+            if _service_name(name) in running:
+                return True
+        # service.status also takes aliases, other unit types and globs, so
+        # a name which isn't listed may still be running
+        return self.get(('service.status', name),
+                        lambda: __salt__['service.status'](name))
+
+    def service_enabled(self, name):
+        '''
+        Whether the service ``name`` is enabled, like ``service.enabled``
+        '''
+        if 'service.get_enabled' in __salt__:
+            enabled = self.get('enabled_services',
+                               lambda: set(__salt__['service.get_enabled']()))
+            if _service_name(name) in enabled:
+                return True
+        # As for service_running, a name which isn't listed may be enabled
+        return self.get(('service.enabled', name),
+                        lambda: __salt__['service.enabled'](name))
+
+    def sysctl(self, name):
+        '''
+        The value of the kernel parameter ``name``, like ``sysctl.get``
+        '''
+        if 'sysctl.show' in __salt__:
+            table = self.get('sysctl', lambda: __salt__['sysctl.show']())
+        else:
+            table = {}
+        if name in table:
+            return table[name]
+        # Not every parameter is listed (or readable) in bulk
+        return self.get(('sysctl.get', name), lambda: __salt__['sysctl.get'](name))
+
+    def mounts(self):
+        '''
+        The active mounts, as returned by ``mount.active``. Must not be
+        modified.
+        '''
+        return self.get('mounts', lambda: __salt__['mount.active']())
+
+    def passwd(self):
+        '''
+        The entries in /etc/passwd, as lists of fields
+        '''
+        return self.get('/etc/passwd', lambda: _read_colon_file('/etc/passwd'))
+
+    def group(self):
+        '''
+        The entries in /etc/group, as lists of fields
+        '''
+        return self.get('/etc/group', lambda: _read_colon_file('/etc/group'))
+
+    def shadow(self):
+        '''
+        The entries in /etc/shadow, as lists of fields
+        '''
+        return self.get('/etc/shadow', lambda: _read_colon_file('/etc/shadow'))
+
+    def files(self, root, xdev=True):
+        '''
+        Generate the files under ``root`` (including ``root`` itself), as
+        ``(path, stat)`` tuples in the order ``find <root>`` lists them. The
+        stats have the ``st_ino``, ``st_mode``, ``st_uid``, ``st_gid``,
+        ``st_mtime`` and ``st_dev`` of each file (not following symlinks).
+        With ``xdev``, other filesystems aren't descended into, like
+        ``find -xdev``.
+
+        Unlike other facts, the files aren't kept for the rest of the audit,
+        as there may be very many; they're found as they're iterated over.
+        If ``hubblestack:nova:file_index_max_age`` is set, they come from the
+        file index in the cachedir, which is refreshed incrementally (see
+        ``_FileIndex``).
+        '''
+        return _FILE_INDEX.walk(root, xdev)
+
+    def sockets(self):
+        '''
+        The TCP and UDP sockets, in the same format (and order) as
+        ``network.netstat``. On Linux they're read from /proc rather than by
+        running netstat. Must not be modified.
+        '''
+        if not os.path.isfile('/proc/net/tcp'):
+            return self.get('sockets', lambda: __salt__['network.netstat']())
+        return self.get('sockets', _read_sockets)
+
+
+# TCP states in /proc/net/tcp, as netstat names them
+_TCP_STATES = {0x01: 'ESTABLISHED',
+               0x02: 'SYN_SENT',
+               0x03: 'SYN_RECV',
+               0x04: 'FIN_WAIT1',
+               0x05: 'FIN_WAIT2',
+               0x06: 'TIME_WAIT',
+               0x07: 'CLOSE',
+               0x08: 'CLOSE_WAIT',
+               0x09: 'LAST_ACK',
+               0x0A: 'LISTEN',
+               0x0B: 'CLOSING'}
+
+
+def _read_sockets():
+    '''
+    Read the TCP and UDP sockets from /proc/net, formatted like the output of
+    ``network.netstat`` (``netstat -tulpnea``) on Linux
+    '''
+    ret = []
+    programs = None
+    for proto in ('tcp', 'tcp6', 'udp', 'udp6'):
+        try:
+            with _counting_open(os.path.join('/proc/net', proto)) as fh_:
+                lines = fh_.readlines()[1:]
+        except (IOError, OSError):
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10:
+                continue
+            send_q, _, recv_q = fields[4].partition(':')
+            inode = fields[9]
+            if programs is None and inode != '0':
+                programs = _socket_programs()
+            sock = {'proto': proto,
+                    'recv-q': str(int(recv_q, 16)),
+                    'send-q': str(int(send_q, 16)),
+                    'local-address': _socket_address(fields[1]),
+                    'remote-address': _socket_address(fields[2]),
+                    'user': fields[7],
+                    'inode': inode,
+                    'program': (programs or {}).get(inode, '-')}
+            if proto.startswith('tcp'):
+                sock['state'] = _TCP_STATES.get(int(fields[3], 16), 'UNKNOWN')
+            ret.append(sock)
+    return ret
+
+
+def _socket_address(address):
+    '''
+    Format an address from /proc/net (``<hex address>:<hex port>``) the way
+    netstat does, e.g. ``0.0.0.0:22``, ``:::22`` or ``127.0.0.1:*``
+    '''
+    host, _, port = address.partition(':')
+    # The kernel prints each 32 bit word of the address in host byte order
+    if len(host) == 8:
+        host = socket.inet_ntoa(struct.pack('=I', int(host, 16)))
+    else:
+        host = socket.inet_ntop(socket.AF_INET6, struct.pack(
+            '=4I', *[int(host[i:i + 8], 16) for i in range(0, 32, 8)]))
+    port = int(port, 16)
+    return '{0}:{1}'.format(host, port or '*')
+
+
+def _socket_programs():
+    '''
+    Map socket inodes to the ``<pid>/<program>`` which has them open, as
+    netstat -p shows it
+    '''
+    ret = {}
+    try:
+        pids = sorted(int(pid) for pid in os.listdir('/proc') if pid.isdigit())
+    except OSError:
+        return ret
+    for pid in pids:
+        fd_dir = '/proc/{0}/fd'.format(pid)
+        try:
+            fds = os.listdir(fd_dir)
+            with _counting_open('/proc/{0}/cmdline'.format(pid)) as fh_:
+                cmdline = fh_.read()
+        except (IOError, OSError):
+            continue
+        if not cmdline:
+            continue
+        # netstat shows the basename of argv[0], truncated to fit its column
+        program = '{0}/{1}'.format(pid, cmdline.split('\0')[0].rsplit('/', 1)[-1])[:19]
+        program = (program.split() or ['-'])[0]
+        for fd_ in fds:
+            try:
+                link = os.readlink(os.path.join(fd_dir, fd_))
+            except OSError:
+                continue
+            if link.startswith('socket:['):
+                ret.setdefault(link[8:-1], program)
+    return ret
+
+
+def _service_name(name):
+    '''
+    Strip the ``.service`` suffix from a systemd unit name, as
+    ``service.get_running`` and ``service.get_enabled`` do
+    '''
+    if name.endswith('.service'):
+        return name[:-len('.service')]
+    return name
+
+
+def _read_colon_file(path):
+    '''
+    Read a colon-separated file like /etc/passwd into a list of lists of
+    fields, skipping blank lines. Returns an empty list if the file can't be
+    read.
+    '''
+    try:
+        with _counting_open(path) as fh_:
+            return [line.rstrip('\n').split(':') for line in fh_ if line.strip()]
+    except (IOError, OSError) as exc:
+        log.error('Unable to read {0}: {1}'.format(path, exc))
+        return []
+
+
+_FACTS = _FactCache()
+
+
+_FileStat = collections.namedtuple('_FileStat',
+                                   ('st_ino', 'st_mode', 'st_uid', 'st_gid', 'st_mtime', 'st_dev'))
+
+
+class _FileIndex(object):
+    '''
+    Index of the files under the roots walked by nova modules, stored in the
+    minion cachedir (one file per root), so that walks don't have to list
+    every directory on every audit.
+
+    Each indexed directory holds its mtime and the names and stats of its
+    entries. A directory whose mtime hasn't changed since it was indexed has
+    had no entries added, removed or renamed, so its listing is reused. A
+    file's mode or owner can change without changing its directory, so every
+    entry is still stat-ed again on every walk. The whole tree is walked
+    from scratch once the index is older than
+    ``hubblestack:nova:file_index_max_age`` seconds. Loading and saving the
+    index of a large tree can cost more than listing it while it's in the
+    page cache, so the index is only used if that is set (it defaults to 0).
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def path(self, root, xdev):
+        key = hashlib.sha1(json.dumps([root, xdev])).hexdigest()
+        return os.path.join(__opts__.get('cachedir'), 'hubble', 'nova_files', key)
+
+    def load(self, path, max_age, now):
+        '''
+        Return the index stored at ``path``, or an empty dict if there's no
+        index whose last full walk is younger than ``max_age``
+        '''
+        if not max_age:
+            return {}
+        try:
+            with self.lock:
+                with open(path, 'rb') as fh_:
+                    index = pickle.load(fh_)
+        except Exception:
+            return {}
+        if now - index.get('walked', 0) > max_age:
+            return {}
+        return index
+
+    def walk(self, root, xdev=True):
+        '''
+        Generate the files under ``root``, for ``__facts__.files``. If the
+        index is enabled, the index for ``root`` is updated as they're found,
+        and saved once they've all been generated.
+        '''
+        if isinstance(root, six.text_type):
+            root = root.encode('utf-8')
+        max_age = float(__salt__['config.get']('hubblestack:nova:file_index_max_age', 0) or 0)
+        if not max_age:
+            return _walk_files(root, xdev)
+        return self._walk_indexed(root, xdev, max_age)
+
+    def _walk_indexed(self, root, xdev, max_age):
+        '''
+        Generate the files under ``root`` from (and into) the index
+        '''
+        now = time.time()
+        path = self.path(root, xdev)
+        index = self.load(path, max_age, now)
+        old_dirs = index.get('dirs', {})
+        walked = index.get('walked', now)
+
+        dirs = {}
+        try:
+            root_stat = _file_stat(os.lstat(root))
+        except OSError:
+            return
+        yield root, root_stat
+        changed = not index
+        if stat.S_ISDIR(root_stat.st_mode):
+            # Depth first, listing each directory before descending into it
+            entries, dir_changed = self._entries(root, root_stat, old_dirs, dirs, now)
+            changed = changed or dir_changed
+            stack = [(root.rstrip('/') + '/', iter(entries))]
+            while stack:
+                prefix, entries = stack[-1]
+                for name, entry_stat in entries:
+                    entry_path = prefix + name
+                    entry_stat = tuple.__new__(_FileStat, entry_stat)
+                    yield entry_path, entry_stat
+                    if (entry_stat[1] & _S_IFMT == stat.S_IFDIR and
+                            (not xdev or entry_stat.st_dev == root_stat.st_dev)):
+                        entries, dir_changed = self._entries(entry_path, entry_stat,
+                                                             old_dirs, dirs, now)
+                        changed = changed or dir_changed
+                        stack.append((entry_path + '/', iter(entries)))
+                        break
+                else:
+                    stack.pop()
+        # Directories which were removed
+        changed = changed or len(dirs) != len(old_dirs)
+
+        if changed:
+            with self.lock:
+                try:
+                    _write_cache(path, {'root': root, 'xdev': xdev, 'walked': walked, 'dirs': dirs})
+                except (IOError, OSError) as exc:
+                    log.error('Unable to save nova file index for {0}: {1}'.format(root, exc))
+
+    def _entries(self, path, dir_stat, old_dirs, dirs, now):
+        '''
+        Return the names and stats of the entries in the directory ``path``,
+        reusing the entries from ``old_dirs`` if it hasn't changed, and
+        recording them in ``dirs``. Also returns whether the entries differ
+        from ``old_dirs``.
+        '''
+        old = old_dirs.get(path)
+        mtime = dir_stat.st_mtime
+        if now - mtime < _FILE_INDEX_RACY:
+            mtime = None
+        entries = []
+        changed = mtime is None
+        if old is not None and old[0] is not None and old[0] == dir_stat.st_mtime:
+            # Only the listing is reused; chmod and chown don't change the
+            # directory, so every entry is stat-ed again
+            prefix = path.rstrip('/') + '/'
+            for name, entry_stat in old[1]:
+                try:
+                    new_stat = tuple(_file_stat(os.lstat(prefix + name)))
+                except OSError:
+                    changed = True
+                    continue
+                if new_stat != entry_stat:
+                    changed = True
+                    entry_stat = new_stat
+                entries.append((name, entry_stat))
+        else:
+            changed = True
+            for name, entry_stat in _list_dir(path):
+                entries.append((name, tuple(_file_stat(entry_stat))))
+        dirs[path] = (mtime, entries)
+        return entries, changed
+
+
+def _walk_files(root, xdev=True):
+    '''
+    Generate the path and ``_FileStat`` of ``root`` and every file under it,
+    in the order ``find <root>`` lists them, without the file index. Only
+    the directories being descended into are held in memory.
+    '''
+    try:
+        root_stat = _file_stat(os.lstat(root))
+    except OSError:
+        return
+    yield root, root_stat
+    if not stat.S_ISDIR(root_stat.st_mode):
+        return
+    stack = [(root.rstrip('/') + '/', iter(_list_dir(root)))]
+    while stack:
+        prefix, entries = stack[-1]
+        for name, entry_stat in entries:
+            entry_path = prefix + name
+            entry_stat = _file_stat(entry_stat)
+            yield entry_path, entry_stat
+            if (stat.S_ISDIR(entry_stat.st_mode) and
+                    (not xdev or entry_stat.st_dev == root_stat.st_dev)):
+                stack.append((entry_path + '/', iter(_list_dir(entry_path))))
+                break
+        else:
+            stack.pop()
+
+
+def _list_dir(path):
+    '''
+    Return the name and lstat result of each entry in the directory ``path``,
+    skipping entries which vanish while it's being listed
+    '''
+    ret = []
+    try:
+        if _scandir is not None:
+            for entry in _scandir(path):
+                try:
+                    ret.append((entry.name, entry.stat(follow_symlinks=False)))
+                except OSError:
+                    continue
+            return ret
+        names = os.listdir(path)
+    except OSError:
+        return ret
+    for name in names:
+        try:
+            ret.append((name, os.lstat(os.path.join(path, name))))
+        except OSError:
+            continue
+    return ret
+
+
+def _file_stat(pstat):
+    '''
+    The fields of the ``os.lstat`` result ``pstat`` kept in the file index
+    '''
+    return _FileStat(pstat.st_ino, pstat.st_mode, pstat.st_uid, pstat.st_gid,
+                     pstat.st_mtime, pstat.st_dev)
+
+
+_FILE_INDEX = _FileIndex()
+
+
+def _clock():
+    '''
+    Return the current wall time and the CPU time used so far by this process
+    and its reaped children, as a tuple
+    '''
+    return time.time(), sum(os.times()[:4])
+
+
+class _ModuleTimer(object):
+    '''
+    Accumulates wall time, CPU time, subprocess counts and file read counts
+    for a single run of a nova module, broken down by the tags marked via
+    ``__timing__.tag()``.
+
+    CPU time is measured for the whole process, so it will include the time
+    used by other modules when running with ``hubblestack:nova:workers``.
+    Subprocesses are counted when a module calls a ``cmd.*`` function, and
+    file reads when a module (or ``__facts__``) opens a file with ``open``;
+    nothing outside the nova modules is patched to count them.
+    '''
+    def __init__(self):
+        self.start = _clock()
+        self.subprocesses = 0
+        self.file_reads = 0
+        self.tags = {}
+        self.current_tag = None
+        self.tag_start = None
+
+    def _tag_timing(self, tag):
+        if tag not in self.tags:
+            self.tags[tag] = {'wall': 0.0, 'cpu': 0.0, 'subprocesses': 0, 'file_reads': 0}
+        return self.tags[tag]
+
+    def _close_tag(self, now):
+        if self.current_tag is not None:
+            timing = self._tag_timing(self.current_tag)
+            timing['wall'] += now[0] - self.tag_start[0]
+            timing['cpu'] += now[1] - self.tag_start[1]
+        self.current_tag = None
+
+    def tag(self, tag):
+        '''
+        Attribute everything from now until the next call (or the end of the
+        module) to ``tag``
+        '''
+        now = _clock()
+        self._close_tag(now)
+        self.current_tag = tag
+        self.tag_start = now
+
+    def count_subprocess(self):
+        self.subprocesses += 1
+        if self.current_tag is not None:
+            self._tag_timing(self.current_tag)['subprocesses'] += 1
+
+    def count_file_read(self):
+        self.file_reads += 1
+        if self.current_tag is not None:
+            self._tag_timing(self.current_tag)['file_reads'] += 1
+
+    def stop(self):
+        '''
+        Stop the timer, returning the timing data
+        '''
+        now = _clock()
+        self._close_tag(now)
+        tags = {}
+        for tag, timing in self.tags.iteritems():
+            tags[tag] = {'wall': round(timing['wall'], 3),
+                         'cpu': round(timing['cpu'], 3),
+                         'subprocesses': timing['subprocesses'],
+                         'file_reads': timing['file_reads']}
+        return {'wall': round(now[0] - self.start[0], 3),
+                'cpu': round(now[1] - self.start[1], 3),
+                'subprocesses': self.subprocesses,
+                'file_reads': self.file_reads,
+                'tags': tags}
+
+
+class _TimingHook(object):
+    '''
+    Injected into every nova module as ``__timing__``. Modules call
+    ``__timing__.tag(tag)`` before running the checks for each tag; this does
+    nothing unless the audit is being profiled.
+    '''
+    def tag(self, tag):
+        timer = getattr(_TIMING_LOCAL, 'timer', None)
+        if timer is not None:
+            timer.tag(tag)
+
+
+class _TimedFunctions(collections.Mapping):
+    '''
+    Wraps ``__salt__`` for the nova modules, so that their ``cmd.*`` calls
+    are counted as subprocesses against the module timer of the current
+    thread. Subprocesses which other execution modules (e.g.
+    ``pkg.list_pkgs``) spawn internally aren't counted.
+    '''
+    def __init__(self, functions):
+        self.functions = functions
+
+    def __getitem__(self, key):
+        func = self.functions[key]
+        if not key.startswith('cmd.'):
+            return func
+
+        def _counted(*args, **kwargs):
+            timer = getattr(_TIMING_LOCAL, 'timer', None)
+            if timer is not None:
+                timer.count_subprocess()
+            return func(*args, **kwargs)
+        return _counted
+
+    def __contains__(self, key):
+        return key in self.functions
+
+    def __iter__(self):
+        return iter(self.functions)
+
+    def __len__(self):
+        return len(self.functions)
+
+
+def _timed_functions(functions):
+    '''
+    Return the ``_TimedFunctions`` wrapping ``functions``, reusing the last
+    one while ``__salt__`` stays the same, so the loader doesn't see a new
+    ``__salt__`` on every load
+    '''
+    global _TIMED_FUNCTIONS
+    if _TIMED_FUNCTIONS is None or _TIMED_FUNCTIONS.functions is not functions:
+        _TIMED_FUNCTIONS = _TimedFunctions(functions)
+    return _TIMED_FUNCTIONS
+
+
+def _counting_open(name, mode='r', *args, **kwargs):
+    '''
+    The builtin ``open``, counting files opened for reading against the
+    module timer of the current thread. Injected into the nova modules as
+    ``open``, and used by the ``__facts__`` helpers which read files.
+    '''
+    timer = getattr(_TIMING_LOCAL, 'timer', None)
+    if timer is not None and 'r' in mode:
+        timer.count_file_read()
+    return open(name, mode, *args, **kwargs)
+
+
+def _timing_history_path():
+    return os.path.join(__opts__.get('cachedir'), 'hubble', 'nova_timings')
+
+
+def _load_timing_history():
+    '''
+    Return the timing history recorded by profiled audits, as a mapping of
+    module -> averaged timing data, in the same form as ``Timing``
+    '''
+    try:
+        with open(_timing_history_path(), 'rb') as fh_:
+            return pickle.load(fh_)
+    except Exception:
+        return {}
+
+
+def _record_timings(timings):
+    '''
+    Fold the ``timings`` from a profiled audit into the timing history. The
+    history keeps a running average over (up to) the last
+    ``_TIMING_HISTORY_RUNS`` runs of each module and tag, along with each
+    module's ``untagged`` cost (its time outside of any tag).
+    '''
+    def _average(dest, src):
+        runs = min(dest.get('runs', 0) + 1, _TIMING_HISTORY_RUNS)
+        for field in _TIMING_FIELDS:
+            old = dest.get(field, 0)
+            dest[field] = round(old + (src.get(field, 0) - old) / float(runs), 3)
+        dest['runs'] = runs
+
+    history = _load_timing_history()
+    for module, timing in timings.iteritems():
+        module_history = history.setdefault(module, {'tags': {}, 'untagged': {}})
+        _average(module_history, timing)
+        untagged = dict((field, max(timing.get(field, 0) -
+                                    sum(tag_timing.get(field, 0)
+                                        for tag_timing in timing['tags'].itervalues()), 0))
+                        for field in _TIMING_FIELDS)
+        _average(module_history['untagged'], untagged)
+        for tag, tag_timing in timing['tags'].iteritems():
+            _average(module_history['tags'].setdefault(tag, {}), tag_timing)
+    try:
+        _write_cache(_timing_history_path(), history)
+    except (IOError, OSError) as exc:
+        log.error('Unable to save nova timing history: {0}'.format(exc))
+
+
+def _write_cache(path, data):
+    '''
+    Atomically write ``data`` to the pickle file at ``path``
+    '''
+    cache_dir = os.path.dirname(path)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    fd_, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    with os.fdopen(fd_, 'wb') as fh_:
+        pickle.dump(data, fh_, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
 
 
 def top(topfile='top.nova',
@@ -354,7 +1621,8 @@ def top(topfile='top.nova',
         show_success=None,
         show_compliance=None,
         show_profile=None,
-        debug=None):
+        debug=None,
+        profile=None):
     '''
     Compile and run all yaml data from the specified nova topfile.
 
@@ -385,6 +1653,9 @@ def top(topfile='top.nova',
     after the yaml file (turning it into a dictionary). See the last two lines
     in the yaml above for examples.
 
+    All the matching entries are audited in a single pass, so each nova
+    module runs once, and the results are split back out per entry.
+
 
     Arguments:
 
@@ -416,6 +1687,11 @@ def top(topfile='top.nova',
         False. Configurable via `hubblestack:nova:debug` in minion
         config/pillar.
 
+    profile
+        Whether to record the time spent in each nova module and tag. See
+        ``hubble.audit``. Defaults to False. Configurable via
+        `hubblestack:nova:profile` in minion config/pillar.
+
     CLI Examples:
 
     .. code-block:: bash
@@ -423,6 +1699,7 @@ def top(topfile='top.nova',
         salt '*' hubble.top
         salt '*' hubble.top foo/bar/top.nova
         salt '*' hubble.top foo/bar.nova verbose=True
+        salt '*' hubble.top profile=True
     '''
     if __salt__['config.get']('hubblestack:nova:autoload', True):
         load()
@@ -445,50 +1722,31 @@ def top(topfile='top.nova',
     results = {}
 
     # Get a list of yaml to run
-    top_data = _get_top_data(topfile)
-
-    # Will be a combination of strings and single-item dicts. The strings
-    # have no tag filters, so we'll treat them as tag filter '*'. If we sort
-    # all the data by tag filter we can batch where possible under the same
-    # tag.
-    data_by_tag = {}
-    for data in top_data:
-        if isinstance(data, str):
-            if '*' not in data_by_tag:
-                data_by_tag['*'] = []
-            data_by_tag['*'].append(data)
-        elif isinstance(data, dict):
-            for key, tag in data.iteritems():
-                if tag not in data_by_tag:
-                    data_by_tag[tag] = []
-                data_by_tag[tag].append(key)
-        else:
-            if 'Errors' not in results:
-                results['Errors'] = {}
-            error_log = 'topfile malformed, list entries must be strings or '\
-                        'dicts: {0}'.format(data)
-            results['Errors'][topfile] = {'error': error_log}
-            log.error(error_log)
-            continue
+    data_by_tag = _top_data_by_tag(topfile, results)
 
     if not data_by_tag:
         return results
 
-    # Run the audits
-    for tag, data in data_by_tag.iteritems():
-        ret = audit(configs=data,
-                    tags=tag,
-                    verbose=verbose,
-                    show_success=True,
-                    show_compliance=False,
-                    called_from_top=True)
+    if profile is None:
+        profile = __salt__['config.get']('hubblestack:nova:profile', False)
 
-        # Merge in the results
-        for key, val in ret.iteritems():
+    # Run the audits for all the entries at once, then format each entry's
+    # results as hubble.audit would have
+    entry_rets, ret = _run_top(data_by_tag, debug, profile=profile, **_nova_kwargs(None))
+    for entry_ret in entry_rets:
+        for key, val in _format_results(entry_ret, verbose, True, False).iteritems():
             if key not in results:
                 results[key] = []
             results[key].extend(val)
 
+    for error in ret.get('Errors', []):
+        if 'Errors' not in results:
+            results['Errors'] = []
+        results['Errors'].append(error)
+
+    if ret.get('Timing'):
+        results['Timing'] = ret['Timing']
+
     if show_compliance:
         compliance = _calculate_compliance(results)
         if compliance:
@@ -507,6 +1765,143 @@ def top(topfile='top.nova',
     return results
 
 
+def plan(configs=None,
+         tags='*',
+         topfile='top.nova',
+         debug=None):
+    '''
+    Show which nova modules and tags an audit would run on this minion, and
+    what it's expected to cost, without running any checks.
+
+    The estimates come from the timing history which is recorded in the
+    minion cachedir every time an audit is profiled (see ``profile`` in
+    ``hubble.audit``), so profile the audit at least once on a similar host
+    before relying on them. Tags and modules which have never been profiled
+    are listed in ``Unknown``, and left out of the totals.
+
+    Arguments:
+
+    configs
+        The same as for ``hubble.audit``. If not given, the audits from the
+        nova topfile are planned, like ``hubble.top``.
+
+    tags
+        The same as for ``hubble.audit``. Ignored when planning a topfile.
+
+    topfile
+        The topfile to plan, if ``configs`` isn't given.
+
+    debug
+        Whether to log additional information to help debug nova. Defaults to
+        False. Configurable via `hubblestack:nova:debug` in minion
+        config/pillar.
+
+    For each module under ``Modules``, the ``checks`` (audit entries),
+    predicted ``wall`` and ``cpu`` time in seconds, ``subprocesses`` and
+    ``file_reads`` are listed for each tag, and in total for the module. The
+    ``runtime`` in ``Total`` allows for ``hubblestack:nova:workers``.
+
+    CLI Examples:
+
+    .. code-block:: bash
+
+        salt '*' hubble.plan
+        salt '*' hubble.plan foo,bar tags='CIS*'
+    '''
+    if __salt__['config.get']('hubblestack:nova:autoload', True):
+        load()
+    if not __nova__:
+        return False, 'No nova modules/data have been loaded.'
+
+    if debug is None:
+        debug = __salt__['config.get']('hubblestack:nova:debug', False)
+
+    results = {}
+    if configs is None:
+        data_by_tag = _top_data_by_tag(topfile, results)
+    else:
+        if not isinstance(configs, list):
+            configs = configs.split(',')
+        data_by_tag = {tags: configs}
+
+    _, routes, _, module_tags, errors = _plan_top(data_by_tag, debug)
+    if errors:
+        results.setdefault('Errors', []).extend(errors)
+
+    history = _load_timing_history()
+    modules = {}
+    unknown = []
+    for key, _, module_data in routes:
+        module_history = history.get(key)
+        tag_table = __nova__.module_tags(key, module_data)
+        if tag_table is None:
+            # The module's tags can't be listed without running it
+            module_plan = {'tags': None}
+            if module_history:
+                module_plan.update(_timing_estimate(module_history))
+            else:
+                unknown.append(key)
+        else:
+            module_plan = {'tags': {}, 'checks': 0}
+            if module_history:
+                estimate = _timing_estimate(module_history['untagged'])
+            else:
+                estimate = _timing_estimate({})
+            for tag, audits in tag_table.iteritems():
+                if not __nova__.matcher.tag(tag, module_tags[key]):
+                    continue
+                tag_plan = {'checks': len(audits)}
+                tag_history = (module_history or {}).get('tags', {}).get(tag)
+                if tag_history:
+                    tag_plan.update(_timing_estimate(tag_history))
+                    for field in _TIMING_FIELDS:
+                        estimate[field] += tag_plan[field]
+                else:
+                    unknown.append('{0}:{1}'.format(key, tag))
+                module_plan['tags'][tag] = tag_plan
+                module_plan['checks'] += len(audits)
+            module_plan.update(_timing_estimate(estimate))
+        modules[key] = module_plan
+
+    total = {'modules': len(modules),
+             'tags': sum(len(module_plan['tags']) for module_plan in modules.itervalues()
+                         if module_plan['tags'] is not None),
+             'checks': sum(module_plan.get('checks', 0) for module_plan in modules.itervalues())}
+    total.update(_timing_estimate(dict(
+        (field, sum(module_plan.get(field, 0) for module_plan in modules.itervalues()))
+        for field in _TIMING_FIELDS)))
+    workers = int(__salt__['config.get']('hubblestack:nova:workers', 1) or 1)
+    total['runtime'] = _plan_runtime([module_plan.get('wall', 0)
+                                      for module_plan in modules.itervalues()], workers)
+
+    results['Modules'] = modules
+    results['Total'] = total
+    if unknown:
+        results['Unknown'] = sorted(unknown)
+    return results
+
+
+def _timing_estimate(timing):
+    '''
+    Return just the timing fields from a ``Timing`` or history entry
+    '''
+    return dict((field, round(timing.get(field, 0), 3)) for field in _TIMING_FIELDS)
+
+
+def _plan_runtime(walls, workers):
+    '''
+    Predict the wall time of running modules which take ``walls`` seconds
+    each on ``workers`` workers, assuming each module is picked up by the
+    first free worker, longest first
+    '''
+    if workers <= 1:
+        return round(sum(walls), 3)
+    finish = [0.0] * workers
+    for wall in sorted(walls, reverse=True):
+        finish[finish.index(min(finish))] += wall
+    return round(max(finish), 3)
+
+
 def sync(clean=False):
     '''
     Sync the nova audit modules and profiles from the saltstack fileserver.
@@ -574,14 +1969,32 @@ def sync(clean=False):
                 # of cache_dir
                 raise CommandExecutionError('An error occurred while syncing: {0}'
                                             .format(cached))
+
+    # Record when we last synced, for hubblestack:nova:sync_interval
+    stamp = _sync_stamp()
+    try:
+        if not os.path.isdir(os.path.dirname(stamp)):
+            os.makedirs(os.path.dirname(stamp))
+        with open(stamp, 'w') as fh_:
+            fh_.write(str(time.time()))
+    except (IOError, OSError) as exc:
+        log.debug('Unable to record nova sync time: {0}'.format(exc))
     return synced
 
 
 def load():
     '''
     Load the synced audit modules.
+
+    The loader is kept between calls, so only the modules and profiles which
+    have changed since the last load are reloaded. The loader lives in
+    memory, so it's only reused by calls from the same process; a minion
+    running with ``multiprocessing: True`` (the default) starts every job
+    with a new one, but still reuses the parsed profiles cached on disk. If
+    ``hubblestack:nova:sync_interval`` is set, the sync from the fileserver
+    is skipped if the last one was less than that many seconds ago.
     '''
-    if __salt__['config.get']('hubblestack:nova:autosync', True):
+    if __salt__['config.get']('hubblestack:nova:autosync', True) and _sync_due():
         sync()
 
     for nova_dir in _hubble_dir():
@@ -591,7 +2004,19 @@ def load():
     log.debug('loading nova modules')
 
     global __nova__
-    __nova__ = NovaLazyLoader(_hubble_dir(), __opts__, __grains__, __pillar__, __salt__)
+    hubble_dir = _hubble_dir()
+    if isinstance(__nova__, NovaLazyLoader) and __nova__.hubble_dir == hubble_dir:
+        # Only load the modules and profiles which changed since last time
+        reloaded = __nova__.reload(grains=__grains__, pillar=__pillar__,
+                                   salt=_timed_functions(__salt__))
+        log.debug('reloaded nova files: {0}'.format(reloaded))
+    else:
+        __nova__ = NovaLazyLoader(hubble_dir, __opts__, __grains__, __pillar__,
+                                  _timed_functions(__salt__),
+                                  pack={'open': _counting_open,
+                                        '__timing__': _TimingHook(),
+                                        '__resultcache__': _RESULT_CACHE,
+                                        '__facts__': _FACTS})
 
     ret = {'loaded': __nova__._dict.keys(),
            'missing': __nova__.missing_modules,
@@ -607,6 +2032,33 @@ def version():
     return __version__
 
 
+def _sync_stamp():
+    '''
+    Path of the file recording when nova modules and profiles were last
+    synced
+    '''
+    return os.path.join(__opts__.get('cachedir'), 'hubble', 'nova_last_sync')
+
+
+def _sync_due():
+    '''
+    Check whether the nova modules and profiles should be synced from the
+    fileserver, based on ``hubblestack:nova:sync_interval``
+    '''
+    interval = __salt__['config.get']('hubblestack:nova:sync_interval', 0)
+    if not interval:
+        return True
+    for nova_dir in _hubble_dir():
+        if not os.path.isdir(nova_dir):
+            return True
+    try:
+        with open(_sync_stamp()) as fh_:
+            last_sync = float(fh_.read())
+    except (IOError, OSError, ValueError):
+        return True
+    return not 0 <= time.time() - last_sync < float(interval)
+
+
 def _hubble_dir():
     '''
     Generate the local minion directories to which nova modules and profiles
@@ -650,11 +2102,69 @@ def _calculate_compliance(results):
     return None
 
 
+def _top_data_by_tag(topfile, results):
+    '''
+    Return the entries from the nova topfile which match this minion, as a
+    mapping of tag glob -> list of configs. Malformed entries are reported in
+    ``results['Errors']``.
+    '''
+    top_data = _get_top_data(topfile)
+
+    # Will be a combination of strings and single-item dicts. The strings
+    # have no tag filters, so we'll treat them as tag filter '*'. If we sort
+    # all the data by tag filter we can batch where possible under the same
+    # tag.
+    data_by_tag = {}
+    for data in top_data:
+        if isinstance(data, str):
+            if '*' not in data_by_tag:
+                data_by_tag['*'] = []
+            data_by_tag['*'].append(data)
+        elif isinstance(data, dict):
+            for key, tag in data.iteritems():
+                if tag not in data_by_tag:
+                    data_by_tag[tag] = []
+                data_by_tag[tag].append(key)
+        else:
+            if 'Errors' not in results:
+                results['Errors'] = {}
+            error_log = 'topfile malformed, list entries must be strings or '\
+                        'dicts: {0}'.format(data)
+            results['Errors'][topfile] = {'error': error_log}
+            log.error(error_log)
+            continue
+
+    return data_by_tag
+
+
 def _get_top_data(topfile):
     '''
     Helper method to retrieve and parse the nova topfile
     '''
     topfile = os.path.join(_hubble_dir()[1], topfile)
+    topdata = _load_topfile(topfile)
+
+    ret = []
+
+    for match in _compound_matches(topdata):
+        ret.extend(topdata[match])
+
+    return ret
+
+
+def _load_topfile(topfile):
+    '''
+    Parse the nova topfile at ``topfile``, reusing the last parse for as long
+    as the file's mtime and size are unchanged
+    '''
+    try:
+        top_stat = os.stat(topfile)
+        signature = (top_stat.st_mtime, top_stat.st_size)
+    except OSError:
+        signature = None
+    cached = _TOP_CACHE.get(topfile)
+    if signature is not None and cached is not None and cached[0] == signature:
+        return cached[1]
 
     try:
         with open(topfile) as handle:
@@ -667,11 +2177,24 @@ def _get_top_data(topfile):
         raise CommandExecutionError('Nova topfile not formatted correctly')
 
     topdata = topdata['nova']
+    if signature is not None:
+        _TOP_CACHE[topfile] = (signature, topdata)
+    return topdata
 
-    ret = []
-
-    for match, data in topdata.iteritems():
-        if __salt__['match.compound'](match):
-            ret.extend(data)
 
-    return ret
+def _compound_matches(targets):
+    '''
+    Return the compound matches in ``targets`` which match this minion.
+    ``match.compound`` results are remembered until the grains or pillar (or
+    minion id) change.
+    '''
+    context = hashlib.sha1(json.dumps([__opts__.get('id'), __grains__, __pillar__],
+                                      sort_keys=True, default=str)).hexdigest()
+    if _MATCH_CACHE['context'] != context:
+        _MATCH_CACHE['context'] = context
+        _MATCH_CACHE['matches'] = {}
+    matches = _MATCH_CACHE['matches']
+    for target in targets:
+        if target not in matches:
+            matches[target] = __salt__['match.compound'](target)
+    return [target for target in targets if matches[target]]
@@ -29,6 +29,7 @@ nebula_osquery:
 from __future__ import absolute_import
 
 import copy
+import hashlib
 import json
 import logging
 import os
@@ -44,6 +45,15 @@ log = logging.getLogger(__name__)
 __version__ = 'v2017.9.0'
 __virtualname__ = 'nebula'
 
+# Parsed topfiles, as path -> ((mtime, size), topfile data). Like
+# _MATCH_CACHE, this is only kept in memory, so forked minion jobs each start
+# with it empty; parsing a topfile and running its matches is cheap next to
+# the audit itself, so neither is saved to disk.
+_TOP_CACHE = {}
+# Results of match.compound for the current grains/pillar, as
+# {'context': hash of grains/pillar, 'matches': {match: result}}
+_MATCH_CACHE = {'context': None, 'matches': {}}
+
 
 def __virtual__():
     return __virtualname__
@@ -301,6 +311,30 @@ def top(query_group,
 def get_top_data(topfile):
 
     topfile = __salt__['cp.cache_file'](topfile)
+    topdata = _load_topfile(topfile)
+
+    ret = []
+
+    for match in _compound_matches(topdata):
+        ret.extend(topdata[match])
+
+    return ret
+
+
+def _load_topfile(topfile):
+    '''
+    Parse the cached nebula topfile at ``topfile``, reusing the last parse for
+    as long as the file's mtime and size are unchanged
+    '''
+    try:
+        top_stat = os.stat(topfile)
+        signature = (top_stat.st_mtime, top_stat.st_size)
+    except (OSError, TypeError):
+        # cp.cache_file returns False if the topfile couldn't be cached
+        signature = None
+    cached = _TOP_CACHE.get(topfile)
+    if signature is not None and cached is not None and cached[0] == signature:
+        return cached[1]
 
     try:
         with open(topfile) as handle:
@@ -313,14 +347,27 @@ def get_top_data(topfile):
         raise CommandExecutionError('Nebula topfile not formatted correctly')
 
     topdata = topdata['nebula']
+    if signature is not None:
+        _TOP_CACHE[topfile] = (signature, topdata)
+    return topdata
 
-    ret = []
-
-    for match, data in topdata.iteritems():
-        if __salt__['match.compound'](match):
-            ret.extend(data)
 
-    return ret
+def _compound_matches(targets):
+    '''
+    Return the compound matches in ``targets`` which match this minion.
+    ``match.compound`` results are remembered until the grains or pillar (or
+    minion id) change.
+    '''
+    context = hashlib.sha1(json.dumps([__opts__.get('id'), __grains__, __pillar__],
+                                      sort_keys=True, default=str)).hexdigest()
+    if _MATCH_CACHE['context'] != context:
+        _MATCH_CACHE['context'] = context
+        _MATCH_CACHE['matches'] = {}
+    matches = _MATCH_CACHE['matches']
+    for target in targets:
+        if target not in matches:
+            matches[target] = __salt__['match.compound'](target)
+    return [target for target in targets if matches[target]]
 
 
 def _dict_update(dest, upd, recursive_update=True, merge_lists=False):
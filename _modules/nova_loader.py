@@ -8,6 +8,7 @@ plugin interfaces used by Salt.
 # Import python libs
 from __future__ import absolute_import
 import os
+import re
 import imp
 import sys
 import salt
@@ -15,6 +16,8 @@ import time
 import yaml
 import logging
 import inspect
+import fnmatch
+import hashlib
 import tempfile
 import functools
 import collections
@@ -43,6 +46,15 @@ try:
     HAS_PKG_RESOURCES = True
 except ImportError:
     HAS_PKG_RESOURCES = False
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    # libyaml-backed parser, much faster than the pure python one
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
 __salt__ = {
     'cmd.run': salt.modules.cmdmod._run_quiet
@@ -1815,6 +1827,252 @@ def global_injector_decorator(inject_globals):
     return inner_decorator
 
 
+class NovaMatcher(object):
+    '''
+    Matches audit tags against the ``tags`` glob passed to ``hubble.audit``,
+    and the osfinger globs in profiles against the host's grains, on behalf
+    of the nova modules (which get it as ``__matcher__``).
+
+    Each ``tags`` glob is only compiled once, and osfinger results are kept
+    for as long as the grain they were matched against stays the same. The
+    matcher belongs to the loader, so these only carry over between audits
+    run from the same process, not between forked minion jobs.
+    '''
+
+    def __init__(self, grains):
+        self.grains = grains
+        # mapping of tags glob -> match function
+        self._tag_globs = {}
+        # mapping of grain name -> (grain value, {osfinger: matched})
+        self._osfinger_cache = {}
+
+    def tag(self, tag, tags):
+        '''
+        Check whether ``tag`` matches the ``tags`` glob. Equivalent to
+        ``fnmatch.fnmatch(tag, tags)``. ``tags`` may also be a tuple of globs,
+        as passed by ``hubble.top`` when it runs a module for several
+        entries, in which case ``tag`` only has to match one of them.
+        '''
+        if isinstance(tags, tuple):
+            return any(self.tag(tag, glob) for glob in tags)
+        match = self._tag_globs.get(tags)
+        if match is None:
+            if len(self._tag_globs) >= 100:
+                # Same limit as fnmatch's own cache
+                self._tag_globs.clear()
+            match = self._tag_globs[tags] = self._compile(tags)
+        return match(tag)
+
+    def _compile(self, glob):
+        '''
+        Return a function which matches names against ``glob``. Globs without
+        any wildcards are just compared, and ``*`` matches everything without
+        doing any work.
+        '''
+        glob = os.path.normcase(glob)
+        if glob == '*':
+            return lambda name: True
+        if not any(char in glob for char in '*?['):
+            return lambda name: os.path.normcase(name) == glob
+        regex = re.compile(fnmatch.translate(glob))
+        return lambda name: regex.match(os.path.normcase(name)) is not None
+
+    def osfinger(self, osfinger, grain='osfinger'):
+        '''
+        Check whether the ``grain`` grain matches any of the comma-separated
+        globs in ``osfinger``
+        '''
+        value = self.grains.get(grain)
+        cached_value, cache = self._osfinger_cache.get(grain, (None, None))
+        if cache is None or cached_value != value:
+            cache = {}
+            self._osfinger_cache[grain] = (value, cache)
+        if osfinger not in cache:
+            cache[osfinger] = value is not None and any(
+                fnmatch.fnmatch(value, osfinger_glob.strip())
+                for osfinger_glob in osfinger.split(','))
+        return cache[osfinger]
+
+
+class NovaTagTable(object):
+    '''
+    Normalized tables of the audits in the loaded profiles, keyed by tag,
+    shared by the nova modules (which get it as ``__tagtable__``).
+
+    The table for each profile is built the first time a module asks for it,
+    and then kept until the profile is reloaded (or the grain used to pick
+    the osfinger section changes), so modules don't need to merge and copy
+    their profile data on every audit.
+    '''
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        # mapping of (id(profile data), key, module, toplists, grain, layout)
+        # -> (profile data, grain value, {tag: [audit dicts]})
+        self._tables = {}
+
+    def tags(self,
+             data_list,
+             key,
+             module=None,
+             toplists=None,
+             grain='osfinger',
+             layout='list'):
+        '''
+        Return the audits under the top-level ``key`` of the profiles in
+        ``data_list``, as a mapping of tag -> list of audit dicts, with the
+        ``nova_profile`` of each audit filled in.
+
+        key
+            The top-level profile key, e.g. ``pkg``
+
+        module
+            The name to report as the ``module`` of each audit. Defaults to
+            ``key``.
+
+        toplists
+            The names of the lists (e.g. ``('blacklist', 'whitelist')``)
+            under ``key`` which contain the audits, if any. The list each
+            audit came from is reported as its ``type``.
+
+        grain
+            The grain which the osfinger keys in the audit ``data`` are
+            matched against
+
+        layout
+            How the matching osfinger section of each audit is laid out.
+            ``list`` for a list of ``{name: tag}`` items, where tag can
+            instead be a dict of data including the tag. ``single`` for a
+            single dict of data including the tag. ``flat`` if there are no
+            osfinger sections, and ``data`` itself contains the tag.
+
+        The audit dicts are copies, but anything nested in them is shared
+        with the profile data, and must not be modified.
+        '''
+        module = module or key
+        ret = {}
+        for profile, data in data_list:
+            if not isinstance(data, dict) or key not in data:
+                continue
+            table = self._table(data, key, module, toplists, grain, layout)
+            for tag, audits in six.iteritems(table):
+                tag_audits = ret.setdefault(tag, [])
+                for audit in audits:
+                    audit = dict(audit)
+                    if profile:
+                        audit['nova_profile'] = profile
+                    tag_audits.append(audit)
+        return ret
+
+    def discard(self, data):
+        '''
+        Forget the tables built from the profile ``data``
+        '''
+        for table_key in list(self._tables):
+            if table_key[0] == id(data):
+                self._tables.pop(table_key, None)
+
+    def _table(self, data, key, module, toplists, grain, layout):
+        '''
+        Return the (cached) table for a single profile
+        '''
+        table_key = (id(data), key, module, toplists, grain, layout)
+        grain_value = self.matcher.grains.get(grain)
+        cached = self._tables.get(table_key)
+        if cached is not None and cached[0] is data and cached[1] == grain_value:
+            return cached[2]
+        table = {}
+        for toplist, audit_data in self._audits(data[key], toplists):
+            if layout == 'flat':
+                audits = self._flat_audits(audit_data, module, toplist)
+            else:
+                osfinger_data = self._osfinger_data(audit_data, grain)
+                if layout == 'single':
+                    audits = self._single_audits(audit_data, osfinger_data, module)
+                else:
+                    audits = self._list_audits(audit_data, osfinger_data, module, toplist)
+            for audit in audits:
+                table.setdefault(audit['tag'], []).append(audit)
+        self._tables[table_key] = (data, grain_value, table)
+        return table
+
+    def _audits(self, section, toplists):
+        '''
+        Yield ``(toplist, audit_data)`` for each audit in the ``section`` of
+        a profile
+        '''
+        if not toplists:
+            for audit_data in six.itervalues(section or {}):
+                if isinstance(audit_data, dict):
+                    yield None, audit_data
+            return
+        for toplist in toplists:
+            for audit_data in six.itervalues((section or {}).get(toplist) or {}):
+                if isinstance(audit_data, dict):
+                    yield toplist, audit_data
+
+    def _osfinger_data(self, audit_data, grain):
+        '''
+        Return the section of the audit ``data`` for the first osfinger key
+        which matches, falling back to the ``*`` section
+        '''
+        tags_dict = audit_data.get('data', {})
+        for osfinger in tags_dict:
+            if osfinger == '*':
+                continue
+            if self.matcher.osfinger(osfinger, grain=grain):
+                tags = tags_dict.get(osfinger)
+                if tags is not None:
+                    return tags
+        return tags_dict.get('*')
+
+    def _list_audits(self, audit_data, tags, module, toplist):
+        if not tags:
+            return []
+        if isinstance(tags, dict):
+            # malformed yaml, convert to list of dicts
+            tags = [{name: tag} for name, tag in six.iteritems(tags)]
+        ret = []
+        for item in tags:
+            for name, tag in six.iteritems(item):
+                tag_data = {}
+                # Whitelist could have a dictionary, not a string
+                if isinstance(tag, dict):
+                    tag_data = dict(tag)
+                    tag = tag_data.pop('tag')
+                formatted_data = {'name': name,
+                                  'tag': tag,
+                                  'module': module}
+                if toplist is not None:
+                    formatted_data['type'] = toplist
+                formatted_data.update(tag_data)
+                formatted_data.update(audit_data)
+                formatted_data.pop('data', None)
+                ret.append(formatted_data)
+        return ret
+
+    def _single_audits(self, audit_data, tags, module):
+        tags = dict(tags or {})
+        tags.setdefault('tag', '')
+        formatted_data = {'tag': tags['tag'],
+                          'module': module}
+        formatted_data.update(audit_data)
+        formatted_data.update(tags)
+        formatted_data.pop('data', None)
+        return [formatted_data]
+
+    def _flat_audits(self, audit_data, module, toplist):
+        formatted_data = dict(audit_data.get('data', {}))
+        tag = formatted_data.pop('tag')
+        if toplist is not None:
+            formatted_data['type'] = toplist
+        formatted_data['tag'] = tag
+        formatted_data['module'] = module
+        formatted_data.update(audit_data)
+        formatted_data.pop('data', None)
+        return [formatted_data]
+
+
 class NovaLazyLoader(LazyLoader):
     '''
     Leverage the SaltStack LazyLoader so we don't have to reimplement
@@ -1823,7 +2081,7 @@ class NovaLazyLoader(LazyLoader):
     worth it.
     '''
 
-    def __init__(self, hubble_dir, opts, grains, pillar, salt):
+    def __init__(self, hubble_dir, opts, grains, pillar, salt, pack=None):
         self.hubble_dir = hubble_dir
         self.__grains__ = grains
         self.__pillar__ = pillar
@@ -1831,15 +2089,44 @@ class NovaLazyLoader(LazyLoader):
         self.__opts__ = opts
         self.__data__ = {}
         self.__missing_data__ = {}
+        # parsed profiles are cached here so they only need to be re-parsed
+        # when they change
+        self.profile_cache_dir = os.path.join(opts['cachedir'], 'hubble', 'nova_profiles')
+        # mapping of directory -> (mtime, subdirectories, filenames), so that
+        # directories which haven't changed don't need to be listed again
+        self._dir_cache = {}
+        # mapping of loaded file -> ((mtime, size), content hash), used to
+        # find the files which need to be reloaded
+        self._file_state = {}
+        # shared tag and osfinger matching for the nova modules
+        self.matcher = NovaMatcher(grains)
+        self.tagtable = NovaTagTable(self.matcher)
+        pack = dict(pack or {})
+        pack['__matcher__'] = self.matcher
+        pack['__tagtable__'] = self.tagtable
+        # mapping of top-level profile key -> names of the modules which
+        # declared it via __nova_keys__
+        self.__dispatch__ = {}
+        # names of the modules which don't declare __nova_keys__, and so
+        # receive every profile
+        self.__catchall__ = set()
+        # mapping of module name -> (profile key, tag table arguments) for
+        # the modules which declared __nova_tags__
+        self.__tagargs__ = {}
         super(NovaLazyLoader, self).__init__(hubble_dir,
                                              opts=opts,
-                                             tag='nova')
+                                             tag='nova',
+                                             pack=pack)
         self._load_all()
 
     def refresh_file_mapping(self):
         '''
         Override the default refresh_file_mapping to look for nova files
-        recursively, rather than only in a top-level directory
+        recursively, rather than only in a top-level directory.
+
+        Directory listings are cached by directory mtime, so only the
+        directories which have changed since the last refresh are listed
+        again.
         '''
         # map of suffix to description for imp
         self.suffix_map = {}
@@ -1848,55 +2135,228 @@ class NovaLazyLoader(LazyLoader):
         for (suffix, mode, kind) in imp.get_suffixes():
             self.suffix_map[suffix] = (suffix, mode, kind)
             suffix_order.append(suffix)
+        # map of suffix to precedence (lower is better)
+        suffix_precedence = {}
+        for index, suffix in enumerate(suffix_order):
+            suffix_precedence.setdefault(suffix, index)
+
+        # Python only in the modules directory, yaml only in the profiles
+        # directory. This is hacky but was a quick fix.
+        nova_module_cache, nova_profile_cache = self.hubble_dir
+        nova_module_cache = os.path.join(nova_module_cache, '')
+        nova_profile_cache = os.path.join(nova_profile_cache, '')
 
         # create mapping of filename (without suffix) to (path, suffix)
         self.file_mapping = {}
 
         for mod_dir in self.module_dirs:
-            for dirname, dirs, files in os.walk(mod_dir):
-                if '.git' in dirs:
-                    dirs.remove('.git')
+            for dirname, files in self._walk(mod_dir):
                 for filename in files:
-                    try:
-                        if filename.startswith('_'):
-                            # skip private modules
-                            # log messages omitted for obviousness
-                            continue
-                        _, ext = os.path.splitext(filename)
-                        fpath = os.path.join(dirname, filename)
-                        f_withext = fpath.partition(mod_dir)[-1]
-                        # Nova only supports .py and .yaml
-                        if ext not in ['.py', '.yaml']:
-                            continue
-                        # Python only in the modules directory, yaml only
-                        # in the profiles directory. This is hacky but was a
-                        # quick fix.
-                        nova_module_cache, nova_profile_cache = self.hubble_dir
-                        nova_module_cache = os.path.join(nova_module_cache, '')
-                        nova_profile_cache = os.path.join(nova_profile_cache, '')
-                        if ext == '.py' and fpath.startswith(nova_profile_cache):
-                            continue
-                        if ext == '.yaml' and fpath.startswith(nova_module_cache):
-                            continue
-                        if f_withext in self.disabled:
-                            #log.trace(
-                            #    'Skipping {0}, it is disabled by configuration'.format(
-                            #    filename
-                            #    )
-                            #)
-                            continue
-
-                        # if we don't have it, we want it
-                        elif f_withext not in self.file_mapping:
-                            self.file_mapping[f_withext] = (fpath, ext)
-                        # if we do, we want it if we have a higher precidence ext
-                        else:
-                            curr_ext = self.file_mapping[f_withext][1]
-                            #log.debug("****** curr_ext={0} ext={1} suffix_order={2}".format(curr_ext, ext, suffix_order))
-                            if curr_ext and suffix_order.index(ext) < suffix_order.index(curr_ext):
-                                self.file_mapping[f_withext] = (fpath, ext)
-                    except OSError:
+                    if filename.startswith('_'):
+                        # skip private modules
+                        # log messages omitted for obviousness
+                        continue
+                    _, ext = os.path.splitext(filename)
+                    # Nova only supports .py and .yaml
+                    if ext not in ['.py', '.yaml']:
+                        continue
+                    fpath = os.path.join(dirname, filename)
+                    f_withext = fpath.partition(mod_dir)[-1]
+                    if ext == '.py' and fpath.startswith(nova_profile_cache):
+                        continue
+                    if ext == '.yaml' and fpath.startswith(nova_module_cache):
                         continue
+                    if f_withext in self.disabled:
+                        continue
+
+                    # if we don't have it, we want it
+                    elif f_withext not in self.file_mapping:
+                        self.file_mapping[f_withext] = (fpath, ext)
+                    # if we do, we want it if we have a higher precidence ext
+                    else:
+                        curr_ext = self.file_mapping[f_withext][1]
+                        if curr_ext and suffix_precedence[ext] < suffix_precedence[curr_ext]:
+                            self.file_mapping[f_withext] = (fpath, ext)
+
+        # Forget about directories which have gone away
+        for dirname in list(self._dir_cache):
+            if not os.path.isdir(dirname):
+                self._dir_cache.pop(dirname)
+
+    def _walk(self, top):
+        '''
+        Like ``os.walk``, but only yields ``(dirname, filenames)``, skips
+        ``.git`` directories, and reuses the cached listing of any directory
+        whose mtime hasn't changed since it was last listed
+        '''
+        to_walk = [top]
+        while to_walk:
+            dirname = to_walk.pop()
+            try:
+                mtime = os.stat(dirname).st_mtime
+            except OSError:
+                continue
+            cached = self._dir_cache.get(dirname)
+            if cached is None or cached[0] != mtime:
+                dirs = []
+                files = []
+                try:
+                    names = os.listdir(dirname)
+                except OSError:
+                    continue
+                for name in names:
+                    path = os.path.join(dirname, name)
+                    if not os.path.isdir(path):
+                        files.append(name)
+                    elif name != '.git' and not os.path.islink(path):
+                        dirs.append(name)
+                cached = (mtime, dirs, files)
+                self._dir_cache[dirname] = cached
+            yield dirname, cached[2]
+            to_walk.extend(os.path.join(dirname, name) for name in cached[1])
+
+    def reload(self, grains=None, pillar=None, salt=None):
+        '''
+        Pick up changes to the synced nova modules and profiles, only loading
+        the files which have been added or whose contents have changed since
+        they were last loaded, and unloading those which have been removed.
+
+        If ``grains``, ``pillar`` or ``salt`` are passed, they replace the
+        ones given to the loader (and to the loaded modules).
+
+        Returns the list of files which were (re)loaded or unloaded.
+        '''
+        for attr, value in (('__grains__', grains),
+                            ('__pillar__', pillar),
+                            ('__salt__', salt)):
+            if value is not None and getattr(self, attr) is not value:
+                setattr(self, attr, value)
+                for func in self._dict.values():
+                    func.__globals__[attr] = value
+        self.matcher.grains = self.__grains__
+
+        old_mapping = self.file_mapping
+        self.refresh_file_mapping()
+
+        changed = []
+        for name in old_mapping:
+            if name not in self.file_mapping:
+                changed.append(name)
+        for name, (fpath, _) in six.iteritems(self.file_mapping):
+            if name not in old_mapping or old_mapping[name][0] != fpath:
+                changed.append(name)
+            elif name not in self._file_state or self._file_changed(name, fpath):
+                changed.append(name)
+
+        for name in changed:
+            self._unload(name)
+        for name in changed:
+            if name in self.file_mapping:
+                self._load_module(name)
+        return sorted(changed)
+
+    def _file_changed(self, name, fpath):
+        '''
+        Check whether the contents of a loaded file have changed since it was
+        loaded, only hashing the file if its mtime or size have changed
+        '''
+        stat_key, digest = self._file_state[name]
+        try:
+            stat = os.stat(fpath)
+            if (stat.st_mtime, stat.st_size) == stat_key:
+                return False
+            new_state = self._file_signature(fpath)
+        except (IOError, OSError):
+            return True
+        self._file_state[name] = new_state
+        return new_state[1] != digest
+
+    def _file_signature(self, fpath):
+        '''
+        Return the ``((mtime, size), content hash)`` of ``fpath``
+        '''
+        stat = os.stat(fpath)
+        with open(fpath, 'rb') as fh_:
+            digest = hashlib.sha1(fh_.read()).hexdigest()
+        return (stat.st_mtime, stat.st_size), digest
+
+    def _unload(self, name):
+        '''
+        Forget everything loaded from the file ``name``
+        '''
+        self.loaded_files.discard(name)
+        self.missing_modules.pop(name, None)
+        self.loaded_modules.pop(name, None)
+        self._dict.pop(name, None)
+        if name in self.__data__:
+            self.tagtable.discard(self.__data__.pop(name))
+        self.__missing_data__.pop(name, None)
+        self._file_state.pop(name, None)
+        self.__catchall__.discard(name)
+        self.__tagargs__.pop(name, None)
+        for nova_key in list(self.__dispatch__):
+            names = self.__dispatch__[nova_key]
+            if name in names:
+                names.remove(name)
+                if not names:
+                    self.__dispatch__.pop(nova_key)
+
+    def _load_profile(self, name, fpath):
+        '''
+        Return the parsed yaml from the profile at ``fpath``.
+
+        Parsed profiles are cached in the minion cachedir, keyed by the path
+        of the profile. A cached profile is used as-is if the mtime and size of
+        the profile are unchanged, and otherwise only if the hash of its
+        contents is unchanged (``hubble.sync`` rewrites every profile, even
+        if it hasn't changed upstream).
+        '''
+        stat = os.stat(fpath)
+        stat_key = (stat.st_mtime, stat.st_size)
+        cache_path = os.path.join(self.profile_cache_dir,
+                                  hashlib.sha1(fpath).hexdigest())
+        cached = None
+        try:
+            with open(cache_path, 'rb') as fh_:
+                cached = pickle.load(fh_)
+        except Exception:
+            pass
+        if cached is not None and cached['path'] == fpath:
+            if cached['stat'] == stat_key:
+                self._file_state[name] = (stat_key, cached['hash'])
+                return cached['data']
+
+        with open(fpath, 'rb') as fh_:
+            contents = fh_.read()
+        digest = hashlib.sha1(contents).hexdigest()
+        self._file_state[name] = (stat_key, digest)
+        if cached is not None and cached['path'] == fpath and cached['hash'] == digest:
+            data = cached['data']
+        else:
+            data = yaml.load(contents, Loader=YamlLoader)
+
+        self._write_profile_cache(cache_path,
+                                  {'path': fpath,
+                                   'stat': stat_key,
+                                   'hash': digest,
+                                   'data': data})
+        return data
+
+    def _write_profile_cache(self, cache_path, cached):
+        '''
+        Atomically write a parsed profile to the profile cache. Failure to
+        write the cache is logged, but is not an error.
+        '''
+        try:
+            if not os.path.isdir(self.profile_cache_dir):
+                os.makedirs(self.profile_cache_dir)
+            fd_, tmp_path = tempfile.mkstemp(dir=self.profile_cache_dir)
+            with os.fdopen(fd_, 'wb') as fh_:
+                pickle.dump(cached, fh_, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_path, cache_path)
+        except (IOError, OSError) as exc:
+            log.debug('Unable to cache nova profile {0}: {1}'
+                      .format(cached['path'], exc))
 
     def _load_module(self, name):
         '''
@@ -1907,15 +2367,15 @@ class NovaLazyLoader(LazyLoader):
         self.loaded_files.add(name)
         if suffix == '.yaml':
             try:
-                with open(fpath) as fh_:
-                    data = yaml.safe_load(fh_)
+                data = self._load_profile(name, fpath)
             except Exception as exc:
                 self.__missing_data__[name] = str(exc)
-                log.exception('Error loading yaml {0}'.format(fh_))
+                log.exception('Error loading yaml {0}'.format(fpath))
                 return False
 
             self.__data__[name] = data
             return True
+        self._file_state[name] = self._file_signature(fpath)
         try:
             sys.path.append(os.path.dirname(fpath))
             desc = self.suffix_map[suffix]
@@ -2043,5 +2503,77 @@ class NovaLazyLoader(LazyLoader):
             self._dict[name] = func
             mod_dict[name] = func
 
+        if name in self._dict:
+            self._index_nova_keys(name, mod)
+
         self.loaded_modules[name] = mod_dict
         return True
+
+    def _index_nova_keys(self, name, mod):
+        '''
+        Record which top-level profile keys the module ``name`` consumes, as
+        declared by its ``__nova_keys__`` attribute. Modules without that
+        attribute are assumed to be interested in every profile.
+
+        Modules which build their tags with ``__tagtable__`` also declare the
+        table arguments for their (first) key as ``__nova_tags__``, so that
+        their tags can be listed without running them.
+        '''
+        nova_keys = getattr(mod, '__nova_keys__', None)
+        if nova_keys is None:
+            self.__catchall__.add(name)
+            return
+        if isinstance(nova_keys, six.string_types):
+            nova_keys = [nova_keys]
+        for nova_key in nova_keys:
+            self.__dispatch__.setdefault(nova_key, []).append(name)
+        nova_tags = getattr(mod, '__nova_tags__', None)
+        if nova_tags is not None and nova_keys:
+            self.__tagargs__[name] = (nova_keys[0], nova_tags)
+
+    def module_tags(self, name, data_list):
+        '''
+        Return the tags (as a mapping of tag -> list of audit dicts) which the
+        module ``name`` would check for the profiles in ``data_list``, or None
+        if the module doesn't declare ``__nova_tags__``
+        '''
+        if name not in self.__tagargs__:
+            return None
+        key, nova_tags = self.__tagargs__[name]
+        return self.tagtable.tags(data_list, key, **nova_tags)
+
+    def filters_tags(self, name):
+        '''
+        Return whether the module ``name`` declares ``__nova_tags__``, and so
+        only returns results for the tags it is run with
+        '''
+        return name in self.__tagargs__
+
+    def route(self, data_list):
+        '''
+        Split up a list of ``(profile, data)`` tuples by the modules which
+        consume them, using the index built from ``__nova_keys__`` at load
+        time.
+
+        Returns a list of ``(name, func, data_list)`` tuples, sorted by
+        module name. Modules which have no matching profiles are left out
+        entirely, so they are never invoked.
+        '''
+        routed = {}
+        for profile, data in data_list:
+            if not isinstance(data, dict):
+                continue
+            names = set()
+            for nova_key in data:
+                names.update(self.__dispatch__.get(nova_key, ()))
+            for name in names:
+                routed.setdefault(name, []).append((profile, data))
+
+        ret = []
+        for name in sorted(self._dict):
+            func = self._dict[name]
+            if name in self.__catchall__:
+                ret.append((name, func, data_list))
+            elif name in routed:
+                ret.append((name, func, routed[name]))
+        return ret
@@ -242,6 +242,38 @@ def returner(ret):
 
                 hec.batchEvent(payload)
 
+            # Timing data is only present when hubble.audit was run with profile=True
+            for module, timing in data.get('Timing', {}).iteritems():
+                timing_events = [{'nova_module': module,
+                                  'wall_time': timing['wall'],
+                                  'cpu_time': timing['cpu'],
+                                  'subprocesses': timing['subprocesses'],
+                                  'file_reads': timing.get('file_reads', 0)}]
+                for tag, tag_timing in timing.get('tags', {}).iteritems():
+                    timing_events.append({'nova_module': module,
+                                          'check_id': tag,
+                                          'wall_time': tag_timing['wall'],
+                                          'cpu_time': tag_timing['cpu'],
+                                          'subprocesses': tag_timing['subprocesses'],
+                                          'file_reads': tag_timing.get('file_reads', 0)})
+                for event in timing_events:
+                    payload = {}
+                    event.update({'job_id': jid})
+                    event.update({'master': master})
+                    event.update({'minion_id': minion_id})
+                    event.update({'dest_host': fqdn})
+                    event.update({'dest_ip': fqdn_ip4})
+
+                    for cloud in clouds:
+                        event.update(cloud)
+
+                    payload.update({'host': fqdn})
+                    payload.update({'sourcetype': opts['sourcetype'] + '_timing'})
+                    payload.update({'index': opts['index']})
+                    payload.update({'event': event})
+
+                    hec.batchEvent(payload)
+
             hec.flushBatch()
     except:
         log.exception('Error ocurred in splunk_nova_return')
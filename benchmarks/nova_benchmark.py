@@ -0,0 +1,392 @@
+# -*- encoding: utf-8 -*-
+'''
+Benchmark harness for nova
+
+:maintainer: HubbleStack
+:platform: Linux
+:requires: SaltStack
+
+Generates a synthetic set of nova profiles (grep, stat, pkg and misc checks
+spread across many osfingers) against a fake filesystem in a scratch
+directory, then loads and audits them through ``hubble.py`` and the
+``NovaLazyLoader`` with a stubbed ``__salt__``/``__grains__``. The wall time,
+CPU time and peak memory of each phase are reported, and can be saved and
+compared between runs:
+
+.. code-block:: bash
+
+    python benchmarks/nova_benchmark.py --profiles 20 --checks 100 --save before.json
+    # ... make changes ...
+    python benchmarks/nova_benchmark.py --profiles 20 --checks 100 --compare before.json
+
+Only ``__salt__`` is stubbed; salt itself must be importable, as it is on a
+minion.
+'''
+from __future__ import absolute_import, print_function
+
+import argparse
+import gc
+import grp
+import json
+import os
+import pwd
+import random
+import resource
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, '_modules'))
+
+import hubble  # pylint: disable=wrong-import-position
+
+MODULES = ('grep', 'stat', 'pkg', 'misc')
+GRAINS = {'osfinger': 'Bench Linux-1',
+          'osfullname': 'Bench Linux',
+          'os': 'Bench',
+          'os_family': 'RedHat',
+          'kernel': 'Linux'}
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(description='Benchmark nova loading and auditing')
+    parser.add_argument('--profiles', type=int, default=10,
+                        help='number of profiles to generate (default: 10)')
+    parser.add_argument('--checks', type=int, default=50,
+                        help='checks per module in each profile (default: 50)')
+    parser.add_argument('--osfingers', type=int, default=20,
+                        help='osfinger sections per check (default: 20)')
+    parser.add_argument('--files', type=int, default=200,
+                        help='files in the fake filesystem (default: 200)')
+    parser.add_argument('--modules', default=','.join(MODULES),
+                        help='comma-separated nova modules to generate checks for '
+                             '(default: {0})'.format(','.join(MODULES)))
+    parser.add_argument('--runs', type=int, default=3,
+                        help='number of times to run the audit (default: 3)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='hubblestack:nova:workers (default: 1)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed for the generated data (default: 0)')
+    parser.add_argument('--save', metavar='FILE',
+                        help='save the results as json')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare against results saved with --save')
+    parser.add_argument('--keep', action='store_true',
+                        help="don't remove the scratch directory")
+    args = parser.parse_args(argv)
+    args.modules = [module.strip() for module in args.modules.split(',') if module.strip()]
+    for module in args.modules:
+        if module not in MODULES:
+            parser.error('unsupported module {0}, choose from {1}'
+                         .format(module, ', '.join(MODULES)))
+    return args
+
+
+class FakeSalt(dict):
+    '''
+    The ``__salt__`` functions used by the benchmarked nova modules, backed
+    by the fake filesystem and package list
+    '''
+    def __init__(self, config, packages):
+        super(FakeSalt, self).__init__()
+        self.config = config
+        self.packages = packages
+        self.update({'config.get': self.config_get,
+                     'cmd.run': self.cmd_run,
+                     'cmd.run_all': self.cmd_run_all,
+                     'cmd.run_stdout': self.cmd_run,
+                     'cmd.retcode': self.cmd_retcode,
+                     'file.stats': self.file_stats,
+                     'pkg.version': self.pkg_version,
+                     'pkg.list_pkgs': self.pkg_list_pkgs,
+                     'match.compound': lambda match: True})
+
+    def config_get(self, key, default=''):
+        return self.config.get(key, default)
+
+    def cmd_run_all(self, cmd, python_shell=None, **kwargs):
+        if python_shell:
+            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        else:
+            proc = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate()
+        return {'stdout': stdout.rstrip('\n'),
+                'stderr': stderr.rstrip('\n'),
+                'retcode': proc.returncode,
+                'pid': proc.pid}
+
+    def cmd_run(self, cmd, python_shell=None, **kwargs):
+        return self.cmd_run_all(cmd, python_shell=python_shell)['stdout']
+
+    def cmd_retcode(self, cmd, python_shell=None, **kwargs):
+        return self.cmd_run_all(cmd, python_shell=python_shell)['retcode']
+
+    def file_stats(self, path):
+        # Same fields and formats as salt's file.stats
+        try:
+            pstat = os.stat(path)
+        except OSError:
+            return {}
+        try:
+            user = pwd.getpwuid(pstat.st_uid).pw_name
+        except KeyError:
+            user = pstat.st_uid
+        try:
+            group = grp.getgrgid(pstat.st_gid).gr_name
+        except KeyError:
+            group = pstat.st_gid
+        return {'inode': pstat.st_ino,
+                'uid': pstat.st_uid,
+                'gid': pstat.st_gid,
+                'user': user,
+                'group': group,
+                'atime': pstat.st_atime,
+                'mtime': pstat.st_mtime,
+                'ctime': pstat.st_ctime,
+                'size': pstat.st_size,
+                'mode': oct(pstat.st_mode & 0o7777),
+                'type': 'file'}
+
+    def pkg_version(self, *names, **kwargs):
+        if len(names) == 1:
+            return self.packages.get(names[0], '')
+        return dict((name, self.packages.get(name, '')) for name in names)
+
+    def pkg_list_pkgs(self, versions_as_list=False, **kwargs):
+        if versions_as_list:
+            return dict((name, [version]) for name, version in self.packages.iteritems())
+        return dict(self.packages)
+
+
+def generate(root, args):
+    '''
+    Generate the fake filesystem, package list and nova profiles under
+    ``root``. Returns the package list.
+    '''
+    rnd = random.Random(args.seed)
+    user = pwd.getpwuid(os.getuid()).pw_name
+    group = grp.getgrgid(os.getgid()).gr_name
+
+    paths = []
+    for i in range(args.files):
+        path = os.path.join(root, 'fs', 'etc', 'bench{0}'.format(i % 10),
+                            'file{0}.conf'.format(i))
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fh_:
+            for j in range(50):
+                fh_.write('key_{0} = value_{1}\n'.format(j, rnd.randint(0, 9)))
+        os.chmod(path, rnd.choice((0o600, 0o644, 0o664)))
+        paths.append(path)
+
+    packages = {}
+    for i in range(args.checks):
+        if rnd.random() < 0.5:
+            packages['bench-pkg-{0}'.format(i)] = '1.{0}'.format(rnd.randint(0, 9))
+
+    osfingers = ['Other Linux-{0}'.format(i) for i in range(args.osfingers - 1)]
+    osfingers.append(GRAINS['osfinger'])
+
+    def _by_osfinger(make_check):
+        # Every osfinger gets its own copy of the check, as in real profiles
+        return dict((osfinger, make_check()) for osfinger in osfingers)
+
+    def _grep(tag):
+        return [{rnd.choice(paths): {'tag': tag,
+                                     'pattern': 'key_{0}'.format(rnd.randint(0, 60)),
+                                     'match_output': 'value_{0}'.format(rnd.randint(0, 9))}}]
+
+    def _stat(tag):
+        return [{rnd.choice(paths): {'tag': tag,
+                                     'mode': rnd.choice((600, 644)),
+                                     'user': user,
+                                     'group': group}}]
+
+    def _pkg(tag, i):
+        return [{'bench-pkg-{0}'.format(i): tag}]
+
+    def _misc(tag):
+        return {'tag': tag,
+                'function': 'restrict_permissions',
+                'args': [rnd.choice(paths), 644]}
+
+    profile_dir = os.path.join(root, 'cache', 'files', 'base', 'hubblestack_nova_profiles', 'bench')
+    os.makedirs(profile_dir)
+    for profile in range(args.profiles):
+        data = {}
+        for module in args.modules:
+            checks = {}
+            for i in range(args.checks):
+                tag = 'BENCH-{0}-{1}'.format(module.upper(), i)
+                if module == 'grep':
+                    check = _by_osfinger(lambda: _grep(tag))
+                elif module == 'stat':
+                    check = _by_osfinger(lambda: _stat(tag))
+                elif module == 'pkg':
+                    check = _by_osfinger(lambda: _pkg(tag, i))
+                else:
+                    check = _by_osfinger(lambda: _misc(tag))
+                checks['bench_{0}_{1}'.format(module, i)] = {
+                    'data': check,
+                    'description': 'Synthetic {0} check {1}'.format(module, i)}
+            if module in ('grep', 'pkg'):
+                data[module] = {'whitelist': checks}
+            else:
+                data[module] = checks
+        with open(os.path.join(profile_dir, 'profile{0}.yaml'.format(profile)), 'w') as fh_:
+            yaml.safe_dump(data, fh_, default_flow_style=False)
+
+    shutil.copytree(os.path.join(REPO_DIR, 'hubblestack_nova'),
+                    os.path.join(root, 'cache', 'files', 'base', 'hubblestack_nova'))
+    return packages
+
+
+def _memory():
+    '''
+    Return the current and peak RSS of this process, in KiB
+    '''
+    status = {}
+    try:
+        with open('/proc/self/status') as fh_:
+            for line in fh_:
+                key, _, value = line.partition(':')
+                if key in ('VmRSS', 'VmHWM'):
+                    status[key] = int(value.split()[0])
+    except IOError:
+        pass
+    if 'VmHWM' not in status:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak, peak
+    return status['VmRSS'], status['VmHWM']
+
+
+def _reset_peak_memory():
+    '''
+    Reset the peak RSS, so it can be measured per phase. Only supported on
+    Linux; elsewhere the peak is for the whole run so far.
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh_:
+            fh_.write('5')
+    except IOError:
+        pass
+
+
+def measure(name, func):
+    '''
+    Run ``func``, returning its result and the timing and memory use of the
+    phase ``name``
+    '''
+    gc.collect()
+    _reset_peak_memory()
+    rss, _ = _memory()
+    start_wall, start_cpu = time.time(), sum(os.times()[:4])
+    ret = func()
+    wall, cpu = time.time() - start_wall, sum(os.times()[:4]) - start_cpu
+    _, peak = _memory()
+    return ret, {'phase': name,
+                 'wall': round(wall, 4),
+                 'cpu': round(cpu, 4),
+                 'rss_kib': rss,
+                 'peak_kib': peak,
+                 'peak_growth_kib': peak - rss}
+
+
+def run(args):
+    root = tempfile.mkdtemp(prefix='nova_benchmark')
+    try:
+        packages, generate_phase = measure('generate', lambda: generate(root, args))
+        config = {'hubblestack:nova:autosync': False,
+                  'hubblestack:nova:workers': args.workers}
+        hubble.__salt__ = FakeSalt(config, packages)
+        hubble.__grains__ = GRAINS
+        hubble.__pillar__ = {}
+        hubble.__opts__ = {'cachedir': os.path.join(root, 'cache'),
+                           'grains': GRAINS,
+                           'id': 'nova-benchmark'}
+
+        phases = [generate_phase]
+        _, phase = measure('load', hubble.load)
+        phases.append(phase)
+        _, phase = measure('reload', hubble.load)
+        phases.append(phase)
+
+        audits = []
+        for i in range(args.runs):
+            ret, phase = measure('audit {0}'.format(i + 1),
+                                 lambda: hubble._run_audit(['/'], '*', False))
+            phases.append(phase)
+            audits.append(ret)
+        counts = dict((key, len(audits[-1].get(key, [])))
+                      for key in ('Success', 'Failure', 'Controlled', 'Errors'))
+        return {'config': {'profiles': args.profiles,
+                           'checks': args.checks,
+                           'osfingers': args.osfingers,
+                           'files': args.files,
+                           'modules': args.modules,
+                           'workers': args.workers,
+                           'seed': args.seed},
+                'results': counts,
+                'phases': phases}
+    finally:
+        if args.keep:
+            print('Scratch directory: {0}'.format(root))
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def report(bench, baseline=None):
+    print('Config: {0}'.format(json.dumps(bench['config'], sort_keys=True)))
+    print('Results: {0}'.format(json.dumps(bench['results'], sort_keys=True)))
+    baseline_phases = {}
+    if baseline:
+        if baseline['config'] != bench['config']:
+            print('WARNING: baseline was run with a different config: {0}'
+                  .format(json.dumps(baseline['config'], sort_keys=True)))
+        baseline_phases = dict((phase['phase'], phase) for phase in baseline['phases'])
+
+    print('{0:<12} {1:>10} {2:>10} {3:>12} {4:>12}'
+          .format('phase', 'wall (s)', 'cpu (s)', 'peak (KiB)', 'growth (KiB)'))
+    for phase in bench['phases']:
+        print('{0:<12} {1:>10.4f} {2:>10.4f} {3:>12} {4:>12}'
+              .format(phase['phase'], phase['wall'], phase['cpu'],
+                      phase['peak_kib'], phase['peak_growth_kib']))
+        old = baseline_phases.get(phase['phase'])
+        if old:
+            print('{0:<12} {1:>10} {2:>10} {3:>12} {4:>12}'
+                  .format('  vs base',
+                          _change(old['wall'], phase['wall']),
+                          _change(old['cpu'], phase['cpu']),
+                          _change(old['peak_kib'], phase['peak_kib']),
+                          _change(old['peak_growth_kib'], phase['peak_growth_kib'])))
+
+
+def _change(old, new):
+    if not old:
+        return 'n/a'
+    return '{0:+.1f}%'.format((new - old) * 100.0 / old)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh_:
+            baseline = json.load(fh_)
+    bench = run(args)
+    report(bench, baseline)
+    if args.save:
+        with open(args.save, 'w') as fh_:
+            json.dump(bench, fh_, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
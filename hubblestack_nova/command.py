@@ -71,15 +71,16 @@ command:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
 import os
-import copy
 import re
 import salt.utils
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('command',)
+__nova_tags__ = {'layout': 'single'}
+
 
 def __virtual__():
     return True
@@ -93,14 +94,11 @@ def audit(data_list, tags, **kwargs):
     debug = kwargs.get('nova_debug',False)
     cmd_raw = kwargs.get('cmd_raw',False)
 
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'command', **__nova_tags__)
 
     if debug:
-        log.debug('command audit __data__:')
-        log.debug(__data__)
+        log.debug('command audit data_list:')
+        log.debug(data_list)
         log.debug('command audit __tags__:')
         log.debug(__tags__)
 
@@ -114,7 +112,8 @@ def audit(data_list, tags, **kwargs):
         return ret
 
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -172,58 +171,3 @@ def audit(data_list, tags, **kwargs):
                         ret['Failure'].append(tag_data)
 
     return ret
-
-
-def _merge_yaml(ret, data, profile=None):
-    '''
-    Merge two yaml dicts together at the command level
-    '''
-    if 'command' not in ret:
-        ret['command'] = []
-    if 'command' in data:
-        for key, val in data['command'].iteritems():
-            if profile and isinstance(val, dict):
-                val['nova_profile'] = profile
-            ret['command'].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
-    '''
-    ret = {}
-    distro = __grains__.get('osfinger')
-    for audit_dict in data.get('command', []):
-        # command:0
-        for audit_id, audit_data in audit_dict.iteritems():
-            # command:0:nodev
-            tags_dict = audit_data.get('data', {})
-            # command:0:nodev:data
-            tags = None
-            for osfinger in tags_dict:
-                if osfinger == '*':
-                    continue
-                osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                for osfinger_glob in osfinger_list:
-                    if fnmatch.fnmatch(distro, osfinger_glob):
-                        tags = tags_dict.get(osfinger)
-                        break
-                if tags is not None:
-                    break
-            # If we didn't find a match, check for a '*'
-            if tags is None:
-                tags = tags_dict.get('*', {})
-            # command:0:nodev:data:Debian-8
-            if 'tag' not in tags:
-                tags['tag'] = ''
-            tag = tags['tag']
-            if tag not in ret:
-                ret[tag] = []
-            formatted_data = {'tag': tag,
-                              'module': 'command'}
-            formatted_data.update(audit_data)
-            formatted_data.update(tags)
-            formatted_data.pop('data')
-            ret[tag].append(formatted_data)
-    return ret
@@ -14,6 +14,8 @@ import logging
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('cve_scan',)
+
 
 def __virtual__():
     if salt.utils.is_linux() and salt.utils.which('oscap'):
@@ -86,7 +86,6 @@ cve_scan_v2:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import hashlib
 import json
 import os
@@ -102,6 +101,8 @@ import salt.utils
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('cve_scan_v2',)
+
 
 def __virtual__():
     return not salt.utils.is_windows()
@@ -161,7 +162,7 @@ def audit(data_list, tags, debug=False, **kwargs):
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
     # Dictionary of {pkg_name: list(pkg_versions)}
-    local_pkgs = __salt__['pkg.list_pkgs'](versions_as_list=True)
+    local_pkgs = __facts__.packages()
 
     for url, cache, cached_json, cached_zip, min_score, profile in endpoints:
         log.debug("url: %s, min_score: %s", url, min_score)
@@ -256,21 +257,10 @@ def audit(data_list, tags, debug=False, **kwargs):
 
     if tags != '*':
         log.debug("tags: %s", tags)
-        remove = []
-        for i, failure in enumerate(ret['Failure']):
-            if not fnmatch.fnmatch(failure.keys()[0], tags):
-                remove.append(i)
-        remove.reverse()
-        for i in remove:
-            ret['Failure'].pop(i)
-
-        remove = []
-        for i, failure in enumerate(ret['Controlled']):
-            if not fnmatch.fnmatch(failure.keys()[0], tags):
-                remove.append(i)
-        remove.reverse()
-        for i in remove:
-            ret['Controlled'].pop(i)
+        ret['Failure'] = [failure for failure in ret['Failure']
+                          if __matcher__.tag(failure.keys()[0], tags)]
+        ret['Controlled'] = [failure for failure in ret['Controlled']
+                             if __matcher__.tag(failure.keys()[0], tags)]
 
     if not ret['Controlled']:
         ret.pop('Controlled')
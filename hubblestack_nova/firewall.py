@@ -81,12 +81,13 @@ Check the following links for more details:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
-import copy
 import salt.utils
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('firewall',)
+__nova_tags__ = {'toplists': ('blacklist', 'whitelist'), 'layout': 'flat'}
+
 __tags__ = None
 __data__ = None
 
@@ -100,20 +101,18 @@ def __virtual__():
 
 
 def audit(data_list, tags, debug=False, **kwargs):
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'firewall', **__nova_tags__)
 
     if debug:
-        log.debug('service audit __data__:')
-        log.debug(__data__)
+        log.debug('service audit data_list:')
+        log.debug(data_list)
         log.debug('service audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -128,15 +127,16 @@ def audit(data_list, tags, debug=False, **kwargs):
                         'family': family}
 
                 # since table, chain and family are already given for checking the existence of the rule,
-                # they are not needed here
-                if 'table' in tag_data['rule']:
-                    tag_data['rule'].pop('table')
-                if 'chain' in tag_data['rule']:
-                    tag_data['rule'].pop('chain')
-                if 'family' in tag_data['rule']:
-                    tag_data['rule'].pop('family')
+                # they are not needed here. The rule is shared with the profile data, so copy it first
+                rule = dict(tag_data['rule'])
+                if 'table' in rule:
+                    rule.pop('table')
+                if 'chain' in rule:
+                    rule.pop('chain')
+                if 'family' in rule:
+                    rule.pop('family')
 
-                args.update(tag_data['rule'])
+                args.update(rule)
 
                 # building the rule using iptables.build_rule
                 rule = __salt__['iptables.build_rule'](**args)
@@ -161,39 +161,3 @@ def audit(data_list, tags, debug=False, **kwargs):
                     ret['Failure'].append(tag_data)
 
     return ret
-
-
-def _merge_yaml(ret, data, profile=None):
-    '''
-    Merge two yaml dicts together at the pkg:blacklist and pkg:whitelist level
-    '''
-    if 'firewall' not in ret:
-        ret['firewall'] = {}
-    for topkey in ('blacklist', 'whitelist'):
-        if topkey in data.get('firewall', {}):
-            if topkey not in ret['firewall']:
-                ret['firewall'][topkey] = []
-            for key, val in data['firewall'][topkey].iteritems():
-                if profile and isinstance(val, dict):
-                    val['nova_profile'] = profile
-                ret['firewall'][topkey].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    ret = {}
-    for toplist, toplevel in data.get('firewall', {}).iteritems():
-        for audit_dict in toplevel:
-            for audit_id, audit_data in audit_dict.iteritems():
-                tags_dict = audit_data.get('data', {})
-                tag = tags_dict.pop('tag')
-                if tag not in ret:
-                    ret[tag] = []
-                formatted_data = copy.deepcopy(tags_dict)
-                formatted_data['type'] = toplist
-                formatted_data['tag'] = tag
-                formatted_data['module'] = 'firewall'
-                formatted_data.update(audit_data)
-                formatted_data.pop('data')
-                ret[tag].append(formatted_data)
-    return ret
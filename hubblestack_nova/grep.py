@@ -52,21 +52,31 @@ the file is missing, then it will be considered a match (success for whitelist,
 failure for blacklist). If it's set to False and the file is missing, then it
 will be considered a non-match (success for blacklist, failure for whitelist).
 If the file exists, this setting is ignored.
+
+Files are searched natively, without running grep: all of the patterns for a
+file are checked against a single read of it (memory mapped, for large files).
+The external grep command is only run for patterns using grep_args which aren't
+supported natively (anything other than -E, -F, -G, -i, -v, -w, -x, -s and the
+-A/-B/-C context flags), and for files which grep would treat as binary.
 '''
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
 import os
 import copy
+import mmap
 import salt.utils
 import re
+import shlex
 
 from distutils.version import LooseVersion
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('grep',)
+__nova_tags__ = {'toplists': ('blacklist', 'whitelist')}
+
 
 def __virtual__():
     if salt.utils.is_windows():
@@ -78,151 +88,479 @@ def audit(data_list, tags, debug=False, **kwargs):
     '''
     Run the grep audits contained in the YAML files processed by __virtual__
     '''
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'grep', **__nova_tags__)
 
     if debug:
-        log.debug('grep audit __data__:')
-        log.debug(__data__)
+        log.debug('grep audit data_list:')
+        log.debug(data_list)
         log.debug('grep audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
+    checks = []
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
                     continue
-                name = tag_data['name']
-                audittype = tag_data['type']
-
-                if 'pattern' not in tag_data:
-                    log.error('No version found for grep audit {0}, file {1}'
-                              .format(tag, name))
-                    tag_data = copy.deepcopy(tag_data)
-                    tag_data['error'] = 'No pattern found'.format(mod)
-                    ret['Failure'].append(tag_data)
-                    continue
+                checks.append((tag, tag_data))
+
+    found = _search([check for check in checks if 'pattern' in check[1]])
+
+    for tag, tag_data in checks:
+        name = tag_data['name']
+        audittype = tag_data['type']
+
+        if 'pattern' not in tag_data:
+            log.error('No pattern found for grep audit {0}, file {1}'
+                      .format(tag, name))
+            tag_data = copy.deepcopy(tag_data)
+            tag_data['error'] = 'No pattern found'
+            ret['Failure'].append(tag_data)
+            continue
+
+        # Blacklisted pattern (must not be found)
+        if audittype == 'blacklist':
+            if found[id(tag_data)]:
+                ret['Failure'].append(tag_data)
+            else:
+                ret['Success'].append(tag_data)
+
+        # Whitelisted pattern (must be found)
+        elif audittype == 'whitelist':
+            if found[id(tag_data)]:
+                ret['Success'].append(tag_data)
+            else:
+                ret['Failure'].append(tag_data)
 
-                grep_args = tag_data.get('grep_args', [])
-                if isinstance(grep_args, str):
-                    grep_args = [grep_args]
+    return ret
 
-                grep_ret = _grep(name,
-                                 tag_data['pattern'],
-                                 *grep_args).get('stdout')
 
+def _search(checks):
+    '''
+    Run the grep checks in the list of ``(tag, tag_data)`` tuples ``checks``,
+    returning a dict of ``id(tag_data)`` to whether it was found.
+
+    Checks are grouped by file, so each file is read once however many
+    patterns are checked against it, and released before the next file is
+    read.
+    '''
+    by_file = {}
+    for tag, tag_data in checks:
+        by_file.setdefault(tag_data['name'], []).append((tag, tag_data))
+
+    found = {}
+    for name in sorted(by_file):
+        contents = _FileContents(os.path.expanduser(name))
+        try:
+            for tag, tag_data in by_file[name]:
+                __timing__.tag(tag)
+                found[id(tag_data)] = _found(tag_data, contents)
+        finally:
+            contents.close()
+    return found
+
+
+def _found(tag_data, contents):
+    '''
+    Whether the grep check ``tag_data`` is found in the file ``contents``
+    '''
+    name = tag_data['name']
+    grep_args = tag_data.get('grep_args', [])
+    if isinstance(grep_args, str):
+        grep_args = [grep_args]
+
+    grep_ret = _native_grep(contents, tag_data['pattern'], *grep_args)
+    if grep_ret is None:
+        grep_ret = _grep(name,
+                         tag_data['pattern'],
+                         *grep_args).get('stdout')
+
+    found = False
+    if grep_ret:
+        found = True
+    if 'match_output' in tag_data:
+        if not tag_data.get('match_output_regex'):
+            if tag_data['match_output'] not in grep_ret:
                 found = False
-                if grep_ret:
-                    found = True
-                if 'match_output' in tag_data:
-                    if not tag_data.get('match_output_regex'):
-                        if tag_data['match_output'] not in grep_ret:
-                            found = False
-                    else:  # match with regex
-                        if tag_data.get('match_output_multiline', True):
-                            if not re.search(tag_data['match_output'], grep_ret, re.MULTILINE):
-                                found = False
-                        else:
-                            if not re.search(tag_data['match_output'], grep_ret):
-                                found = False
-
-                if not os.path.exists(name) and 'match_on_file_missing' in tag_data:
-                    if tag_data['match_on_file_missing']:
-                        found = True
-                    else:
-                        found = False
+        else:  # match with regex
+            if tag_data.get('match_output_multiline', True):
+                if not re.search(tag_data['match_output'], grep_ret, re.MULTILINE):
+                    found = False
+            else:
+                if not re.search(tag_data['match_output'], grep_ret):
+                    found = False
 
-                # Blacklisted pattern (must not be found)
-                if audittype == 'blacklist':
-                    if found:
-                        ret['Failure'].append(tag_data)
-                    else:
-                        ret['Success'].append(tag_data)
+    if not contents.exists and 'match_on_file_missing' in tag_data:
+        if tag_data['match_on_file_missing']:
+            found = True
+        else:
+            found = False
+    return found
 
-                # Whitelisted pattern (must be found)
-                elif audittype == 'whitelist':
-                    if found:
-                        ret['Success'].append(tag_data)
-                    else:
-                        ret['Failure'].append(tag_data)
 
-    return ret
+# Files at least this big are memory mapped rather than read
+_MMAP_SIZE = 1024 * 1024
 
+# grep treats files with NUL bytes as binary, and (depending on the locale)
+# files which aren't valid text; leave those to grep itself
+_NOT_TEXT = re.compile('[\x00\x80-\xff]')
 
-def _merge_yaml(ret, data, profile=None):
+
+class _FileContents(object):
     '''
-    Merge two yaml dicts together at the grep:blacklist and grep:whitelist level
+    The contents of a file which is being searched, read once and shared by
+    every pattern checked against it
     '''
-    if 'grep' not in ret:
-        ret['grep'] = {}
-    for topkey in ('blacklist', 'whitelist'):
-        if topkey in data.get('grep', {}):
-            if topkey not in ret['grep']:
-                ret['grep'][topkey] = []
-            for key, val in data['grep'][topkey].iteritems():
-                if profile and isinstance(val, dict):
-                    val['nova_profile'] = profile
-                ret['grep'][topkey].append({key: val})
-    return ret
+    def __init__(self, path):
+        self.path = path
+        self.exists = os.path.exists(path)
+        self._data = None
+        self._mmap = None
+        self._lines = None
+        self._read = False
+
+    @property
+    def data(self):
+        '''
+        The contents of the file, or an empty string if it can't be read
+        (grep prints nothing on stdout for a missing file or a directory).
+        Returns None if the file isn't text.
+        '''
+        if not self._read:
+            self._read = True
+            try:
+                with open(self.path, 'rb') as fh_:
+                    size = os.fstat(fh_.fileno()).st_size
+                    if size >= _MMAP_SIZE:
+                        self._mmap = mmap.mmap(fh_.fileno(), 0, access=mmap.ACCESS_READ)
+                        self._data = self._mmap
+                    else:
+                        # Sizes under /proc and /sys are unreliable, so read it all
+                        self._data = fh_.read()
+            except (IOError, OSError, ValueError):
+                self._data = ''
+            if _NOT_TEXT.search(self._data):
+                self.close()
+                self._data = None
+        return self._data
+
+    @property
+    def lines(self):
+        '''
+        The lines of the file, as grep sees them
+        '''
+        if self._lines is None:
+            self._lines = self.data[:].split('\n')
+            if self._lines[-1] == '':
+                # The file ends with a newline, or is empty
+                self._lines.pop()
+        return self._lines
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._data = None
+        self._lines = None
+
+
+def _native_grep(contents, pattern, *args):
+    '''
+    Search the file ``contents`` for ``pattern`` the way ``_grep`` would run
+    ``grep <args> <pattern> <path>``, and return what grep would print on
+    stdout (stripped of trailing whitespace, like ``cmd.run_all``).
 
+    Returns None if grep needs to be run instead, because the arguments or the
+    pattern aren't supported, or the file isn't text.
+    '''
+    options = _grep_options(pattern, args, contents.path)
+    if options is None:
+        return None
+    try:
+        regex = re.compile(options['regex'], re.MULTILINE | options['flags'])
+    except (re.error, OverflowError):
+        return None
+    data = contents.data
+    if data is None:
+        return None
+
+    before, after = options['before'], options['after']
+    if not options['invert'] and not before and not after:
+        # Jump from match to match; only the lines with matches are looked at
+        ret = []
+        pos = 0
+        while pos <= len(data):
+            match = regex.search(data, pos)
+            if not match:
+                break
+            start = data.rfind('\n', 0, match.start()) + 1
+            end = data.find('\n', match.start())
+            if end == -1:
+                end = len(data)
+            if start == len(data):
+                # The empty "line" after the final newline isn't a line
+                break
+            if match.end() <= end or regex.search(data, start, end):
+                ret.append(data[start:end])
+            pos = end + 1
+        return '\n'.join(ret).rstrip()
+
+    lines = contents.lines
+    selected = [index for index, line in enumerate(lines)
+                if bool(regex.search(line)) != options['invert']]
+    if not before and not after:
+        return '\n'.join(lines[index] for index in selected).rstrip()
+
+    # Print the context around each selected line, with groups which aren't
+    # adjacent separated by '--'
+    ret = []
+    last = None
+    for index in selected:
+        first = max(index - before, 0 if last is None else last + 1)
+        if last is not None and first > last + 1:
+            ret.append('--')
+        ret.extend(lines[first:index + after + 1])
+        last = min(index + after, len(lines) - 1)
+    return '\n'.join(ret).rstrip()
+
+
+_GREP_FLAGS = {'E': 'extended',
+               'G': 'basic',
+               'F': 'fixed',
+               'i': 'ignore_case',
+               'y': 'ignore_case',
+               'v': 'invert',
+               'w': 'word',
+               'x': 'line',
+               's': None}
+_GREP_LONG_FLAGS = {'--extended-regexp': 'E',
+                    '--basic-regexp': 'G',
+                    '--fixed-strings': 'F',
+                    '--ignore-case': 'i',
+                    '--invert-match': 'v',
+                    '--word-regexp': 'w',
+                    '--line-regexp': 'x',
+                    '--no-messages': 's',
+                    '--after-context': 'A',
+                    '--before-context': 'B',
+                    '--context': 'C'}
+
+
+def _grep_options(pattern, args, path):
+    '''
+    Parse the command line ``_grep`` would run into the python regex and
+    options for the search, or return None if it isn't supported natively
+    '''
+    try:
+        argv = shlex.split('{0} {1} {2}'.format(' '.join(args), pattern, path))
+    except (ValueError, UnicodeError):
+        return None
+
+    opts = {'syntax': 'basic', 'invert': False, 'word': False, 'line': False,
+            'ignore_case': False, 'A': None, 'B': None, 'C': 0}
+    positional = []
+    argv.reverse()
+    while argv:
+        arg = argv.pop()
+        if arg.startswith('--') and len(arg) > 2:
+            arg, _, value = arg.partition('=')
+            flag = _GREP_LONG_FLAGS.get(arg)
+            if flag is None:
+                return None
+            if flag in 'ABC':
+                if not value.isdigit():
+                    return None
+                opts[flag] = int(value)
+            else:
+                arg = '-' + flag
+        if arg.startswith('-') and len(arg) > 1 and not arg.startswith('--'):
+            flags = arg[1:]
+            while flags:
+                flag, flags = flags[0], flags[1:]
+                if flag in 'ABC':
+                    value = flags or (argv.pop() if argv else '')
+                    if not value.isdigit():
+                        return None
+                    opts[flag] = int(value)
+                    flags = ''
+                elif flag.isdigit():
+                    # -2 is the same as -C 2
+                    digits = flag + flags
+                    if not digits.isdigit():
+                        return None
+                    opts['C'] = int(digits)
+                    flags = ''
+                elif flag in _GREP_FLAGS:
+                    option = _GREP_FLAGS[flag]
+                    if option in ('extended', 'basic', 'fixed'):
+                        opts['syntax'] = option
+                    elif option:
+                        opts[option] = True
+                else:
+                    return None
+        elif not arg.startswith('--'):
+            positional.append(arg)
+        elif arg == '--':
+            return None
+    if len(positional) != 2 or positional[1] != path:
+        # Not a single file (the path was split or quoted on the command line)
+        return None
 
-def _get_tags(data):
+    try:
+        regex = '|'.join('(?:{0})'.format(_translate(part, opts['syntax']))
+                         for part in positional[0].split('\n'))
+    except ValueError:
+        return None
+    if opts['line']:
+        regex = '^(?:{0})$'.format(regex)
+    elif opts['word']:
+        regex = r'(?<!\w)(?:{0})(?!\w)'.format(regex)
+    return {'regex': regex,
+            'flags': re.IGNORECASE if opts['ignore_case'] else 0,
+            'invert': opts['invert'],
+            'before': opts['B'] if opts['B'] is not None else opts['C'],
+            'after': opts['A'] if opts['A'] is not None else opts['C']}
+
+
+_BRACKET_CLASSES = {'alpha': 'a-zA-Z',
+                    'digit': '0-9',
+                    'alnum': '0-9a-zA-Z',
+                    'upper': 'A-Z',
+                    'lower': 'a-z',
+                    'space': r' \t\n\r\f\v',
+                    'blank': r' \t',
+                    'punct': re.escape('!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'),
+                    'xdigit': '0-9A-Fa-f',
+                    'cntrl': r'\x00-\x1f\x7f',
+                    'print': r'\x20-\x7e',
+                    'graph': r'\x21-\x7e'}
+
+
+def _translate(pattern, syntax):
     '''
-    Retrieve all the tags for this distro from the yaml
+    Translate a grep pattern, in the ``basic`` (BRE), ``extended`` (ERE) or
+    ``fixed`` syntax, into a python regex. Raises ValueError for anything
+    which can't be translated exactly.
     '''
-    ret = {}
-    distro = __grains__.get('osfinger')
-    for toplist, toplevel in data.get('grep', {}).iteritems():
-        # grep:blacklist
-        for audit_dict in toplevel:
-            # grep:blacklist:0
-            for audit_id, audit_data in audit_dict.iteritems():
-                # grep:blacklist:0:telnet
-                tags_dict = audit_data.get('data', {})
-                # grep:blacklist:0:telnet:data
-                tags = None
-                for osfinger in tags_dict:
-                    if osfinger == '*':
-                        continue
-                    osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                    for osfinger_glob in osfinger_list:
-                        if fnmatch.fnmatch(distro, osfinger_glob):
-                            tags = tags_dict.get(osfinger)
-                            break
-                    if tags is not None:
-                        break
-                # If we didn't find a match, check for a '*'
-                if tags is None:
-                    tags = tags_dict.get('*', [])
-                # grep:blacklist:0:telnet:data:Debian-8
-                if isinstance(tags, dict):
-                    # malformed yaml, convert to list of dicts
-                    tmp = []
-                    for name, tag in tags.iteritems():
-                        tmp.append({name: tag})
-                    tags = tmp
-                for item in tags:
-                    for name, tag in item.iteritems():
-                        tag_data = {}
-                        # Whitelist could have a dictionary, not a string
-                        if isinstance(tag, dict):
-                            tag_data = copy.deepcopy(tag)
-                            tag = tag_data.pop('tag')
-                        if tag not in ret:
-                            ret[tag] = []
-                        formatted_data = {'name': name,
-                                          'tag': tag,
-                                          'module': 'grep',
-                                          'type': toplist}
-                        formatted_data.update(tag_data)
-                        formatted_data.update(audit_data)
-                        formatted_data.pop('data')
-                        ret[tag].append(formatted_data)
-    return ret
+    if syntax == 'fixed':
+        return re.escape(pattern)
+    extended = syntax == 'extended'
+    ret = []
+    # Whether the next character starts a (sub)expression, where * is
+    # literal in a BRE, and whether it's where ^ is an anchor in a BRE (which
+    # isn't after another ^; elsewhere ^ is literal)
+    start = True
+    anchor = True
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        at_start, start = start, False
+        at_anchor, anchor = anchor, False
+        if char == '\\':
+            if i == len(pattern):
+                raise ValueError('trailing backslash')
+            char = pattern[i]
+            i += 1
+            if char in '(|' and not extended:
+                ret.append(char)
+                start = True
+                anchor = True
+            elif char in ')+?' and not extended:
+                ret.append(char)
+            elif char == '{' and not extended:
+                end = pattern.find('\\}', i)
+                if end == -1 or not re.match(r'^\d+(,\d*)?$|^,\d+$', pattern[i:end]):
+                    raise ValueError('invalid interval')
+                ret.append('{' + pattern[i:end] + '}')
+                i = end + 2
+            elif char.isdigit() and char != '0':
+                ret.append('(?:\\{0})'.format(char))
+            elif char in 'wWsSbB':
+                ret.append('\\' + char)
+            elif char == '<':
+                ret.append(r'\b(?=\w)')
+            elif char == '>':
+                ret.append(r'\b(?<=\w)')
+            elif char.isalnum() or char in '`\'':
+                # Other GNU extensions
+                raise ValueError('unsupported escape')
+            else:
+                ret.append(re.escape(char))
+        elif char == '[':
+            i = _translate_bracket(pattern, i, ret)
+        elif char == '.':
+            ret.append('.')
+        elif char == '*':
+            if at_start and extended:
+                raise ValueError('leading repetition')
+            ret.append(re.escape(char) if at_start else char)
+        elif char == '^':
+            if at_anchor or extended:
+                ret.append(char)
+                start = True
+            else:
+                ret.append(re.escape(char))
+        elif char == '$':
+            if extended or i == len(pattern) or pattern[i:i + 2] in ('\\)', '\\|'):
+                ret.append(char)
+            else:
+                ret.append(re.escape(char))
+        elif extended and char in '(|':
+            if pattern[i:i + 1] in ('?', '*', '+'):
+                raise ValueError('unsupported group')
+            ret.append(char)
+            start = True
+        elif extended and char in ')+?':
+            ret.append(char)
+        elif extended and char == '{':
+            match = re.match(r'^(\d+(,\d*)?|,\d+)\}', pattern[i:])
+            if not match or at_start:
+                raise ValueError('invalid interval')
+            ret.append('{' + match.group(1) + '}')
+            i += match.end()
+        else:
+            ret.append(re.escape(char))
+    return ''.join(ret)
+
+
+def _translate_bracket(pattern, i, ret):
+    '''
+    Translate the bracket expression starting at ``pattern[i]`` (just after
+    the ``[``) onto ``ret``, returning the index after the closing ``]``
+    '''
+    out = ['[']
+    if pattern[i:i + 1] == '^':
+        out.append('^')
+        i += 1
+    first = True
+    while True:
+        if i >= len(pattern):
+            raise ValueError('unterminated bracket expression')
+        char = pattern[i]
+        if char == ']' and not first:
+            i += 1
+            break
+        first = False
+        if char == '[' and pattern[i + 1:i + 2] in (':', '=', '.'):
+            kind = pattern[i + 1]
+            end = pattern.find(kind + ']', i + 2)
+            if kind != ':' or end == -1 or pattern[i + 2:end] not in _BRACKET_CLASSES:
+                raise ValueError('unsupported bracket expression')
+            out.append(_BRACKET_CLASSES[pattern[i + 2:end]])
+            i = end + 2
+        elif char.isalnum() or char == '-':
+            out.append(char)
+            i += 1
+        else:
+            # Backslashes (and everything else) are literal in brackets
+            out.append('\\' + char)
+            i += 1
+    out.append(']')
+    ret.append(''.join(out))
+    return i
 
 
 def _grep(path,
@@ -44,17 +44,21 @@ misc:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
+import grp
 import os
-import copy
+import pwd
 import re
+import stat
 import salt.utils
 from salt.ext import six
 from collections import Counter
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('misc',)
+__nova_tags__ = {'layout': 'single'}
+
 
 def __virtual__():
     return True
@@ -63,20 +67,18 @@ def audit(data_list, tags, debug=False, **kwargs):
     '''
     Run the misc audits contained in the data_list
     '''
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'misc', **__nova_tags__)
 
     if debug:
-        log.debug('misc audit __data__:')
-        log.debug(__data__)
+        log.debug('misc audit data_list:')
+        log.debug(data_list)
         log.debug('misc audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -94,8 +96,11 @@ def audit(data_list, tags, debug=False, **kwargs):
                 args = tag_data.get('args', [])
                 kwargs = tag_data.get('kwargs', {})
 
-                # Call the function
-                result = function(*args, **kwargs)
+                # Call the function, unless its result is cached
+                result, cache_age = __resultcache__.fetch(
+                    'misc', tag, tag_data, lambda: function(*args, **kwargs))
+                if cache_age is not None:
+                    tag_data['cache_age'] = cache_age
 
                 if result is True:
                     ret['Success'].append(tag_data)
@@ -108,66 +113,6 @@ def audit(data_list, tags, debug=False, **kwargs):
     return ret
 
 
-def _merge_yaml(ret, data, profile=None):
-    '''
-    Merge two yaml dicts together at the misc level
-    '''
-    if 'misc' not in ret:
-        ret['misc'] = []
-    if 'misc' in data:
-        for key, val in data['misc'].iteritems():
-            if profile and isinstance(val, dict):
-                val['nova_profile'] = profile
-            ret['misc'].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
-    '''
-    ret = {}
-    distro = __grains__.get('osfinger')
-    for audit_dict in data.get('misc', []):
-        # misc:0
-        for audit_id, audit_data in audit_dict.iteritems():
-            # misc:0:nodev
-            tags_dict = audit_data.get('data', {})
-            # misc:0:nodev:data
-            tags = None
-            for osfinger in tags_dict:
-                if osfinger == '*':
-                    continue
-                osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                for osfinger_glob in osfinger_list:
-                    if fnmatch.fnmatch(distro, osfinger_glob):
-                        tags = tags_dict.get(osfinger)
-                        break
-                if tags is not None:
-                    break
-            # If we didn't find a match, check for a '*'
-            if tags is None:
-                tags = tags_dict.get('*', {})
-            # misc:0:nodev:data:Debian-8
-            if 'tag' not in tags:
-                tags['tag'] = ''
-            tag = tags['tag']
-            if tag not in ret:
-                ret[tag] = []
-            formatted_data = {'tag': tag,
-                              'module': 'misc'}
-            formatted_data.update(audit_data)
-            formatted_data.update(tags)
-            formatted_data.pop('data')
-            ret[tag].append(formatted_data)
-    return ret
-
-
-############################
-# Begin function definitions
-############################
-
-
 def _execute_shell_command(cmd):
     '''
     This function will execute passed command in /bin/shell
@@ -229,14 +174,126 @@ def _is_permission_in_limit(max_permission,given_permission):
     return True
 
 
+def _field(entry, index):
+    '''
+    Return field ``index`` of an /etc/passwd, /etc/group or /etc/shadow entry
+    from ``__facts__``, or an empty string if it doesn't have that many fields
+    (as awk and cut do)
+    '''
+    return entry[index] if index < len(entry) else ''
+
+
+def _awk_compare(value, number):
+    '''
+    Compare the field ``value`` with ``number`` the way awk does: as numbers
+    if the field looks like one, otherwise as strings. Returns -1, 0 or 1.
+    '''
+    try:
+        value = float(value.strip())
+    except ValueError:
+        number = str(number)
+    return (value > number) - (value < number)
+
+
+def _group_exists(group):
+    '''
+    Whether ``getent group <group>`` would find the group (by gid or name)
+    '''
+    if not group.strip():
+        # getent lists every group
+        return True
+    try:
+        if group.isdigit():
+            grp.getgrgid(int(group))
+        else:
+            grp.getgrnam(group)
+        return True
+    except (KeyError, OverflowError):
+        return False
+
+
+# The tests _find applies to every file, like the find(1) expressions the
+# filesystem checks used to run
+_FIND_TESTS = {
+    # -nouser
+    'nouser': lambda pstat, users, groups: not users(pstat.st_uid),
+    # -nogroup
+    'nogroup': lambda pstat, users, groups: not groups(pstat.st_gid),
+    # -type f -perm -0002
+    'world_writable_file': lambda pstat, users, groups: (
+        stat.S_ISREG(pstat.st_mode) and pstat.st_mode & stat.S_IWOTH),
+    # -type d ( -perm -0002 -a ! -perm -1000 )
+    'world_writable_dir_no_sticky': lambda pstat, users, groups: (
+        stat.S_ISDIR(pstat.st_mode) and pstat.st_mode & stat.S_IWOTH and
+        not pstat.st_mode & stat.S_ISVTX),
+}
+
+
+def _find(test, roots):
+    '''
+    Return the paths under each of ``roots`` (without crossing into other
+    filesystems, like ``find -xdev``) which pass the test ``test`` from
+    ``_FIND_TESTS``, in the order find would print them.
+
+    Each root is walked once per audit, evaluating every test in
+    ``_FIND_TESTS`` on each file at once, and the results are shared by all of
+    the checks which search it.
+    '''
+    ret = []
+    for root in roots:
+        ret.extend(__facts__.get(('find', root), lambda: _walk(root))[test])
+    return ret
+
+
+def _local_mounts():
+    '''
+    The mount points of the local filesystems, as listed by ``df --local``
+    '''
+    return __facts__.get('local_mounts', lambda: _execute_shell_command(
+        "df --local -P | awk 'NR!=1 {print $6}'").split())
+
+
+def _walk(root):
+    '''
+    Walk the filesystem under ``root`` once, as ``find <root> -xdev`` would,
+    returning a dict of each test in ``_FIND_TESTS`` to the paths which pass
+    it. The files come from ``__facts__.files``, which can keep an index of
+    them, so unchanged directories aren't listed again on every audit.
+    '''
+    ret = dict((test, []) for test in _FIND_TESTS)
+    users = _IdCache(pwd.getpwuid)
+    groups = _IdCache(grp.getgrgid)
+    for path, pstat in __facts__.files(root):
+        for test, func in six.iteritems(_FIND_TESTS):
+            if func(pstat, users, groups):
+                ret[test].append(path)
+    return ret
+
+
+class _IdCache(object):
+    '''
+    Whether uids (or gids) exist, looking each up with ``lookup`` only once
+    '''
+    def __init__(self, lookup):
+        self.lookup = lookup
+        self.known = {}
+
+    def __call__(self, num):
+        if num not in self.known:
+            try:
+                self.lookup(num)
+                self.known[num] = True
+            except KeyError:
+                self.known[num] = False
+        return self.known[num]
+
+
 def check_all_ports_firewall_rules(reason=''):
     '''
     Ensure firewall rule for all open ports
     '''
-    start_open_ports = (_execute_shell_command('netstat -ln | grep "Active Internet connections (only servers)" -n | cut -d ":" -f1')).strip()
-    end_open_ports = (_execute_shell_command('netstat -ln | grep "Active UNIX domain sockets (only servers)" -n  | cut -d ":" -f1')).strip()
-    open_ports = (_execute_shell_command('netstat -ln | awk \'FNR > ' + start_open_ports + ' && FNR < ' + end_open_ports + ' && $6 == "LISTEN" && $4 !~ /127.0.0.1/ {print $4}\' | sed -e "s/.*://"')).strip()
-    open_ports = open_ports.split('\n') if open_ports != "" else []
+    open_ports = [sock['local-address'].rsplit(':', 1)[-1] for sock in __facts__.sockets()
+                  if sock.get('state') == 'LISTEN' and not re.search('127.0.0.1', sock['local-address'])]
     firewall_ports = (_execute_shell_command('iptables -L INPUT -v -n | awk \'FNR > 2 && $11 != "" && $11 ~ /^dpt:/ {print $11}\' | sed -e "s/.*://"')).strip()
     firewall_ports = firewall_ports.split('\n') if firewall_ports != "" else []
     no_firewall_ports = []
@@ -252,7 +309,8 @@ def check_password_fields_not_empty(reason=''):
     '''
     Ensure password fields are not empty
     '''
-    result = _execute_shell_command('cat /etc/shadow | awk -F: \'($2 == "" ) { print $1 " does not have a password "}\'')
+    result = '\n'.join(_field(entry, 0) + ' does not have a password '
+                       for entry in __facts__.shadow() if _field(entry, 1) == '').rstrip()
     return True if result == '' else result
 
 
@@ -260,7 +318,7 @@ def ungrouped_files_or_dir(reason=''):
     '''
     Ensure no ungrouped files or directories exist
     '''
-    result = _execute_shell_command('df --local -P | awk {\'if (NR!=1) print $6\'} | xargs -I \'{}\' find \'{}\' -xdev -nogroup')
+    result = '\n'.join(_find('nogroup', _local_mounts()))
     return True if result == '' else result
 
 
@@ -268,7 +326,7 @@ def unowned_files_or_dir(reason=''):
     '''
     Ensure no unowned files or directories exist
     '''
-    result = _execute_shell_command('df --local -P | awk {\'if (NR!=1) print $6\'} | xargs -I \'{}\' find \'{}\' -xdev -nouser')
+    result = '\n'.join(_find('nouser', _local_mounts()))
     return True if result == '' else result
 
 
@@ -276,7 +334,7 @@ def world_writable_file(reason=''):
     '''
     Ensure no world writable files exist
     '''
-    result = _execute_shell_command('df --local -P | awk {\'if (NR!=1) print $6\'} | xargs -I \'{}\' find \'{}\' -xdev -type f -perm -0002')
+    result = '\n'.join(_find('world_writable_file', _local_mounts()))
     return True if result == '' else result
 
 
@@ -284,7 +342,11 @@ def system_account_non_login(reason=''):
     '''
     Ensure system accounts are non-login
     '''
-    result = _execute_shell_command('egrep -v "^\+" /etc/passwd | awk -F: \'($1!="root" && $1!="sync" && $1!="shutdown" && $1!="halt" && $3<500 && $7!="/sbin/nologin" && $7!="/bin/false") {print}\'')
+    result = '\n'.join(':'.join(entry) for entry in __facts__.passwd()
+                       if not entry[0].startswith('+') and
+                       _field(entry, 0) not in ('root', 'sync', 'shutdown', 'halt') and
+                       _awk_compare(_field(entry, 2), 500) < 0 and
+                       _field(entry, 6) not in ('/sbin/nologin', '/bin/false')).rstrip()
     return True if result == '' else result
 
 
@@ -292,15 +354,16 @@ def sticky_bit_on_world_writable_dirs(reason=''):
     '''
     Ensure sticky bit is set on all world-writable directories
     '''
-    result = _execute_shell_command('df --local -P | awk {\'if (NR!=1) print $6\'} | xargs -I \'{}\' find \'{}\' -xdev -type d \( -perm -0002 -a ! -perm -1000 \) 2>/dev/null')
-    return True if result == '' else "There are failures"
+    result = _find('world_writable_dir_no_sticky', _local_mounts())
+    return True if not result else "There are failures"
 
 
 def default_group_for_root(reason=''):
     '''
     Ensure default group for the root account is GID 0
     '''
-    result = _execute_shell_command('grep "^root:" /etc/passwd | cut -f4 -d:')
+    result = '\n'.join(_field(entry, 3) for entry in __facts__.passwd()
+                       if entry[0] == 'root' and len(entry) > 1)
     result = result.strip()
     return True if result == '0' else False
 
@@ -309,7 +372,8 @@ def root_is_only_uid_0_account(reason=''):
     '''
     Ensure root is the only UID 0 account
     '''
-    result = _execute_shell_command('cat /etc/passwd | awk -F: \'($3 == 0) { print $1 }\'')
+    result = '\n'.join(_field(entry, 0) for entry in __facts__.passwd()
+                       if _awk_compare(_field(entry, 2), 0) == 0)
     return True if result.strip() == 'root' else result
 
 
@@ -356,7 +420,14 @@ def restrict_permissions(path,permission):
     '''
     path_details = __salt__['file.stats'](path)
     given_permission = path_details.get('mode')
-    given_permission = given_permission[-3:]
+    return _check_permissions(given_permission[-3:], permission)
+
+
+def _check_permissions(given_permission, permission):
+    '''
+    Return True if the 3 digit mode ``given_permission`` is equal to or more
+    strict than ``permission``, otherwise ``given_permission``
+    '''
     max_permission = str(permission)
     if (_is_permission_in_limit(max_permission[0],given_permission[0]) and _is_permission_in_limit(max_permission[1],given_permission[1]) and _is_permission_in_limit(max_permission[2],given_permission[2])):
         return True
@@ -413,8 +484,7 @@ def check_duplicate_uids(reason=''):
     '''
     Return False if any duplicate user id exist in /etc/group file, else return True
     '''
-    uids = _execute_shell_command("cat /etc/passwd | cut -f3 -d\":\"").strip()
-    uids = uids.split('\n') if uids != "" else []
+    uids = [_field(entry, 2) for entry in __facts__.passwd()]
     duplicate_uids = [k for k,v in Counter(uids).items() if v>1]
     if duplicate_uids is None or duplicate_uids == []:
         return True
@@ -425,8 +495,7 @@ def check_duplicate_gids(reason=''):
     '''
     Return False if any duplicate group id exist in /etc/group file, else return True
     '''
-    gids = _execute_shell_command("cat /etc/group | cut -f3 -d\":\"").strip()
-    gids = gids.split('\n') if gids != "" else []
+    gids = [_field(entry, 2) for entry in __facts__.group()]
     duplicate_gids = [k for k,v in Counter(gids).items() if v>1]
     if duplicate_gids is None or duplicate_gids == []:
         return True
@@ -437,8 +506,7 @@ def check_duplicate_unames(reason=''):
     '''
     Return False if any duplicate user names exist in /etc/group file, else return True
     '''
-    unames = _execute_shell_command("cat /etc/passwd | cut -f1 -d\":\"").strip()
-    unames = unames.split('\n') if unames != "" else []
+    unames = [_field(entry, 0) for entry in __facts__.passwd()]
     duplicate_unames = [k for k,v in Counter(unames).items() if v>1]
     if duplicate_unames is None or duplicate_unames == []:
         return True
@@ -449,8 +517,7 @@ def check_duplicate_gnames(reason=''):
     '''
     Return False if any duplicate group names exist in /etc/group file, else return True
     '''
-    gnames = _execute_shell_command("cat /etc/group | cut -f1 -d\":\"").strip()
-    gnames = gnames.split('\n') if gnames != "" else []
+    gnames = [_field(entry, 0) for entry in __facts__.group()]
     duplicate_gnames = [k for k,v in Counter(gnames).items() if v>1]
     if duplicate_gnames is None or duplicate_gnames == []:
         return True
@@ -459,13 +526,14 @@ def check_duplicate_gnames(reason=''):
 
 def check_directory_files_permission(path, permission):
     '''
-    Check all files permission inside a directory
+    Check all files permission inside the directory ``path``. (This used to
+    check ``/var/log``, whatever ``path`` was.)
     '''
-    files_list = _execute_shell_command("find /var/log -type f").strip()
-    files_list = files_list.split('\n') if files_list != "" else []
     bad_permission_files = []
-    for file_in_directory in files_list:
-        per = restrict_permissions(file_in_directory, permission)
+    for file_in_directory, pstat in __facts__.files(path, xdev=False):
+        if not stat.S_ISREG(pstat.st_mode):
+            continue
+        per = _check_permissions('{0:03o}'.format(pstat.st_mode & 0o777), permission)
         if per is not True:
             bad_permission_files += [file_in_directory + ": Bad Permission - " + per + ":"]
     return True if bad_permission_files == [] else str(bad_permission_files)
@@ -519,13 +587,11 @@ def check_unowned_files(reason=''):
     Ensure no unowned files or directories exist
     '''
 
-    unowned_files = _execute_shell_command("df --local -P | awk 'NR!=1 {print $6}' | xargs -I '{}' find '{}' -xdev -nouser 2>/dev/null").strip()
-    unowned_files = unowned_files.split('\n') if unowned_files != "" else []
-    # The command above only searches local filesystems, there may still be compromised items on network
+    unowned_files = _find('nouser', _local_mounts())
+    # The search above only covers local filesystems, there may still be compromised items on network
     # mounted partitions.
-    # Following command will check each partition for unowned files
-    unowned_partition_files = _execute_shell_command("mount | awk '{print $3}' | xargs -I '{}' find '{}' -xdev -nouser 2>/dev/null").strip()
-    unowned_partition_files = unowned_partition_files.split('\n') if unowned_partition_files != "" else []
+    # Following search will check each partition for unowned files
+    unowned_partition_files = _find('nouser', __facts__.mounts())
     unowned_files = unowned_files + unowned_partition_files
     return True if unowned_files == [] else str(list(set(unowned_files)))
 
@@ -535,35 +601,181 @@ def check_ungrouped_files(reason=''):
     Ensure no ungrouped files or directories exist
     '''
 
-    ungrouped_files = _execute_shell_command("df --local -P | awk 'NR!=1 {print $6}' | xargs -I '{}' find '{}' -xdev -nogroup 2>/dev/null").strip()
-    ungrouped_files = ungrouped_files.split('\n') if ungrouped_files != "" else []
-    # The command above only searches local filesystems, there may still be compromised items on network
+    ungrouped_files = _find('nogroup', _local_mounts())
+    # The search above only covers local filesystems, there may still be compromised items on network
     # mounted partitions.
-    # Following command will check each partition for unowned files
-    ungrouped_partition_files = _execute_shell_command("mount | awk '{print $3}' | xargs -I '{}' find '{}' -xdev -nogroup 2>/dev/null").strip()
-    ungrouped_partition_files = ungrouped_partition_files.split('\n') if ungrouped_partition_files != "" else []
+    # Following search will check each partition for unowned files
+    ungrouped_partition_files = _find('nogroup', __facts__.mounts())
     ungrouped_files = ungrouped_files + ungrouped_partition_files
     return True if ungrouped_files == [] else str(list(set(ungrouped_files)))
 
 
+def _users(logins_only=False):
+    '''
+    Return the name, uid and home directory of each user in /etc/passwd.
+
+    With ``logins_only``, users whose shell is /sbin/nologin are skipped, as
+    are those whose entry mentions root, halt, sync or shutdown anywhere (as
+    the ``egrep -v`` these checks used to run did).
+    '''
+    ret = []
+    for entry in __facts__.passwd():
+        if logins_only:
+            if _NOT_LOGINS.search(':'.join(entry)) or _field(entry, 6) == '/sbin/nologin':
+                continue
+        ret.append((_field(entry, 0), _field(entry, 2), _field(entry, 5)))
+    return ret
+
+
+_NOT_LOGINS = re.compile('root|halt|sync|shutdown')
+
+# The group and other permission bits on .netrc files, and how they're
+# reported (set-gid and sticky show as execute, as they do in ls -l)
+_NETRC_PERMISSIONS = ((stat.S_IRGRP, 'Group Read'),
+                      (stat.S_IWGRP, 'Group Write'),
+                      (stat.S_IXGRP | stat.S_ISGID, 'Group Execute'),
+                      (stat.S_IROTH, 'Other Read'),
+                      (stat.S_IWOTH, 'Other Write'),
+                      (stat.S_IXOTH | stat.S_ISVTX, 'Other Execute'))
+
+
+def _home(path):
+    '''
+    Return the ``_HomeDir`` for the home directory ``path``, shared by every
+    home directory check for the rest of the audit
+    '''
+    return __facts__.get(('home', path), lambda: _HomeDir(path))
+
+
+class _HomeDir(object):
+    '''
+    A home directory, stat-ed and listed at most once per audit however many
+    checks look at it. Each attribute is only gathered when a check first
+    needs it.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._stat = None
+        self._names = None
+        self._dot_files = None
+
+    @property
+    def stat(self):
+        '''
+        The stat of the home directory (following symlinks)
+        '''
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    @property
+    def mode(self):
+        '''
+        The permissions of the home directory, as 3 octal digits
+        '''
+        return '{0:03o}'.format(self.stat.st_mode & 0o777)
+
+    @property
+    def owner(self):
+        '''
+        The name of the owner of the home directory, like ``stat -L -c %U``
+        '''
+        try:
+            return pwd.getpwuid(self.stat.st_uid).pw_name
+        except KeyError:
+            return 'UNKNOWN'
+
+    def file(self, name):
+        '''
+        The path of the file ``name`` directly in the home directory, if it
+        exists and is a regular file (following symlinks), otherwise None
+        '''
+        if self._names is None:
+            try:
+                self._names = set(os.listdir(self.path))
+            except OSError:
+                self._names = set()
+        if name not in self._names:
+            return None
+        path = os.path.join(self.path, name)
+        return path if os.path.isfile(path) else None
+
+    @property
+    def netrc_mode(self):
+        '''
+        The mode of ``<home>/.netrc``, if it's a regular file and not a
+        symlink, otherwise None
+        '''
+        try:
+            pstat = os.lstat(self.path + '/.netrc')
+        except OSError:
+            return None
+        return pstat.st_mode if stat.S_ISREG(pstat.st_mode) else None
+
+    @property
+    def dot_files(self):
+        '''
+        The path and mode of every regular file (following symlinks) whose
+        name starts with a dot, anywhere under the home directory, in the
+        order ``find <home> -name ".*"`` lists them. The home directory is
+        walked afresh (not from the file index behind ``__facts__.files``),
+        as a chmod of a dot file doesn't change its directory.
+        '''
+        if self._dot_files is None:
+            self._dot_files = []
+            for path, pstat in _find_files(self.path):
+                if not os.path.basename(path).startswith('.'):
+                    continue
+                if stat.S_ISLNK(pstat.st_mode):
+                    try:
+                        pstat = os.stat(path)
+                    except OSError:
+                        continue
+                if stat.S_ISREG(pstat.st_mode):
+                    self._dot_files.append((path, pstat.st_mode))
+        return self._dot_files
+
+
+def _find_files(path, pstat=None):
+    '''
+    Generate the path and lstat of ``path`` and every file under it, in the
+    order ``find <path>`` lists them
+    '''
+    if pstat is None:
+        try:
+            pstat = os.lstat(path)
+        except OSError:
+            return
+    yield path, pstat
+    if not stat.S_ISDIR(pstat.st_mode):
+        return
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return
+    for name in names:
+        entry = os.path.join(path, name)
+        try:
+            entry_stat = os.lstat(entry)
+        except OSError:
+            continue
+        for found in _find_files(entry, entry_stat):
+            yield found
+
+
 def check_all_users_home_directory(max_system_uid):
     '''
     Ensure all users' home directories exist
     '''
 
     max_system_uid = int(max_system_uid)
-    users_uids_dirs = _execute_shell_command("cat /etc/passwd | awk -F: '{ print $1 \" \" $3 \" \" $6 }'").strip()
-    users_uids_dirs = users_uids_dirs.split('\n') if users_uids_dirs != "" else []
     error = []
-    for user_data in users_uids_dirs:
-        user_uid_dir = user_data.strip().split(" ")
-        if len(user_uid_dir) < 3:
-                user_uid_dir = user_uid_dir + ['']*(3-len(user_uid_dir))
-        if user_uid_dir[1].isdigit():
-            if not _is_valid_home_directory(user_uid_dir[2], True) and int(user_uid_dir[1]) >= max_system_uid and user_uid_dir[0] != "nfsnobody":
-                error += ["Either home directory " + user_uid_dir[2] + " of user " + user_uid_dir[0] + " is invalid or does not exist."]
+    for user, uid, home in _users():
+        if uid.isdigit():
+            if not _is_valid_home_directory(home, True) and int(uid) >= max_system_uid and user != "nfsnobody":
+                error += ["Either home directory " + home + " of user " + user + " is invalid or does not exist."]
         else:
-            error += ["User " + user_uid_dir[0] + " has invalid uid " + user_uid_dir[1]]
+            error += ["User " + user + " has invalid uid " + uid]
     return True if error == [] else str(error)
 
 
@@ -572,17 +784,12 @@ def check_users_home_directory_permissions(reason=''):
     Ensure users' home directories permissions are 750 or more restrictive
     '''
 
-    users_dirs = _execute_shell_command("cat /etc/passwd | egrep -v '(root|halt|sync|shutdown)' | awk -F: '($7 != \"/sbin/nologin\") {print $1\" \"$6}'").strip()
-    users_dirs = users_dirs.split('\n') if users_dirs != "" else []
     error = []
-    for user_dir in users_dirs:
-        user_dir = user_dir.split(" ")
-        if len(user_dir) < 2:
-                user_dir = user_dir + ['']*(2-len(user_dir))
-        if _is_valid_home_directory(user_dir[1]):
-            result = restrict_permissions(user_dir[1], "750")
+    for user, _, home in _users(logins_only=True):
+        if _is_valid_home_directory(home):
+            result = _check_permissions(_home(home).mode, "750")
             if result is not True:
-                error += ["permission on home directory " + user_dir[1]  + " of user " + user_dir[0] + " is wrong: " + result]
+                error += ["permission on home directory " + home  + " of user " + user + " is wrong: " + result]
 
     return True if error == [] else str(error)
 
@@ -594,23 +801,18 @@ def check_users_own_their_home(max_system_uid):
 
     max_system_uid = int(max_system_uid)
 
-    users_uids_dirs = _execute_shell_command("cat /etc/passwd | awk -F: '{ print $1 \" \" $3 \" \" $6 }'").strip()
-    users_uids_dirs = users_uids_dirs.split('\n') if users_uids_dirs != "" else []
     error = []
-    for user_data in users_uids_dirs:
-        user_uid_dir = user_data.strip().split(" ")
-        if len(user_uid_dir) < 3:
-            user_uid_dir = user_uid_dir + ['']*(3-len(user_uid_dir))
-        if user_uid_dir[1].isdigit():
-            if not _is_valid_home_directory(user_uid_dir[2]):
-                if int(user_uid_dir[1]) >= max_system_uid:
-                    error += ["Either home directory " + user_uid_dir[2] + " of user " + user_uid_dir[0] + " is invalid or does not exist."]
-            elif int(user_uid_dir[1]) >= max_system_uid and user_uid_dir[0] != "nfsnobody":
-                owner = __salt__['cmd.run']("stat -L -c \"%U\" \"" + user_uid_dir[2] + "\"")
-                if owner != user_uid_dir[0]:
-                    error += ["The home directory " + user_uid_dir[2] + " of user " + user_uid_dir[0] + " is owned by " + owner]
+    for user, uid, home in _users():
+        if uid.isdigit():
+            if not _is_valid_home_directory(home):
+                if int(uid) >= max_system_uid:
+                    error += ["Either home directory " + home + " of user " + user + " is invalid or does not exist."]
+            elif int(uid) >= max_system_uid and user != "nfsnobody":
+                owner = _home(home).owner
+                if owner != user:
+                    error += ["The home directory " + home + " of user " + user + " is owned by " + owner]
         else:
-            error += ["User " + user_uid_dir[0] + " has invalid uid " + user_uid_dir[1]]
+            error += ["User " + user + " has invalid uid " + uid]
 
     return True if error == [] else str(error)
 
@@ -620,25 +822,14 @@ def check_users_dot_files(reason=''):
     Ensure users' dot files are not group or world writable
     '''
 
-    users_dirs = _execute_shell_command("cat /etc/passwd | egrep -v '(root|halt|sync|shutdown)' | awk -F: '($7 != \"/sbin/nologin\") {print $1\" \"$6}'").strip()
-    users_dirs = users_dirs.split('\n') if users_dirs != "" else []
     error = []
-    for user_dir in users_dirs:
-        user_dir = user_dir.split()
-        if len(user_dir) < 2:
-                user_dir = user_dir + ['']*(2-len(user_dir))
-        if _is_valid_home_directory(user_dir[1]):
-            dot_files = _execute_shell_command("find " + user_dir[1] + " -name \".*\"").strip()
-            dot_files = dot_files.split('\n') if dot_files != "" else []
-            for dot_file in dot_files:
-                if os.path.isfile(dot_file):
-                    path_details = __salt__['file.stats'](dot_file)
-                    given_permission = path_details.get('mode')
-                    file_permission = given_permission[-3:]
-                    if file_permission[1] in ["2", "3", "6", "7"]:
-                        error += ["Group Write permission set on file " + dot_file + " for user " + user_dir[0]]
-                    if file_permission[2] in ["2", "3", "6", "7"]:
-                        error += ["Other Write permission set on file " + dot_file + " for user " + user_dir[0]]
+    for user, _, home in _users(logins_only=True):
+        if _is_valid_home_directory(home):
+            for dot_file, mode in _home(home).dot_files:
+                if mode & stat.S_IWGRP:
+                    error += ["Group Write permission set on file " + dot_file + " for user " + user]
+                if mode & stat.S_IWOTH:
+                    error += ["Other Write permission set on file " + dot_file + " for user " + user]
 
     return True if error == [] else str(error)
 
@@ -648,17 +839,12 @@ def check_users_forward_files(reason=''):
     Ensure no users have .forward files
     '''
 
-    users_dirs = _execute_shell_command("cat /etc/passwd | awk -F: '{ print $1\" \"$6 }'").strip()
-    users_dirs = users_dirs.split('\n') if users_dirs != "" else []
     error = []
-    for user_dir in users_dirs:
-        user_dir = user_dir.split()
-        if len(user_dir) < 2:
-                user_dir = user_dir + ['']*(2-len(user_dir))
-        if _is_valid_home_directory(user_dir[1]):
-            forward_file = _execute_shell_command("find " + user_dir[1] + " -maxdepth 1 -name \".forward\"").strip()
-            if forward_file is not None and os.path.isfile(forward_file):
-                error += ["Home directory: " + user_dir[1] + ", for user: " + user_dir[0] + " has " + forward_file + " file"]
+    for user, _, home in _users():
+        if _is_valid_home_directory(home):
+            forward_file = _home(home).file('.forward')
+            if forward_file is not None:
+                error += ["Home directory: " + home + ", for user: " + user + " has " + forward_file + " file"]
 
     return True if error == [] else str(error)
 
@@ -668,17 +854,11 @@ def check_users_netrc_files(reason=''):
     Ensure no users have .netrc files
     '''
 
-    users_dirs = _execute_shell_command("cat /etc/passwd | awk -F: '{ print $1\" \"$6 }'").strip()
-    users_dirs = users_dirs.split('\n') if users_dirs != "" else []
     error = []
-    for user_dir in users_dirs:
-        user_dir = user_dir.split()
-        if len(user_dir) < 2:
-                user_dir = user_dir + ['']*(2-len(user_dir))
-        if _is_valid_home_directory(user_dir[1]):
-            netrc_file = _execute_shell_command("find " + user_dir[1] + " -maxdepth 1 -name \".netrc\"").strip()
-            if netrc_file is not None and os.path.isfile(netrc_file):
-                error += ["Home directory: " + user_dir[1] + ", for user: " + user_dir[0] + " has .netrc file"]
+    for user, _, home in _users():
+        if _is_valid_home_directory(home):
+            if _home(home).file('.netrc') is not None:
+                error += ["Home directory: " + home + ", for user: " + user + " has .netrc file"]
 
     return True if error == [] else str(error)
 
@@ -688,13 +868,11 @@ def check_groups_validity(reason=''):
     Ensure all groups in /etc/passwd exist in /etc/group
     '''
 
-    group_ids_in_passwd = _execute_shell_command("cut -s -d: -f4 /etc/passwd 2>/dev/null").strip()
-    group_ids_in_passwd = group_ids_in_passwd.split('\n') if group_ids_in_passwd != "" else []
+    group_ids_in_passwd = [_field(entry, 3) for entry in __facts__.passwd() if len(entry) > 1]
     group_ids_in_passwd = list(set(group_ids_in_passwd))
     invalid_groups = []
     for group_id in group_ids_in_passwd:
-        group_presence_validity = _execute_shell_command("getent group " + group_id + " 2>/dev/null 1>/dev/null; echo $?").strip()
-        if str(group_presence_validity) != "0":
+        if not _group_exists(group_id):
             invalid_groups += ["Invalid groupid: " + group_id + " in /etc/passwd file"]
 
     return True if invalid_groups == [] else str(invalid_groups)
@@ -732,17 +910,11 @@ def check_users_rhosts_files(reason=''):
     Ensure no users have .rhosts files
     '''
 
-    users_dirs = _execute_shell_command("cat /etc/passwd | egrep -v '(root|halt|sync|shutdown)' | awk -F: '($7 != \"/sbin/nologin\") {print $1\" \"$6}'").strip()
-    users_dirs = users_dirs.split('\n') if users_dirs != "" else []
     error = []
-    for user_dir in users_dirs:
-        user_dir = user_dir.split()
-        if len(user_dir) < 2:
-            user_dir = user_dir + ['']*(2-len(user_dir))
-        if _is_valid_home_directory(user_dir[1]):
-            rhosts_file = _execute_shell_command("find " + user_dir[1] + " -maxdepth 1 -name \".rhosts\"").strip()
-            if rhosts_file is not None and os.path.isfile(rhosts_file):
-                error += ["Home directory: " + user_dir[1] + ", for user: " + user_dir[0] + " has .rhosts file"]
+    for user, _, home in _users(logins_only=True):
+        if _is_valid_home_directory(home):
+            if _home(home).file('.rhosts') is not None:
+                error += ["Home directory: " + home + ", for user: " + user + " has .rhosts file"]
     return True if error == [] else str(error)
 
 
@@ -751,36 +923,18 @@ def check_netrc_files_accessibility(reason=''):
     Ensure users' .netrc Files are not group or world accessible
     '''
 
-    script = """
-    for dir in `cat /etc/passwd | egrep -v '(root|sync|halt|shutdown)' | awk -F: '($7 != "/sbin/nologin") { print $6 }'`; do
-      for file in $dir/.netrc; do
-        if [ ! -h "$file" -a -f "$file" ]; then
-          fileperm=`ls -ld $file | cut -f1 -d" "`
-          if [ `echo $fileperm | cut -c5` != "-" ]; then
-            echo "Group Read set on $file"
-          fi
-          if [ `echo $fileperm | cut -c6` != "-" ]; then
-            echo "Group Write set on $file"
-          fi
-          if [ `echo $fileperm | cut -c7` != "-" ]; then
-            echo "Group Execute set on $file"
-          fi
-          if [ `echo $fileperm | cut -c8` != "-" ]; then
-            echo "Other Read set on $file"
-          fi
-          if [ `echo $fileperm | cut -c9` != "-" ]; then
-            echo "Other Write set on $file"
-          fi
-          if [ `echo $fileperm | cut -c10` != "-" ]; then
-            echo "Other Execute set on $file"
-          fi
-        fi
-      done
-    done
-
-    """
-    output = _execute_shell_command(script)
-    return True if output.strip() == '' else output
+    output = []
+    for _, _, home in _users(logins_only=True):
+        if not home.strip():
+            continue
+        netrc_file = home + '/.netrc'
+        mode = _home(home).netrc_mode
+        if mode is None:
+            continue
+        for bits, message in _NETRC_PERMISSIONS:
+            if mode & bits:
+                output.append(message + " set on " + netrc_file)
+    return True if not output else '\n'.join(output)
 
 
 def _grep(path,
@@ -919,7 +1073,7 @@ def check_if_any_pkg_installed(args):
     '''
     result = False
     for pkg in args.split(','):
-        if __salt__['pkg.version'](pkg):
+        if __facts__.package_version(pkg):
             result = True
             break
     return result
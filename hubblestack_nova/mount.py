@@ -33,7 +33,6 @@ mount:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
 import os
 import copy
@@ -44,6 +43,9 @@ from distutils.version import LooseVersion
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('mount',)
+__nova_tags__ = {'toplists': ('blacklist', 'whitelist')}
+
 
 def __virtual__():
     if salt.utils.is_windows():
@@ -56,22 +58,18 @@ def audit(data_list, tags, debug=False, **kwargs):
     Run the mount audits contained in the YAML files processed by __virtual__
     '''
 
-    __data__ = {}
-
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'mount', **__nova_tags__)
 
     if debug:
-        log.debug('mount audit __data__:')
-        log.debug(__data__)
+        log.debug('mount audit data_list:')
+        log.debug(data_list)
         log.debug('mount audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -120,79 +118,6 @@ def audit(data_list, tags, debug=False, **kwargs):
     return ret
 
 
-def _merge_yaml(ret, data, profile=None):
-    '''
-    Merge two yaml dicts together at the mount:blacklist and mount:whitelist level
-    '''
-    if 'mount' not in ret:
-        ret['mount'] = {}
-    for topkey in ('blacklist', 'whitelist'):
-        if topkey in data.get('mount', {}):
-            if topkey not in ret['mount']:
-                ret['mount'][topkey] = []
-            for key, val in data['mount'][topkey].iteritems():
-                if profile and isinstance(val, dict):
-                    val['nova_profile'] = profile
-                ret['mount'][topkey].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
-    '''
-
-    ret = {}
-    distro = __grains__.get('osfinger')
-
-    for toplist, toplevel in data.get('mount', {}).iteritems():
-        # mount:blacklist
-        for audit_dict in toplevel:
-            # mount:blacklist:0
-            for audit_id, audit_data in audit_dict.iteritems():
-                # mount:blacklist:0:telnet
-                tags_dict = audit_data.get('data', {})
-                # mount:blacklist:0:telnet:data
-                tags = None
-                for osfinger in tags_dict:
-                    if osfinger == '*':
-                        continue
-                    osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                    for osfinger_glob in osfinger_list:
-                        if fnmatch.fnmatch(distro, osfinger_glob):
-                            tags = tags_dict.get(osfinger)
-                            break
-                    if tags is not None:
-                        break
-                # If we didn't find a match, check for a '*'
-                if tags is None:
-                    tags = tags_dict.get('*', [])
-                # mount:blacklist:0:telnet:data:Debian-8
-                if isinstance(tags, dict):
-                    # malformed yaml, convert to list of dicts
-                    tmp = []
-                    for name, tag in tags.iteritems():
-                        tmp.append({name: tag})
-                    tags = tmp
-                for item in tags:
-                    for name, tag in item.iteritems():
-                        tag_data = {}
-                        # Whitelist could have a dictionary, not a string
-                        if isinstance(tag, dict):
-                            tag_data = copy.deepcopy(tag)
-                            tag = tag_data.pop('tag')
-                        if tag not in ret:
-                            ret[tag] = []
-                        formatted_data = {'name': name,
-                                          'tag': tag,
-                                          'module': 'mount',
-                                          'type': toplist}
-                        formatted_data.update(tag_data)
-                        formatted_data.update(audit_data)
-                        formatted_data.pop('data')
-                        ret[tag].append(formatted_data)
-    return ret
-
 def _check_mount_attribute(path,attribute, check_type):
     '''
     This function checks if the partition at a given path is mounted with a particular attribute or not.
@@ -207,7 +132,7 @@ def _check_mount_attribute(path,attribute, check_type):
             return True
 
 
-    mount_object  = __salt__['mount.active']()
+    mount_object  = __facts__.mounts()
 
     if path in mount_object:
         attributes = mount_object.get(path)
@@ -222,4 +147,3 @@ def _check_mount_attribute(path,attribute, check_type):
             return False
         else:
             return True
-
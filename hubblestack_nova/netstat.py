@@ -24,11 +24,14 @@ from __future__ import absolute_import
 import copy
 import fnmatch
 import logging
+import re
 
 import salt.utils
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('netstat',)
+
 
 def __virtual__():
     if 'network.netstat' in __salt__:
@@ -60,11 +63,17 @@ def audit(data_list, tags, debug=True, **kwargs):
         # No yaml data found, don't do any work
         return ret
 
-    for address_data in __salt__['network.netstat']():
+    # Compile each address glob once, rather than once per socket
+    matchers = [(whitelisted_address, re.compile(fnmatch.translate(whitelisted_address)).match)
+                for whitelisted_address in __tags__]
+
+    for address_data in __facts__.sockets():
+        # The sockets are shared with other modules
+        address_data = dict(address_data)
 
         success = False
-        for whitelisted_address in __tags__:
-            if fnmatch.fnmatch(address_data['local-address'], whitelisted_address):
+        for whitelisted_address, match in matchers:
+            if match(address_data['local-address']):
                 address_data.update({
                     'tag': __tags__[whitelisted_address]['address'][0],
                     'description': __tags__[whitelisted_address]['id'],
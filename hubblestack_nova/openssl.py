@@ -62,6 +62,14 @@ Some notes:
       each check
     - the YAML supports also the control key, just as the other modules do
 
+Endpoint certificates are all fetched at once, before any check is run, on up to
+hubblestack:nova:openssl:workers threads (10 by default). Each connection times out after
+hubblestack:nova:openssl:timeout seconds (10), and endpoints not fetched within hubblestack:nova:openssl:deadline
+seconds (60) fail with the reason 'Timed out retrieving the certificate'. Fetched certificates are reused for
+hubblestack:nova:openssl:cache_ttl seconds (3600; 0 to disable), and are saved in the minion cachedir so that audits
+run as separate minion jobs can reuse them too. Certificates loaded from files are reused until the file changes, but
+only within the same process.
+
 Known issues: for unknown reasons (yet), the module can fail downloading the certificate from certain endpoints. When
 this happens, the check will be failed.
 
@@ -70,13 +78,20 @@ this happens, the check will be failed.
 from __future__ import absolute_import
 import logging
 
-import fnmatch
-import copy
 import salt.utils
 import datetime
+import os
+import socket
+import tempfile
 import time
 
 import ssl
+from multiprocessing.pool import ThreadPool
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 try:
     import OpenSSL
@@ -87,9 +102,19 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('openssl',)
+__nova_tags__ = {'layout': 'flat'}
+
 __tags__ = None
 __data__ = None
 
+_CONFIG_DEFAULTS = {'workers': 10, 'timeout': 10, 'deadline': 60, 'cache_ttl': 3600}
+
+# Loaded x509 objects, by source: (fetch time, x509, pem) for endpoints and
+# ((mtime, size), x509) for files. Only lives as long as the process; the
+# endpoint pems are also saved to _endpoint_cache_path()
+_X509_CACHE = {}
+
 
 def __virtual__():
     if salt.utils.is_windows():
@@ -100,20 +125,19 @@ def __virtual__():
 
 
 def audit(data_list, tags, debug=True, **kwargs):
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'openssl', **__nova_tags__)
 
     if debug:
-        log.debug('service audit __data__:')
-        log.debug(__data__)
+        log.debug('service audit data_list:')
+        log.debug(data_list)
         log.debug('service audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
+    checks = []
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -121,10 +145,6 @@ def audit(data_list, tags, debug=True, **kwargs):
 
                 endpoint = tag_data.get('endpoint', None)
                 pem_file = tag_data.get('file', None)
-                not_after = tag_data.get('not_after', 0)
-                not_before = tag_data.get('not_before', 0)
-                port = tag_data.get('port', 443)
-                fail_if_not_before = tag_data.get('fail_if_not_before', False)
 
                 if not endpoint and not pem_file:
                     failing_reason = 'No certificate to be checked'
@@ -138,49 +158,197 @@ def audit(data_list, tags, debug=True, **kwargs):
                     ret['Failure'].append(tag_data)
                     continue
 
-                cert = _get_cert(endpoint, port) if endpoint else _get_cert(pem_file, from_file=True)
-                x509 = _load_x509(cert)
-                (passed, failing_reason) = _check_x509(x509=x509,
-                                                       not_before=not_before,
-                                                       not_after=not_after,
-                                                       fail_if_not_before=fail_if_not_before)
-
-                if passed:
-                    ret['Success'].append(tag_data)
-                else:
-                    tag_data['reason'] = failing_reason
-                    ret['Failure'].append(tag_data)
+                checks.append((tag, tag_data))
+
+    # Every certificate is fetched up front, so the endpoints can be fetched
+    # at once; that time isn't attributed to any one tag
+    __timing__.tag(None)
+    x509s = _get_x509s([_source(tag_data) for _, tag_data in checks])
+
+    for tag, tag_data in checks:
+        __timing__.tag(tag)
+        not_after = tag_data.get('not_after', 0)
+        not_before = tag_data.get('not_before', 0)
+        fail_if_not_before = tag_data.get('fail_if_not_before', False)
+
+        x509, failing_reason = x509s[_source(tag_data)]
+        if failing_reason:
+            passed = False
+        else:
+            (passed, failing_reason) = _check_x509(x509=x509,
+                                                   not_before=not_before,
+                                                   not_after=not_after,
+                                                   fail_if_not_before=fail_if_not_before)
+
+        if passed:
+            ret['Success'].append(tag_data)
+        else:
+            tag_data['reason'] = failing_reason
+            ret['Failure'].append(tag_data)
 
     return ret
 
 
-def _merge_yaml(ret, data, profile=None):
-    if 'openssl' not in ret:
-        ret['openssl'] = []
-    for key, val in data.get('openssl', {}).iteritems():
-        if profile and isinstance(val, dict):
-            val['nova_profile'] = profile
-        ret['openssl'].append({key: val})
-    return ret
+def _source(tag_data):
+    '''
+    Return a hashable key for the certificate a check audits: the endpoint
+    and port, or the pem file
+    '''
+    if tag_data.get('endpoint', None):
+        return ('endpoint', tag_data['endpoint'], tag_data.get('port', 443))
+    return ('file', tag_data['file'])
+
 
+def _config(name):
+    return __salt__['config.get']('hubblestack:nova:openssl:{0}'.format(name),
+                                  _CONFIG_DEFAULTS[name])
 
-def _get_tags(data):
+
+def _get_x509s(sources):
+    '''
+    Return a dict of each of ``sources`` (as returned by ``_source``) to a
+    tuple of its x509 object (None if it couldn't be loaded) and a failing
+    reason, if the certificate couldn't be fetched in time.
+
+    Endpoints are fetched concurrently, on up to
+    ``hubblestack:nova:openssl:workers`` threads. Each connection times out
+    after ``hubblestack:nova:openssl:timeout`` seconds, and any endpoint not
+    fetched within ``hubblestack:nova:openssl:deadline`` seconds of the start
+    is given up on, so unreachable endpoints can't stall the audit.
+    '''
     ret = {}
-    for audit_dict in data.get('openssl', {}):
-        for audit_id, audit_data in audit_dict.iteritems():
-            tags_dict = audit_data.get('data', {})
-            tag = tags_dict.pop('tag')
-            if tag not in ret:
-                ret[tag] = []
-            formatted_data = copy.deepcopy(tags_dict)
-            formatted_data['tag'] = tag
-            formatted_data['module'] = 'openssl'
-            formatted_data.update(audit_data)
-            formatted_data.pop('data')
-            ret[tag].append(formatted_data)
+    endpoints = []
+    saved = None
+    ttl = _config('cache_ttl')
+    for source in set(sources):
+        if source[0] == 'file':
+            ret[source] = (_get_x509_from_file(source[1]), None)
+            continue
+        cached = _X509_CACHE.get(source)
+        if ttl and not (cached and time.time() - cached[0] < ttl):
+            # Not fetched by this process yet, but maybe by an earlier job
+            if saved is None:
+                saved = _load_endpoint_cache()
+            if source in saved and time.time() - saved[source][0] < ttl:
+                fetched, pem = saved[source]
+                cached = _X509_CACHE[source] = (fetched, _load_x509(pem), pem)
+        if cached and ttl and time.time() - cached[0] < ttl:
+            ret[source] = (cached[1], None)
+        else:
+            endpoints.append(source)
+    if not endpoints:
+        return ret
+
+    workers = int(_config('workers') or 1)
+    timeout = _config('timeout') or None
+    deadline = _config('deadline')
+    give_up = time.time() + deadline if deadline else None
+
+    pool = ThreadPool(min(workers, len(endpoints)))
+    timed_out = False
+    try:
+        pending = [(source, pool.apply_async(_get_x509_from_endpoint,
+                                             (source[1], source[2], timeout)))
+                   for source in endpoints]
+        for source, async_ret in pending:
+            async_ret.wait(max(give_up - time.time(), 0) if give_up else None)
+            if async_ret.ready():
+                ret[source] = (async_ret.get(), None)
+            else:
+                log.error('Timed out retrieving certificate from {0}'.format(source[1]))
+                timed_out = True
+                ret[source] = (None, 'Timed out retrieving the certificate')
+    finally:
+        if timed_out:
+            # Threads can't be killed; leave the stragglers to finish on
+            # their own rather than blocking on them
+            pool.terminate()
+        else:
+            pool.close()
+            pool.join()
+
+    if ttl:
+        _save_endpoint_cache(saved, [source for source in endpoints
+                                     if ret[source][0] is not None], ttl)
     return ret
 
 
+def _get_x509_from_endpoint(server, port=443, timeout=None):
+    '''
+    Fetch and load the certificate of ``server``. Loaded certificates are
+    cached for ``hubblestack:nova:openssl:cache_ttl`` seconds, so repeated
+    audits don't redo the handshake.
+    '''
+    cert = _get_cert_from_endpoint(server, port, timeout)
+    x509 = _load_x509(cert)
+    if x509 is not None:
+        _X509_CACHE[('endpoint', server, port)] = (time.time(), x509, cert)
+    return x509
+
+
+def _endpoint_cache_path():
+    return os.path.join(__opts__['cachedir'], 'hubble', 'nova_openssl')
+
+
+def _load_endpoint_cache():
+    '''
+    Return the endpoint certificates saved by earlier audits, as a mapping
+    of source -> (fetch time, pem)
+    '''
+    try:
+        with open(_endpoint_cache_path(), 'rb') as fh_:
+            return pickle.load(fh_)
+    except Exception:
+        return {}
+
+
+def _save_endpoint_cache(saved, sources, ttl):
+    '''
+    Add the certificates just fetched from ``sources`` to the saved endpoint
+    certificates (``saved``, if they've already been loaded), dropping those
+    older than ``ttl``
+    '''
+    if not sources:
+        return
+    if saved is None:
+        saved = _load_endpoint_cache()
+    now = time.time()
+    saved = dict((source, entry) for source, entry in saved.items()
+                 if now - entry[0] < ttl)
+    for source in sources:
+        fetched, _, pem = _X509_CACHE[source]
+        saved[source] = (fetched, pem)
+    path = _endpoint_cache_path()
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        fd_, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd_, 'wb') as fh_:
+            pickle.dump(saved, fh_, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as exc:
+        log.error('Unable to save the openssl certificate cache: {0}'.format(exc))
+
+
+def _get_x509_from_file(cert_file_path):
+    '''
+    Read and load the certificate in ``cert_file_path``. The loaded
+    certificate is cached until the file's mtime or size changes.
+    '''
+    try:
+        stat = os.stat(cert_file_path)
+    except OSError:
+        log.error('File not found: {0}'.format(cert_file_path))
+        return None
+    key = (stat.st_mtime, stat.st_size)
+    cached = _X509_CACHE.get(('file', cert_file_path))
+    if cached and cached[0] == key:
+        return cached[1]
+    x509 = _load_x509(_get_cert_from_file(cert_file_path))
+    _X509_CACHE[('file', cert_file_path)] = (key, x509)
+    return x509
+
+
 def _check_x509(x509=None, not_before=0, not_after=0, fail_if_not_before=False):
     if not x509:
         log.error('No certificate to be checked')
@@ -223,17 +391,23 @@ def _load_x509(cert):
     return x509
 
 
-def _get_cert(source, port=443, from_file=False):
-    cert = _get_cert_from_file(source) if from_file else _get_cert_from_endpoint(source, port)
-    return cert
-
-
-def _get_cert_from_endpoint(server, port=443):
+def _get_cert_from_endpoint(server, port=443, timeout=None):
+    sock = None
     try:
-        cert = ssl.get_server_certificate((server, port))
+        sock = socket.create_connection((server, port), timeout)
+        if hasattr(ssl, 'SSLContext'):
+            # Same as ssl.get_server_certificate, which has no timeout
+            context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            sock = context.wrap_socket(sock, server_hostname=server)
+        else:
+            sock = ssl.wrap_socket(sock)
+        cert = ssl.DER_cert_to_PEM_cert(sock.getpeercert(True))
     except Exception:
         log.error('Unable to retrieve certificate from {0}'.format(server))
         cert = None
+    finally:
+        if sock is not None:
+            sock.close()
     if not cert:
         return None
 
@@ -62,7 +62,6 @@ pkg:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
 import os
 import copy
@@ -72,6 +71,9 @@ from distutils.version import LooseVersion
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('pkg',)
+__nova_tags__ = {'toplists': ('blacklist', 'whitelist')}
+
 
 def __virtual__():
     if salt.utils.is_windows():
@@ -83,30 +85,31 @@ def audit(data_list, tags, debug=False, **kwargs):
     '''
     Run the pkg audits contained in the YAML files processed by __virtual__
     '''
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'pkg', **__nova_tags__)
 
     if debug:
-        log.debug('pkg audit __data__:')
-        log.debug(__data__)
+        log.debug('pkg audit data_list:')
+        log.debug(data_list)
         log.debug('pkg audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
+    wanted = {}
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
                     continue
                 name = tag_data['name']
                 audittype = tag_data['type']
+                # Like pkg.version, name may be a glob
+                version = __facts__.package_version(name)
 
                 # Blacklisted packages (must not be installed)
                 if audittype == 'blacklist':
-                    if __salt__['pkg.version'](name):
+                    if version:
                         ret['Failure'].append(tag_data)
                     else:
                         ret['Success'].append(tag_data)
@@ -114,28 +117,28 @@ def audit(data_list, tags, debug=False, **kwargs):
                 # Whitelisted packages (must be installed)
                 elif audittype == 'whitelist':
                     if 'version' in tag_data:
-                        mod, _, version = tag_data['version'].partition('=')
-                        if not version:
-                            version = mod
+                        mod, _, required = tag_data['version'].partition('=')
+                        if not required:
+                            required = mod
                             mod = ''
 
-                        if mod == '<':
-                            if (LooseVersion(__salt__['pkg.version'](name)) <=
-                                    LooseVersion(version)):
-                                ret['Success'].append(tag_data)
-                            else:
+                        if mod in ('<', '>'):
+                            if required not in wanted:
+                                wanted[required] = LooseVersion(required)
+                            loose = _loose_version(version)
+                            if loose is None:
+                                # Not installed, so no version can satisfy it
                                 ret['Failure'].append(tag_data)
-
-                        elif mod == '>':
-                            if (LooseVersion(__salt__['pkg.version'](name)) >=
-                                    LooseVersion(version)):
+                            elif mod == '<' and loose <= wanted[required]:
+                                ret['Success'].append(tag_data)
+                            elif mod == '>' and loose >= wanted[required]:
                                 ret['Success'].append(tag_data)
                             else:
                                 ret['Failure'].append(tag_data)
 
                         elif not mod:
                             # Just peg to the version, no > or <
-                            if __salt__['pkg.version'](name) == version:
+                            if version == required:
                                 ret['Success'].append(tag_data)
                             else:
                                 ret['Failure'].append(tag_data)
@@ -150,7 +153,7 @@ def audit(data_list, tags, debug=False, **kwargs):
                             ret['Failure'].append(tag_data)
 
                     else:  # No version checking
-                        if __salt__['pkg.version'](name):
+                        if version:
                             ret['Success'].append(tag_data)
                         else:
                             ret['Failure'].append(tag_data)
@@ -158,73 +161,11 @@ def audit(data_list, tags, debug=False, **kwargs):
     return ret
 
 
-def _merge_yaml(ret, data, profile=None):
+def _loose_version(version):
     '''
-    Merge two yaml dicts together at the pkg:blacklist and pkg:whitelist level
+    Return the parsed ``LooseVersion`` of the installed ``version``, or None
+    if it's empty (not installed). Each version is parsed once per audit.
     '''
-    if 'pkg' not in ret:
-        ret['pkg'] = {}
-    for topkey in ('blacklist', 'whitelist'):
-        if topkey in data.get('pkg', {}):
-            if topkey not in ret['pkg']:
-                ret['pkg'][topkey] = []
-            for key, val in data['pkg'][topkey].iteritems():
-                if profile and isinstance(val, dict):
-                    val['nova_profile'] = profile
-                ret['pkg'][topkey].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
-    '''
-    ret = {}
-    distro = __grains__.get('osfinger')
-    for toplist, toplevel in data.get('pkg', {}).iteritems():
-        # pkg:blacklist
-        for audit_dict in toplevel:
-            # pkg:blacklist:0
-            for audit_id, audit_data in audit_dict.iteritems():
-                # pkg:blacklist:0:telnet
-                tags_dict = audit_data.get('data', {})
-                # pkg:blacklist:0:telnet:data
-                tags = None
-                for osfinger in tags_dict:
-                    if osfinger == '*':
-                        continue
-                    osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                    for osfinger_glob in osfinger_list:
-                        if fnmatch.fnmatch(distro, osfinger_glob):
-                            tags = tags_dict.get(osfinger)
-                            break
-                    if tags is not None:
-                        break
-                # If we didn't find a match, check for a '*'
-                if tags is None:
-                    tags = tags_dict.get('*', [])
-                # pkg:blacklist:0:telnet:data:Debian-8
-                if isinstance(tags, dict):
-                    # malformed yaml, convert to list of dicts
-                    tmp = []
-                    for name, tag in tags.iteritems():
-                        tmp.append({name: tag})
-                    tags = tmp
-                for item in tags:
-                    for name, tag in item.iteritems():
-                        tag_data = {}
-                        # Whitelist could have a dictionary, not a string
-                        if isinstance(tag, dict):
-                            tag_data = copy.deepcopy(tag)
-                            tag = tag_data.pop('tag')
-                        if tag not in ret:
-                            ret[tag] = []
-                        formatted_data = {'name': name,
-                                          'tag': tag,
-                                          'module': 'pkg',
-                                          'type': toplist}
-                        formatted_data.update(tag_data)
-                        formatted_data.update(audit_data)
-                        formatted_data.pop('data')
-                        ret[tag].append(formatted_data)
-    return ret
+    if not version:
+        return None
+    return __facts__.get(('pkg_loose_version', version), lambda: LooseVersion(version))
@@ -13,6 +13,8 @@ import logging
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('pkgng_audit',)
+
 
 def __virtual__():
     if 'FreeBSD' not in __grains__['os']:
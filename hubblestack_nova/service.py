@@ -55,16 +55,17 @@ service:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
 import os
-import copy
 import salt.utils
 
 from distutils.version import LooseVersion
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('service',)
+__nova_tags__ = {'toplists': ('blacklist', 'whitelist')}
+
 
 def __virtual__():
     if salt.utils.is_windows():
@@ -76,20 +77,18 @@ def audit(data_list, tags, debug=False, **kwargs):
     '''
     Run the service audits contained in the YAML files processed by __virtual__
     '''
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'service', **__nova_tags__)
 
     if debug:
-        log.debug('service audit __data__:')
-        log.debug(__data__)
+        log.debug('service audit data_list:')
+        log.debug(data_list)
         log.debug('service audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -99,82 +98,16 @@ def audit(data_list, tags, debug=False, **kwargs):
 
                 # Blacklisted packages (must not be installed)
                 if audittype == 'blacklist':
-                    if __salt__['service.status'](name):
+                    if __facts__.service_running(name):
                         ret['Failure'].append(tag_data)
                     else:
                         ret['Success'].append(tag_data)
 
                 # Whitelisted packages (must be installed)
                 elif audittype == 'whitelist':
-                    if __salt__['service.status'](name):
+                    if __facts__.service_running(name):
                         ret['Success'].append(tag_data)
                     else:
                         ret['Failure'].append(tag_data)
 
     return ret
-
-
-def _merge_yaml(ret, data, profile=None):
-    '''
-    Merge two yaml dicts together at the service:blacklist and service:whitelist level
-    '''
-    if 'service' not in ret:
-        ret['service'] = {}
-    for topkey in ('blacklist', 'whitelist'):
-        if topkey in data.get('service', {}):
-            if topkey not in ret['service']:
-                ret['service'][topkey] = []
-            for key, val in data['service'][topkey].iteritems():
-                if profile and isinstance(val, dict):
-                    val['nova_profile'] = profile
-                ret['service'][topkey].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
-    '''
-    ret = {}
-    distro = __grains__.get('osfinger')
-    for toplist, toplevel in data.get('service', {}).iteritems():
-        # service:blacklist
-        for audit_dict in toplevel:
-            # service:blacklist:0
-            for audit_id, audit_data in audit_dict.iteritems():
-                # service:blacklist:0:telnet
-                tags_dict = audit_data.get('data', {})
-                # service:blacklist:0:telnet:data
-                tags = None
-                for osfinger in tags_dict:
-                    if osfinger == '*':
-                        continue
-                    osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                    for osfinger_glob in osfinger_list:
-                        if fnmatch.fnmatch(distro, osfinger_glob):
-                            tags = tags_dict.get(osfinger)
-                            break
-                    if tags is not None:
-                        break
-                # If we didn't find a match, check for a '*'
-                if tags is None:
-                    tags = tags_dict.get('*', [])
-                # service:blacklist:0:telnet:data:Debian-8
-                if isinstance(tags, dict):
-                    # malformed yaml, convert to list of dicts
-                    tmp = []
-                    for name, tag in tags.iteritems():
-                        tmp.append({name: tag})
-                    tags = tmp
-                for item in tags:
-                    for name, tag in item.iteritems():
-                        if tag not in ret:
-                            ret[tag] = []
-                        formatted_data = {'name': name,
-                                          'tag': tag,
-                                          'module': 'service',
-                                          'type': toplist}
-                        formatted_data.update(audit_data)
-                        formatted_data.pop('data')
-                        ret[tag].append(formatted_data)
-    return ret
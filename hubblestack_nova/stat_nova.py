@@ -42,10 +42,11 @@ stat:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
+import grp
 import os
-import copy
+import pwd
+import stat
 import salt.utils
 
 from distutils.version import LooseVersion
@@ -53,6 +54,8 @@ from distutils.version import LooseVersion
 log = logging.getLogger(__name__)
 
 __virtualname__ = 'stat'
+__nova_keys__ = (__virtualname__,)
+__nova_tags__ = {}
 
 def __virtual__():
     if salt.utils.is_windows():
@@ -64,21 +67,24 @@ def audit(data_list, tags, debug=False, **kwargs):
     '''
     Run the stat audits contained in the YAML files processed by __virtual__
     '''
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, __virtualname__, **__nova_tags__)
 
     if debug:
-        log.debug('service audit __data__:')
-        log.debug(__data__)
+        log.debug('service audit data_list:')
+        log.debug(data_list)
         log.debug('service audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
 
+    # Stat every file up front, in one pass
+    stats = _stats([tag_data['name']
+                    for tag in __tags__ if __matcher__.tag(tag, tags)
+                    for tag_data in __tags__[tag] if 'control' not in tag_data])
+
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -97,8 +103,7 @@ def audit(data_list, tags, debug=False, **kwargs):
                     ret['Failure'].append(tag_data)
                     continue
 
-                #getting the stats using salt
-                salt_ret = __salt__['file.stats'](name)
+                salt_ret = stats[name]
                 if not salt_ret:
                     if None in expected.values():
                         ret['Success'].append(tag_data)
@@ -151,63 +156,44 @@ def audit(data_list, tags, debug=False, **kwargs):
     return ret
 
 
-
-def _merge_yaml(ret, data, profile=None):
+def _stats(names):
     '''
-    Merge two yaml dicts together
-    '''
-    if 'stat' not in ret:
-        ret['stat'] = []
-    for key, val in data.get('stat', {}).iteritems():
-        if profile and isinstance(val, dict):
-            val['nova_profile'] = profile
-        ret['stat'].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
+    Return a dict of each path in ``names`` to its mode, uid, gid, user and
+    group, in the same formats as ``file.stats`` (or an empty dict if it
+    doesn't exist). Only these fields are gathered, and user and group names
+    are looked up once for each uid and gid.
     '''
+    users = {}
+    groups = {}
     ret = {}
-    distro = __grains__.get('osfinger')
-    for audit_dict in data.get('stat', []):
-        for audit_id, audit_data in audit_dict.iteritems():
-            tags_dict = audit_data.get('data', {})
-            tags = None
-            for osfinger in tags_dict:
-                if osfinger == '*':
-                    continue
-                osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                for osfinger_glob in osfinger_list:
-                    if fnmatch.fnmatch(distro, osfinger_glob):
-                        tags = tags_dict.get(osfinger)
-                        break
-                if tags is not None:
-                    break
-            # If we didn't find a match, check for a '*'
-            if tags is None:
-                tags = tags_dict.get('*', [])
-            if isinstance(tags, dict):
-                # malformed yaml, convert to list of dicts
-                tmp = []
-                for name, tag in tags.iteritems():
-                    tmp.append({name: tag})
-                tags = tmp
-            for item in tags:
-                for name, tag in item.iteritems():
-                    if isinstance(tag, dict):
-                        tag_data = copy.deepcopy(tag)
-                        tag = tag_data.pop('tag')
-                    if tag not in ret:
-                        ret[tag] = []
-                    formatted_data = {'name': name,
-                                      'tag': tag,
-                                      'module': 'stat'}
-                    formatted_data.update(tag_data)
-                    formatted_data.update(audit_data)
-                    formatted_data.pop('data')
-                    ret[tag].append(formatted_data)
+    for name in names:
+        if name in ret:
+            continue
+        path = os.path.expanduser(name)
+        try:
+            # Like file.stats, follow symlinks, except for broken ones
+            pstat = os.stat(path)
+        except OSError:
+            try:
+                pstat = os.lstat(path)
+            except OSError:
+                ret[name] = {}
+                continue
+        if pstat.st_uid not in users:
+            try:
+                users[pstat.st_uid] = pwd.getpwuid(pstat.st_uid).pw_name
+            except KeyError:
+                users[pstat.st_uid] = pstat.st_uid
+        if pstat.st_gid not in groups:
+            try:
+                groups[pstat.st_gid] = grp.getgrgid(pstat.st_gid).gr_name
+            except KeyError:
+                groups[pstat.st_gid] = pstat.st_gid
+        ret[name] = {'mode': oct(stat.S_IMODE(pstat.st_mode)),
+                     'uid': pstat.st_uid,
+                     'gid': pstat.st_gid,
+                     'user': users[pstat.st_uid],
+                     'group': groups[pstat.st_gid]}
     return ret
 
 
@@ -278,4 +264,4 @@ def _is_permission_in_limit(max_permission,given_permission):
     if given_x and ( not allowed_x ):
         return False
 
-    return True
\ No newline at end of file
+    return True
@@ -32,16 +32,17 @@ sysctl:
 from __future__ import absolute_import
 import logging
 
-import fnmatch
 import yaml
 import os
-import copy
 import salt.utils
 
 from distutils.version import LooseVersion
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('sysctl',)
+__nova_tags__ = {}
+
 
 def __virtual__():
     if salt.utils.is_windows():
@@ -53,21 +54,19 @@ def audit(data_list, tags, debug=False, **kwargs):
     '''
     Run the sysctl audits contained in the YAML files processed by __virtual__
     '''
-    __data__ = {}
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, 'sysctl', **__nova_tags__)
 
     if debug:
-        log.debug('service audit __data__:')
-        log.debug(__data__)
+        log.debug('service audit data_list:')
+        log.debug(data_list)
         log.debug('service audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
 
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 passed = True
                 if 'control' in tag_data:
@@ -76,7 +75,7 @@ def audit(data_list, tags, debug=False, **kwargs):
                 name = tag_data['name']
                 match_output = tag_data['match_output']
 
-                salt_ret = __salt__['sysctl.get'](name)
+                salt_ret = __facts__.sysctl(name)
                 if not salt_ret:
                     passed = False
                 if str(salt_ret).startswith('error'):
@@ -90,62 +89,3 @@ def audit(data_list, tags, debug=False, **kwargs):
                     ret['Failure'].append(tag_data)
 
     return ret
-
-
-def _merge_yaml(ret, data, profile=None):
-    '''
-    Merge two yaml dicts together
-    '''
-    if 'sysctl' not in ret:
-        ret['sysctl'] = []
-    for key, val in data.get('sysctl', {}).iteritems():
-        if profile and isinstance(val, dict):
-            val['nova_profile'] = profile
-        ret['sysctl'].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
-    '''
-    ret = {}
-    distro = __grains__.get('osfinger')
-    for audit_dict in data.get('sysctl', []):
-        for audit_id, audit_data in audit_dict.iteritems():
-            tags_dict = audit_data.get('data', {})
-            tags = None
-            for osfinger in tags_dict:
-                if osfinger == '*':
-                    continue
-                osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                for osfinger_glob in osfinger_list:
-                    if fnmatch.fnmatch(distro, osfinger_glob):
-                        tags = tags_dict.get(osfinger)
-                        break
-                if tags is not None:
-                    break
-            # If we didn't find a match, check for a '*'
-            if tags is None:
-                tags = tags_dict.get('*', [])
-            if isinstance(tags, dict):
-                # malformed yaml, convert to list of dicts
-                tmp = []
-                for name, tag in tags.iteritems():
-                    tmp.append({name: tag})
-                tags = tmp
-            for item in tags:
-                for name, tag in item.iteritems():
-                    if isinstance(tag, dict):
-                        tag_data = copy.deepcopy(tag)
-                        tag = tag_data.pop('tag')
-                    if tag not in ret:
-                        ret[tag] = []
-                    formatted_data = {'name': name,
-                                      'tag': tag,
-                                      'module': 'sysctl'}
-                    formatted_data.update(tag_data)
-                    formatted_data.update(audit_data)
-                    formatted_data.pop('data')
-                    ret[tag].append(formatted_data)
-    return ret
\ No newline at end of file
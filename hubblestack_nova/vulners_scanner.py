@@ -30,6 +30,8 @@ import requests
 
 log = logging.getLogger(__name__)
 
+__nova_keys__ = ('vulners_scanner',)
+
 
 def __virtual__():
     return not sys.platform.startswith('win')
@@ -70,7 +72,7 @@ def _get_local_packages():
     :return: A nice list of packages.
     '''
 
-    local_packages = __salt__['pkg.list_pkgs']()
+    local_packages = __facts__.packages(versions_as_list=False)
     return ['{0}-{1}'.format(pkg, local_packages[pkg]) for pkg in local_packages]
 
 
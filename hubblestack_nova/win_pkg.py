@@ -9,8 +9,6 @@
 '''
 from __future__ import absolute_import
 
-import copy
-import fnmatch
 import logging
 import salt.utils
 from salt.exceptions import CommandExecutionError
@@ -18,6 +16,11 @@ from salt.exceptions import CommandExecutionError
 
 log = logging.getLogger(__name__)
 __virtualname__ = 'win_pkg'
+__nova_keys__ = (__virtualname__,)
+# These have always been reported as win_auditpol audits
+__nova_tags__ = {'toplists': ('blacklist', 'whitelist'),
+                 'grain': 'osfullname',
+                 'module': 'win_auditpol'}
 
 def __virtual__():
     if not salt.utils.is_windows():
@@ -30,24 +33,22 @@ def audit(data_list, tags, debug=False, **kwargs):
     Runs auditpol on the local machine and audits the return data
     with the CIS yaml processed by __virtual__
     '''
-    __data__ = {}
     try:
         __pkgdata__ = __salt__['pkg.list_pkgs']()
     except CommandExecutionError:
         __salt__['pkg.refresh_db']()
         __pkgdata__ = __salt__['pkg.list_pkgs']()
-    for profile, data in data_list:
-        _merge_yaml(__data__, data, profile)
-    __tags__ = _get_tags(__data__)
+    __tags__ = __tagtable__.tags(data_list, __virtualname__, **__nova_tags__)
     if debug:
-        log.debug('package audit __data__:')
-        log.debug(__data__)
+        log.debug('package audit data_list:')
+        log.debug(data_list)
         log.debug('package audit __tags__:')
         log.debug(__tags__)
 
     ret = {'Success': [], 'Failure': [], 'Controlled': []}
     for tag in __tags__:
-        if fnmatch.fnmatch(tag, tags):
+        if __matcher__.tag(tag, tags):
+            __timing__.tag(tag)
             for tag_data in __tags__[tag]:
                 if 'control' in tag_data:
                     ret['Controlled'].append(tag_data)
@@ -79,78 +80,6 @@ def audit(data_list, tags, debug=False, **kwargs):
     return ret
 
 
-def _merge_yaml(ret, data, profile=None):
-    '''
-    Merge two yaml dicts together at the secedit:blacklist and
-    secedit:whitelist level
-    '''
-    if __virtualname__ not in ret:
-        ret[__virtualname__] = {}
-    for topkey in ('blacklist', 'whitelist'):
-        if topkey in data.get(__virtualname__, {}):
-            if topkey not in ret[__virtualname__]:
-                ret[__virtualname__][topkey] = []
-            for key, val in data[__virtualname__][topkey].iteritems():
-                if profile and isinstance(val, dict):
-                    val['nova_profile'] = profile
-                ret[__virtualname__][topkey].append({key: val})
-    return ret
-
-
-def _get_tags(data):
-    '''
-    Retrieve all the tags for this distro from the yaml
-    '''
-    ret = {}
-    distro = __grains__.get('osfullname')
-    for toplist, toplevel in data.get(__virtualname__, {}).iteritems():
-        # secedit:whitelist
-        for audit_dict in toplevel:
-            for audit_id, audit_data in audit_dict.iteritems():
-                # secedit:whitelist:PasswordComplexity
-                tags_dict = audit_data.get('data', {})
-                # secedit:whitelist:PasswordComplexity:data
-                tags = None
-                for osfinger in tags_dict:
-                    if osfinger == '*':
-                        continue
-                    osfinger_list = [finger.strip() for finger in osfinger.split(',')]
-                    for osfinger_glob in osfinger_list:
-                        if fnmatch.fnmatch(distro, osfinger_glob):
-                            tags = tags_dict.get(osfinger)
-                            break
-                    if tags is not None:
-                        break
-                # If we didn't find a match, check for a '*'
-                if tags is None:
-                    tags = tags_dict.get('*', [])
-                # secedit:whitelist:PasswordComplexity:data:Windows 2012
-                if isinstance(tags, dict):
-                    # malformed yaml, convert to list of dicts
-                    tmp = []
-                    for name, tag in tags.iteritems():
-                        tmp.append({name: tag})
-                    tags = tmp
-                for item in tags:
-                    for name, tag in item.iteritems():
-                        tag_data = {}
-                        # Whitelist could have a dictionary, not a string
-                        if isinstance(tag, dict):
-                            tag_data = copy.deepcopy(tag)
-                            tag = tag_data.pop('tag')
-                        if tag not in ret:
-                            ret[tag] = []
-                        formatted_data = {'name': name,
-                                          'tag': tag,
-                                          'module': 'win_auditpol',
-                                          'type': toplist}
-                        formatted_data.update(tag_data)
-                        formatted_data.update(audit_data)
-                        formatted_data.pop('data')
-                        ret[tag].append(formatted_data)
-    return ret
-
-
 def _translate_value_type(current, value, evaluator):
     if int(current) >= int(evaluator):
         return True
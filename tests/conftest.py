@@ -0,0 +1,97 @@
+# -*- encoding: utf-8 -*-
+'''
+Shared fixtures for the hubble and nova module tests.
+
+``minion`` sets up ``hubble.py`` against a throwaway minion cachedir, into
+which the nova modules have been "synced". ``nova_module`` loads a single nova
+module with the dunders ``hubble.py`` would inject into it, so its ``audit``
+function can be called directly.
+'''
+from __future__ import absolute_import
+import imp
+import os
+import shutil
+import sys
+
+import pytest
+import yaml
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, '_modules'))
+
+import hubble  # noqa: E402
+import nova_loader  # noqa: E402
+
+
+class Minion(object):
+    '''
+    The salt dunders for ``hubble.py``. ``config`` holds the values returned
+    by ``config.get``, and ``salt`` can be extended with whatever execution
+    module functions a test needs.
+    '''
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        self.config = {'hubblestack:nova:autosync': False}
+        self.grains = {'osfinger': 'CentOS Linux-7',
+                       'os': 'CentOS',
+                       'osrelease': '7',
+                       'kernel': 'Linux'}
+        self.pillar = {}
+        self.opts = {'cachedir': cachedir, 'grains': self.grains}
+        self.salt = {'config.get': lambda key, default=None: self.config.get(key, default),
+                     'match.compound': lambda match: True}
+        files = os.path.join(cachedir, 'files', 'base')
+        shutil.copytree(os.path.join(REPO, 'hubblestack_nova'),
+                        os.path.join(files, 'hubblestack_nova'))
+        self.profile_dir = os.path.join(files, 'hubblestack_nova_profiles')
+        os.makedirs(self.profile_dir)
+
+    def profile(self, path, data):
+        '''
+        Write the profile ``data`` to ``path`` in the synced profiles
+        '''
+        path = os.path.join(self.profile_dir, path)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fh_:
+            yaml.safe_dump(data, fh_, default_flow_style=False)
+
+
+@pytest.fixture
+def minion(tmpdir, monkeypatch):
+    minion = Minion(str(tmpdir))
+    monkeypatch.setattr(hubble, '__salt__', minion.salt, raising=False)
+    monkeypatch.setattr(hubble, '__opts__', minion.opts, raising=False)
+    monkeypatch.setattr(hubble, '__grains__', minion.grains, raising=False)
+    monkeypatch.setattr(hubble, '__pillar__', minion.pillar, raising=False)
+    # Don't let loaders, caches or facts leak between tests
+    monkeypatch.setattr(hubble, '__nova__', {})
+    monkeypatch.setattr(hubble, '_TOP_CACHE', {})
+    monkeypatch.setattr(hubble, '_MATCH_CACHE', {'context': None, 'matches': {}})
+    monkeypatch.setattr(hubble, '_FACTS', hubble._FactCache())
+    return minion
+
+
+@pytest.fixture
+def nova_module(minion):
+    '''
+    Return a function which loads the nova module ``name`` (the file name
+    without ``.py``), injected with ``open``, ``__salt__``, ``__grains__``,
+    ``__opts__``, ``__tagtable__``, ``__matcher__``, ``__timing__``,
+    ``__resultcache__`` and ``__facts__``
+    '''
+    def _load(name):
+        module = imp.load_source('nova_test_' + name,
+                                 os.path.join(REPO, 'hubblestack_nova', name + '.py'))
+        matcher = nova_loader.NovaMatcher(minion.grains)
+        module.__salt__ = hubble._TimedFunctions(minion.salt)
+        module.open = hubble._counting_open
+        module.__grains__ = minion.grains
+        module.__opts__ = minion.opts
+        module.__matcher__ = matcher
+        module.__tagtable__ = nova_loader.NovaTagTable(matcher)
+        module.__timing__ = hubble._TimingHook()
+        module.__resultcache__ = hubble._RESULT_CACHE
+        module.__facts__ = hubble._FACTS
+        return module
+    return _load
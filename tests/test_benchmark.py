@@ -0,0 +1,31 @@
+# -*- encoding: utf-8 -*-
+'''
+Keep the benchmark harness working: a tiny run, saved and compared
+'''
+from __future__ import absolute_import
+import imp
+import json
+import os
+
+from conftest import REPO
+
+
+def test_benchmark(minion, tmpdir, capsys):
+    # minion also makes sure the dunders the harness sets on hubble are
+    # put back afterwards
+    benchmark = imp.load_source('nova_benchmark',
+                                os.path.join(REPO, 'benchmarks', 'nova_benchmark.py'))
+    saved = str(tmpdir.join('bench.json'))
+    args = ['--profiles', '2', '--checks', '5', '--osfingers', '3', '--files', '10',
+            '--runs', '1']
+
+    benchmark.main(args + ['--save', saved])
+    with open(saved) as fh_:
+        bench = json.load(fh_)
+    assert [phase['phase'] for phase in bench['phases']] == \
+        ['generate', 'load', 'reload', 'audit 1']
+    assert bench['results']['Errors'] == 0
+    assert bench['results']['Success'] + bench['results']['Failure'] > 0
+
+    benchmark.main(args + ['--compare', saved])
+    assert 'vs base' in capsys.readouterr()[0]
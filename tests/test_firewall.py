@@ -0,0 +1,56 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+
+PROFILE = {
+    'firewall': {
+        'whitelist': {
+            'ssh': {
+                'data': {
+                    'tag': 'FIREWALL-TCP-22',
+                    'table': 'filter',
+                    'chain': 'INPUT',
+                    'family': 'ipv4',
+                    'rule': {'table': 'filter',
+                             'chain': 'INPUT',
+                             'proto': 'tcp',
+                             'dport': 22,
+                             'jump': 'ACCEPT'},
+                },
+                'description': 'ssh iptables rule check',
+            },
+        },
+    },
+}
+
+
+def test_audit_twice(minion, nova_module):
+    firewall = nova_module('firewall')
+    built = []
+    checked = []
+
+    def build_rule(**kwargs):
+        built.append(kwargs)
+        return '-p tcp --dport 22 -j ACCEPT'
+
+    def check(**kwargs):
+        checked.append(kwargs)
+        return True
+
+    minion.salt['iptables.build_rule'] = build_rule
+    minion.salt['iptables.check'] = check
+    data_list = [('firewall', PROFILE)]
+
+    first = firewall.audit(data_list, '*')
+    second = firewall.audit(data_list, '*')
+
+    assert len(first['Success']) == 1
+    assert len(second['Success']) == 1
+    assert built[0] == built[1] == {'table': 'filter',
+                                    'chain': 'INPUT',
+                                    'family': 'ipv4',
+                                    'proto': 'tcp',
+                                    'dport': 22,
+                                    'jump': 'ACCEPT'}
+    assert checked[0] == checked[1]
+    # The profile data itself is left alone
+    assert PROFILE['firewall']['whitelist']['ssh']['data']['rule']['table'] == 'filter'
@@ -0,0 +1,167 @@
+# -*- encoding: utf-8 -*-
+'''
+The native grep engine should print exactly what GNU grep does
+'''
+from __future__ import absolute_import
+import imp
+import itertools
+import os
+import shlex
+import subprocess
+from distutils.spawn import find_executable
+
+import pytest
+
+from conftest import REPO
+
+LINES = [
+    'PermitRootLogin no',
+    '#PermitRootLogin yes',
+    '  permitrootlogin Yes',
+    '^caret at the start',
+    'a ^caret inside',
+    'ends with a dollar$',
+    '$dollar first',
+    'aaa',
+    'abab abab',
+    'abcabc',
+    'tab\there',
+    'umask 027',
+    'umask 0022',
+    'x',
+    '',
+    'foo.bar foo-bar foobar',
+    'a*b a+b a?b',
+    '[brackets] and {braces}',
+    'UPPER lower MiXeD',
+    'word-word word_word',
+    '/tmp /var/tmp nodev,nosuid,noexec',
+    'last line',
+]
+
+BASIC = [
+    'PermitRootLogin',
+    '^PermitRootLogin',
+    '"^#PermitRootLogin"',
+    'no$',
+    '"^$"',
+    '^x$',
+    '"^^caret"',
+    '"a ^caret"',
+    "'dollar\\$'",
+    "'dollar$'",
+    '"^\\$dollar"',
+    '"a\\{3\\}"',
+    '"a\\{1,2\\}b"',
+    '"umask 0\\{1,\\}2"',
+    '"\\(ab\\)\\1"',
+    '"\\(abc\\)\\1"',
+    '"\\(a\\|x\\)b"',
+    '"^x\\|^aaa"',
+    '"\\(^a\\)"',
+    '"[[:digit:]]\\{3\\}"',
+    '"[[:upper:]][[:lower:]]"',
+    '"[^a-z ]"',
+    '"[]x]"',
+    '"[a-c]*c"',
+    '"a*b"',
+    '"*b"',
+    '"a\\*b"',
+    '"foo.bar"',
+    '"foo\\.bar"',
+    '"\\<word"',
+    '"word\\>"',
+    '"\\bbar\\b"',
+    'nodev',
+    'upper',
+]
+
+EXTENDED = [
+    '"^(Permit|permit)"',
+    '"a{2,}"',
+    '"(ab)\\1"',
+    '"umask 0+2+7?$"',
+    '"[0-9]{3}$"',
+    '"^[[:space:]]+permit"',
+    '"a\\*b|a\\+b"',
+    '"^(x|aaa)$"',
+    '"(^|,)noexec(,|$)"',
+]
+
+FLAGS = ['', '-v', '-w', '-x', '-i', '-A 1', '-B 1', '-C 1', '-A1 -B2', '-vi']
+
+CASES = ([(pattern, flags) for pattern, flags in itertools.product(BASIC, FLAGS)] +
+         [(pattern, '-E ' + flags) for pattern, flags in itertools.product(EXTENDED, FLAGS)] +
+         [('"a*b"', '-F'), ('"foo.bar"', '-F -w'), ('"^caret"', '-F -v')])
+
+
+@pytest.fixture(scope='module')
+def grep():
+    if not find_executable('grep'):
+        pytest.skip('grep is not installed')
+    return imp.load_source('nova_test_grep', os.path.join(REPO, 'hubblestack_nova', 'grep.py'))
+
+
+@pytest.fixture(scope='module')
+def path(tmpdir_factory):
+    path = tmpdir_factory.mktemp('grep').join('sshd_config')
+    path.write('\n'.join(LINES) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('pattern,flags', CASES)
+def test_native_grep(grep, path, pattern, flags):
+    args = [flags] if flags else []
+    # The same command line _grep runs, without a shell
+    argv = shlex.split('grep {0} {1} {2}'.format(flags, pattern, path))
+    expected = subprocess.Popen(argv, stdout=subprocess.PIPE).communicate()[0].rstrip()
+
+    native = grep._native_grep(grep._FileContents(path), pattern, *args)
+
+    assert native is not None
+    assert native == expected
+
+
+def _profile(toplist, checks):
+    return {'grep': {toplist: dict(
+        (tag, {'data': {'*': [{path: dict(check, tag=tag)}]}, 'description': tag})
+        for tag, path, check in checks)}}
+
+
+def test_audit(minion, nova_module, path, tmpdir):
+    grep = nova_module('grep')
+    opened = []
+
+    def _open(name, *args):
+        opened.append(name)
+        return open(name, *args)
+
+    grep.open = _open
+    ran = []
+    minion.salt['cmd.run_all'] = lambda cmd, **kwargs: ran.append(cmd) or {'stdout': 'nodev'}
+    missing = str(tmpdir.join('missing'))
+    whitelist = _profile('whitelist', [
+        ('ROOT', path, {'pattern': '"^PermitRootLogin no"'}),
+        ('UMASK', path, {'pattern': 'umask', 'match_output': '027'}),
+        ('UMASK-REGEX', path, {'pattern': 'umask', 'match_output': '^umask 0+22$',
+                               'match_output_regex': True}),
+        ('TMP', path, {'pattern': '/tmp', 'match_output': 'nosuid', 'grep_args': ['-o']}),
+        ('ABSENT', path, {'pattern': 'Banner'}),
+        ('MISSING', missing, {'pattern': 'anything', 'match_on_file_missing': True}),
+        ('NO-PATTERN', path, {}),
+    ])
+    blacklist = _profile('blacklist', [
+        ('ROOT-YES', path, {'pattern': '"permitrootlogin yes"', 'grep_args': ['-i']}),
+        ('MISSING-BAD', missing, {'pattern': 'anything', 'match_on_file_missing': True}),
+    ])
+
+    ret = grep.audit([('whitelist', whitelist), ('blacklist', blacklist)], '*')
+
+    assert dict((key, sorted(tag_data['tag'] for tag_data in ret[key])) for key in ret) == {
+        'Success': ['MISSING', 'ROOT', 'UMASK', 'UMASK-REGEX'],
+        'Failure': ['ABSENT', 'MISSING-BAD', 'NO-PATTERN', 'ROOT-YES', 'TMP'],
+        'Controlled': []}
+    # -o isn't supported natively, so only that check runs grep
+    assert ran == ['grep  -o /tmp {0}'.format(path)]
+    # and each file is opened once for all of the other checks
+    assert sorted(opened) == sorted([path, missing])
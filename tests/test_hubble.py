@@ -0,0 +1,731 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+import collections
+import os
+import socket
+import struct
+import subprocess
+import threading
+import time
+
+import pytest
+import six
+
+import hubble
+
+
+def _pkg_profile(*tags):
+    return {'pkg': {'blacklist': dict(
+        ('telnet{0}'.format(index), {'data': {'*': [{'telnet': tag}]},
+                                     'description': 'telnet'})
+        for index, tag in enumerate(tags))}}
+
+
+def _tags(ret, key):
+    return sorted(tag_data['tag'] for tag_data in ret.get(key, []))
+
+
+def test_top_entries_with_different_globs(minion):
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'telnet': ['1.0']}
+    minion.profile('a.yaml', _pkg_profile('CIS 1.1', 'CIS 2.1'))
+    minion.profile('b.yaml', _pkg_profile('CIS 3.1'))
+    hubble.load()
+
+    # Both entries use the pkg module, so it runs once with '*'
+    data_by_tag = collections.OrderedDict([('CIS 1.*', ['a']), ('*', ['b'])])
+    (first, second), results = hubble._run_top(data_by_tag, False)
+
+    assert 'Errors' not in results
+    assert _tags(first, 'Failure') == ['CIS 1.1']
+    assert _tags(second, 'Failure') == ['CIS 3.1']
+
+
+def test_facts_service_status_fallback(minion):
+    calls = []
+
+    def status(name):
+        calls.append(('service.status', name))
+        return name == 'ssh'
+
+    def enabled(name):
+        calls.append(('service.enabled', name))
+        return name == 'crond'
+
+    minion.salt['service.get_running'] = lambda: ['sshd']
+    minion.salt['service.status'] = status
+    minion.salt['service.get_enabled'] = lambda: ['sshd']
+    minion.salt['service.enabled'] = enabled
+    facts = hubble._FACTS
+
+    assert facts.service_running('sshd.service')
+    assert calls == []
+    # Names which aren't listed (e.g. aliases) are checked one by one
+    assert facts.service_running('ssh')
+    assert not facts.service_running('telnet')
+    assert facts.service_running('ssh')
+    assert calls == [('service.status', 'ssh'), ('service.status', 'telnet')]
+
+    del calls[:]
+    assert facts.service_enabled('sshd')
+    assert facts.service_enabled('crond')
+    assert not facts.service_enabled('telnet')
+    assert calls == [('service.enabled', 'crond'), ('service.enabled', 'telnet')]
+
+
+def _modes(files):
+    return dict((path, pstat.st_mode & 0o7777) for path, pstat in files)
+
+
+def test_facts_files_sees_mode_changes(minion, tmpdir):
+    tmpdir.mkdir('etc').join('netrc').write('')
+    path = str(tmpdir.join('etc', 'netrc'))
+    os.chmod(path, 0o600)
+    root = str(tmpdir.join('etc'))
+    # Old enough for an index to trust its mtime
+    os.utime(root, (1000000000, 1000000000))
+    assert _modes(hubble._FACTS.files(root))[path] == 0o600
+
+    # chmod doesn't change the directory's mtime, so only a fresh walk sees it
+    os.chmod(path, 0o777)
+    assert _modes(hubble._FACTS.files(root))[path] == 0o777
+
+
+def test_facts_files_index(minion, tmpdir):
+    minion.config['hubblestack:nova:file_index_max_age'] = 3600
+    etc = tmpdir.mkdir('etc')
+    etc.join('passwd').write('')
+    etc.mkdir('sub').join('group').write('')
+    root = str(etc)
+    for path in (root, root + '/sub'):
+        os.utime(path, (1000000000, 1000000000))
+    first = list(hubble._FACTS.files(root))
+    assert sorted(path for path, _ in first) == \
+        sorted([root, root + '/passwd', root + '/sub', root + '/sub/group'])
+
+    # Reused from the index, until the directory changes
+    assert list(hubble._FACTS.files(root)) == first
+    etc.join('sub', 'shadow').write('')
+    assert sorted(path for path, _ in hubble._FACTS.files(root)) == \
+        sorted([root, root + '/passwd', root + '/sub', root + '/sub/group',
+                root + '/sub/shadow'])
+
+
+def test_facts_package_version(minion):
+    calls = []
+
+    def list_pkgs(**kwargs):
+        calls.append(kwargs)
+        return {'telnet': ['1.0'],
+                'telnet-server': ['1.1', '1.2'],
+                'xinetd': ['2.3']}
+
+    minion.salt['pkg.list_pkgs'] = list_pkgs
+    facts = hubble._FACTS
+
+    assert facts.package_version('telnet') == '1.0'
+    assert facts.package_version('telnet-server') == '1.1,1.2'
+    assert facts.package_version('rsh') == ''
+    # Globs match every installed package, like pkg.version
+    assert facts.package_version('xinetd*') == '2.3'
+    assert facts.package_version('telnet*') == '1.0,1.1,1.2'
+    assert facts.package_version('rsh*') == ''
+    assert facts.package_version('telnet-?erver') == '1.1,1.2'
+    # The package list is only fetched once per audit
+    assert calls == [{'versions_as_list': True}]
+
+
+def test_facts_files_streams(minion, tmpdir):
+    etc = tmpdir.mkdir('etc')
+    etc.mkdir('a').join('b').write('')
+    etc.join('c').write('')
+    root = str(etc)
+    files = hubble._FACTS.files(root)
+    # Generated as they're found, rather than collected into a list
+    assert iter(files) is files
+    paths = [path for path, _ in files]
+    assert sorted(paths) == sorted([root, root + '/a', root + '/a/b', root + '/c'])
+    # Depth first, like find
+    assert paths.index(root + '/a/b') == paths.index(root + '/a') + 1
+
+    # The index walk finds the same files, in the same order
+    minion.config['hubblestack:nova:file_index_max_age'] = 3600
+    assert [path for path, _ in hubble._FACTS.files(root)] == paths
+    assert [path for path, _ in hubble._FACTS.files(root)] == paths
+
+
+def test_facts_files_index_sees_mode_changes(minion, tmpdir):
+    minion.config['hubblestack:nova:file_index_max_age'] = 3600
+    etc = tmpdir.mkdir('etc')
+    etc.join('shadow').write('')
+    path = str(etc.join('shadow'))
+    os.chmod(path, 0o600)
+    root = str(etc)
+    os.utime(root, (1000000000, 1000000000))
+    assert _modes(hubble._FACTS.files(root))[path] == 0o600
+
+    # The directory is unchanged, so its listing comes from the index, but
+    # the stats are fresh
+    os.chmod(path, 0o666)
+    assert _modes(hubble._FACTS.files(root))[path] == 0o666
+
+
+def _proc_address(host, port, family=socket.AF_INET):
+    # How the kernel prints an address in /proc/net: each 32 bit word in
+    # host byte order
+    packed = socket.inet_pton(family, host)
+    words = struct.unpack('={0}I'.format(len(packed) // 4), packed)
+    return ''.join('{0:08X}'.format(word) for word in words) + ':{0:04X}'.format(port)
+
+
+def test_socket_address():
+    assert hubble._socket_address(_proc_address('127.0.0.1', 22)) == '127.0.0.1:22'
+    assert hubble._socket_address(_proc_address('0.0.0.0', 0)) == '0.0.0.0:*'
+    assert hubble._socket_address(_proc_address('10.1.2.3', 443)) == '10.1.2.3:443'
+    assert hubble._socket_address(_proc_address('::', 22, socket.AF_INET6)) == ':::22'
+    assert hubble._socket_address(_proc_address('fe80::1:2', 8080, socket.AF_INET6)) == \
+        'fe80::1:2:8080'
+
+
+@pytest.mark.skipif(not os.path.isfile('/proc/net/tcp'), reason='needs /proc/net')
+def test_read_sockets():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    try:
+        sockets = hubble._read_sockets()
+    finally:
+        listener.close()
+    listening = [sock for sock in sockets
+                 if sock['local-address'] == '127.0.0.1:{0}'.format(port)]
+    assert len(listening) == 1
+    sock = listening[0]
+    assert sock['proto'] == 'tcp'
+    assert sock['state'] == 'LISTEN'
+    assert sock['remote-address'] == '0.0.0.0:*'
+    assert sock['user'] == str(os.getuid())
+    assert sock['recv-q'] == sock['send-q'] == '0'
+    assert sock['program'].startswith('{0}/'.format(os.getpid()))
+
+
+TIMED_MODULE = '''
+def audit(data_list, tags, debug=False, **kwargs):
+    ret = {'Success': [], 'Failure': [], 'Controlled': []}
+    for profile, data in data_list:
+        for tag, path in sorted(data['timed'].items()):
+            __timing__.tag(tag)
+            __salt__['cmd.run']('cat ' + path)
+            with open(path) as fh_:
+                fh_.read()
+            ret['Success'].append({'tag': tag, 'description': tag})
+    return ret
+'''
+
+
+def test_profile_counts(minion, tmpdir):
+    path = str(tmpdir.join('motd'))
+    with open(path, 'w') as fh_:
+        fh_.write('hello\n')
+    with open(os.path.join(minion.cachedir, 'files', 'base', 'hubblestack_nova',
+                           'timed.py'), 'w') as fh_:
+        fh_.write(TIMED_MODULE)
+    minion.profile('timed.yaml', {'timed': {'TIMED-1': path, 'TIMED-2': path}})
+    popen = subprocess.Popen
+    builtin_open = six.moves.builtins.open
+
+    def run(cmd):
+        # Nothing outside the nova modules is patched while profiling
+        assert subprocess.Popen is popen
+        assert six.moves.builtins.open is builtin_open
+        return ''
+
+    minion.salt['cmd.run'] = run
+    ret = hubble.audit('timed', profile=True)
+    assert len(ret['Success']) == 2
+
+    timing = ret['Timing']['/timed.py']
+    assert timing['subprocesses'] == 2
+    assert timing['file_reads'] == 2
+    assert timing['tags']['TIMED-1']['subprocesses'] == 1
+    assert timing['tags']['TIMED-2']['file_reads'] == 1
+
+
+def test_timed_out_module_keeps_its_facts(minion):
+    minion.config['hubblestack:nova:workers'] = 2
+    minion.config['hubblestack:nova:module_timeout'] = 0.2
+    release = threading.Event()
+    seen = []
+
+    def slow(data, tags, **kwargs):
+        hubble._FACTS.get('users', lambda: 'first')
+        release.wait(5)
+        seen.append(hubble._FACTS.get('users', lambda: 'late'))
+        return {}
+
+    def fast(data, tags, **kwargs):
+        return {'Success': [hubble._FACTS.get('users', lambda: 'first')]}
+
+    routes = [('/slow.py', slow, []), ('/fast.py', fast, [])]
+    hubble._start_audit(routes)
+    (_, _, error), (_, ret, _) = hubble._iter_modules(routes, '*', {})
+    hubble._finish_audit()
+    assert error['error'] == 'timed out'
+    assert ret == {'Success': ['first']}
+
+    # The next audit gathers its own facts, and the straggler keeps using
+    # the ones from its own audit
+    hubble._start_audit(routes[1:])
+    assert hubble._FACTS.get('users', lambda: 'second') == 'second'
+    release.set()
+    for _ in range(50):
+        if seen:
+            break
+        time.sleep(0.1)
+    assert seen == ['first']
+    assert hubble._FACTS.get('users', lambda: 'third') == 'second'
+    hubble._finish_audit()
+
+
+def _routes(*names):
+    return [('/{0}.py'.format(name), func, []) for name, func in names]
+
+
+def test_modules_run_concurrently(minion):
+    minion.config['hubblestack:nova:workers'] = 3
+    lock = threading.Lock()
+    running = []
+    all_running = threading.Event()
+
+    def module(name):
+        def audit(data, tags, **kwargs):
+            with lock:
+                running.append(name)
+                if len(running) == 3:
+                    all_running.set()
+            # Only returns once every module has started
+            return {'Success': [name], 'concurrent': all_running.wait(5)}
+        return audit
+
+    routes = _routes(*[(name, module(name)) for name in ('a', 'b', 'c')])
+    results = list(hubble._iter_modules(routes, '*', {}))
+
+    # In the same order as the routes, however they finished
+    assert [key for key, _, _ in results] == ['/a.py', '/b.py', '/c.py']
+    assert [ret['Success'] for _, ret, _ in results] == [['a'], ['b'], ['c']]
+    assert all(ret['concurrent'] for _, ret, _ in results)
+
+
+def test_modules_run_in_order_without_workers(minion):
+    threads = []
+
+    def audit(data, tags, **kwargs):
+        threads.append(threading.current_thread())
+        return {'Success': []}
+
+    def broken(data, tags, **kwargs):
+        raise ValueError('broken')
+
+    routes = _routes(('a', audit), ('b', broken), ('c', audit))
+    results = list(hubble._iter_modules(routes, '*', {}))
+
+    assert [key for key, _, _ in results] == ['/a.py', '/b.py', '/c.py']
+    assert results[1][1] is None
+    assert results[1][2]['error'] == 'exception occurred'
+    assert threads == [threading.current_thread()] * 2
+
+
+def test_module_timeout(minion):
+    minion.config['hubblestack:nova:workers'] = 2
+    minion.config['hubblestack:nova:module_timeout'] = 0.2
+    release = threading.Event()
+
+    def slow(data, tags, **kwargs):
+        release.wait(5)
+        return {'Success': []}
+
+    def fast(data, tags, **kwargs):
+        return {'Success': ['fast']}
+
+    try:
+        started = time.time()
+        results = list(hubble._iter_modules(_routes(('slow', slow), ('fast', fast)), '*', {}))
+        assert time.time() - started < 2
+    finally:
+        release.set()
+
+    assert results[0] == ('/slow.py', None,
+                          {'error': 'timed out',
+                           'data': 'module did not finish within 0.2 seconds'})
+    assert results[1] == ('/fast.py', {'Success': ['fast']}, None)
+
+
+def test_module_timer(monkeypatch):
+    clock = iter([(0.0, 0.0), (1.0, 0.5), (3.0, 1.0), (6.0, 1.5)])
+    monkeypatch.setattr(hubble, '_clock', lambda: next(clock))
+
+    timer = hubble._ModuleTimer()
+    timer.count_subprocess()
+    timer.tag('CIS-1')
+    timer.count_subprocess()
+    timer.count_file_read()
+    timer.tag('CIS-2')
+    timer.count_file_read()
+
+    assert timer.stop() == {
+        'wall': 6.0, 'cpu': 1.5, 'subprocesses': 2, 'file_reads': 2,
+        'tags': {'CIS-1': {'wall': 2.0, 'cpu': 0.5, 'subprocesses': 1, 'file_reads': 1},
+                 'CIS-2': {'wall': 3.0, 'cpu': 0.5, 'subprocesses': 0, 'file_reads': 1}}}
+
+
+def _timing(wall, tag_wall):
+    return {'wall': wall, 'cpu': 0.0, 'subprocesses': 2, 'file_reads': 0,
+            'tags': {'CIS-1': {'wall': tag_wall, 'cpu': 0.0, 'subprocesses': 1,
+                               'file_reads': 0}}}
+
+
+def test_record_timings(minion):
+    hubble._record_timings({'/pkg.py': _timing(4.0, 1.0)})
+    hubble._record_timings({'/pkg.py': _timing(2.0, 3.0)})
+
+    history = hubble._load_timing_history()['/pkg.py']
+    assert history['wall'] == 3.0
+    assert history['runs'] == 2
+    assert history['tags']['CIS-1']['wall'] == 2.0
+    assert history['tags']['CIS-1']['subprocesses'] == 1
+    # Everything outside of the tags, averaged (3.0 then 0 -- never negative)
+    assert history['untagged']['wall'] == 1.5
+    assert history['untagged']['subprocesses'] == 1
+
+
+def test_timing_hook_without_profile(minion):
+    # Modules can always call __timing__.tag; it's a no-op unless profiling
+    hubble._TimingHook().tag('CIS-1')
+    minion.profile('pkg.yaml', _pkg_profile('CIS-1'))
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {}
+
+    ret = hubble.audit('pkg')
+
+    assert ret['Success'] == [{'CIS-1': 'telnet'}]
+    assert 'Timing' not in ret
+    assert not os.path.exists(hubble._timing_history_path())
+
+
+def test_sync_interval(minion):
+    synced = []
+
+    def cache_dir(path, saltenv='base'):
+        synced.append(path)
+        return []
+
+    minion.salt['cp.cache_dir'] = cache_dir
+    minion.config['hubblestack:nova:autosync'] = True
+    minion.config['hubblestack:nova:sync_interval'] = 3600
+
+    hubble.load()
+    assert len(synced) == 2
+    loader = hubble.__nova__
+
+    # Within the interval, the synced files (and the loader) are reused
+    hubble.load()
+    assert len(synced) == 2
+    assert hubble.__nova__ is loader
+
+    # The stamp is on disk, so it outlives the process
+    with open(hubble._sync_stamp(), 'w') as fh_:
+        fh_.write(str(time.time() - 7200))
+    hubble.load()
+    assert len(synced) == 4
+
+    minion.config['hubblestack:nova:sync_interval'] = 0
+    hubble.load()
+    assert len(synced) == 6
+
+
+def _failures(ret):
+    return [tag_data for result in ret['Failure'] for tag_data in result.values()]
+
+
+def test_module_result_cache(minion, monkeypatch):
+    calls = []
+
+    def list_pkgs(**kwargs):
+        calls.append(kwargs)
+        return {'telnet': ['1.0']}
+
+    minion.salt['pkg.list_pkgs'] = list_pkgs
+    minion.config['hubblestack:nova:result_cache'] = {'pkg': 3600}
+    minion.profile('pkg.yaml', _pkg_profile('CIS-1'))
+
+    assert 'cache_age' not in _failures(hubble.audit('pkg', verbose=True))[0]
+    assert _failures(hubble.audit('pkg', verbose=True))[0]['cache_age'] == 0
+    assert len(calls) == 1
+
+    # Saved in the cachedir, so a new job uses it too
+    monkeypatch.setattr(hubble, '_RESULT_CACHE', hubble._ResultCache())
+    assert _failures(hubble.audit('pkg', verbose=True))[0]['cache_age'] == 0
+    assert len(calls) == 1
+
+    for entry in hubble._RESULT_CACHE.entries.values():
+        entry['time'] -= 7200
+    assert 'cache_age' not in _failures(hubble.audit('pkg', verbose=True))[0]
+    assert len(calls) == 2
+    assert 'cache_age' in _failures(hubble.audit('pkg', verbose=True))[0]
+
+    # Only while configured
+    minion.config['hubblestack:nova:result_cache'] = {}
+    assert 'cache_age' not in _failures(hubble.audit('pkg', verbose=True))[0]
+    assert len(calls) == 3
+
+
+def test_check_result_cache(minion):
+    calls = []
+
+    def list_pkgs(**kwargs):
+        calls.append(kwargs)
+        return {'telnet': ['1.0']}
+
+    minion.salt['pkg.list_pkgs'] = list_pkgs
+    minion.config['hubblestack:nova:result_cache'] = {'CIS-2*': 3600}
+    checks = {'always': {'data': {'*': {'tag': 'CIS-1', 'function': 'test_success'}},
+                         'description': 'always'},
+              'telnet': {'data': {'*': {'tag': 'CIS-2', 'function': 'check_if_any_pkg_installed',
+                                        'args': ['telnet']}},
+                         'description': 'telnet'}}
+    minion.profile('misc.yaml', {'misc': checks})
+
+    for _ in range(3):
+        ret = hubble.audit('misc', verbose=True)
+
+    # Only the checks with matching tags are cached
+    assert len(calls) == 1
+    successes = dict((tag, tag_data) for result in ret['Success']
+                     for tag, tag_data in result.items())
+    assert 'cache_age' not in successes['CIS-1']
+    assert successes['CIS-2']['cache_age'] == 0
+
+
+def test_controls(minion):
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'telnet': ['1.0']}
+    profile = _pkg_profile('CIS-1', 'CIS-2', 'CIS-3', 'CIS-4', 'CIS-4')
+    profile['pkg']['whitelist'] = {'telnet': {'data': {'*': [{'telnet': 'CIS-5'}]},
+                                              'description': 'telnet'}}
+    profile['control'] = ['CIS-1',
+                          {'CIS-2': 'Not on this network'},
+                          {'CIS-3': {'reason': 'Compensated', 'owner': 'security'}}]
+    minion.profile('pkg.yaml', profile)
+
+    ret = hubble.audit('pkg')
+
+    assert sorted(ret['Controlled']) == sorted([{'CIS-1': None},
+                                                {'CIS-2': 'Not on this network'},
+                                                {'CIS-3': 'Compensated'}])
+    # Duplicate results only show once in the terse output
+    assert ret['Failure'] == [{'CIS-4': 'telnet'}]
+    assert ret['Success'] == [{'CIS-5': 'telnet'}]
+    assert ret['Compliance'] == '80%'
+
+    ret = hubble.audit('pkg', verbose=True, show_success=False, show_compliance=False)
+
+    assert [tag_data.keys() for tag_data in ret['Failure']] == [['CIS-4'], ['CIS-4']]
+    assert sorted(tag for tag_data in ret['Controlled'] for tag in tag_data) == \
+        ['CIS-1', 'CIS-2', 'CIS-3']
+    assert [tag_data['CIS-2']['control'] for tag_data in ret['Controlled']
+            if 'CIS-2' in tag_data] == ['Not on this network']
+    assert 'Success' not in ret
+    assert 'Compliance' not in ret
+
+
+def _rebuild(items):
+    results = {}
+    for key, result in items:
+        if key == 'Compliance':
+            results[key] = result
+        else:
+            results.setdefault(key, []).append(result)
+    return results
+
+
+def _sorted_results(results):
+    # hubble.audit keeps empty Success and Failure lists, which audit_iter
+    # has nothing to yield for
+    return dict((key, sorted(val) if isinstance(val, list) else val)
+                for key, val in results.items() if val != [])
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'verbose': True}, {'show_success': False},
+                                    {'show_compliance': False}])
+def test_audit_iter_matches_audit(minion, kwargs):
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'telnet': ['1.0']}
+    minion.salt['sysctl.show'] = lambda: {'net.ipv4.ip_forward': '1'}
+    profile = _pkg_profile('CIS-1', 'CIS-2', 'CIS-2')
+    profile['sysctl'] = {'forward': {'data': {'*': [{'net.ipv4.ip_forward': {
+        'tag': 'CIS-3', 'match_output': '0'}}]}, 'description': 'forwarding'}}
+    profile['control'] = [{'CIS-1': 'Accepted'}]
+    minion.profile('cis.yaml', profile)
+
+    expected = hubble.audit('cis,missing', **kwargs)
+    rebuilt = _rebuild(hubble.audit_iter('cis,missing', **kwargs))
+
+    assert _sorted_results(rebuilt) == _sorted_results(expected)
+    assert 'Errors' in rebuilt
+
+
+def test_audit_iter_streams(minion):
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'telnet': ['1.0']}
+    shown = []
+    minion.salt['sysctl.show'] = lambda: shown.append(True) or {}
+    profile = _pkg_profile('CIS-1')
+    profile['sysctl'] = {'forward': {'data': {'*': [{'net.ipv4.ip_forward': {
+        'tag': 'CIS-3', 'match_output': '0'}}]}, 'description': 'forwarding'}}
+    minion.profile('cis.yaml', profile)
+
+    results = hubble.audit_iter('cis')
+    assert next(results) == ('Failure', {'CIS-1': 'telnet'})
+    # The sysctl module hasn't run yet
+    assert shown == []
+    assert list(results)[-1][0] == 'Compliance'
+    assert shown == [True]
+
+
+def test_top(minion):
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'telnet': ['1.0']}
+    minion.salt['match.compound'] = lambda match: match == '*'
+    minion.profile('a.yaml', _pkg_profile('CIS-1.1', 'CIS-2.1'))
+    minion.profile('b.yaml', _pkg_profile('CIS-2.2', 'CIS-3.1'))
+    minion.profile('c.yaml', _pkg_profile('CIS-4.1'))
+    minion.profile('top.nova', {'nova': {'*': ['a', {'b': 'CIS-3*'}],
+                                         'G@os:Ubuntu': ['c']}})
+
+    ret = hubble.top()
+
+    # The same as auditing each matching entry on its own
+    expected = {}
+    for ret_ in (hubble.audit('a'), hubble.audit('b', tags='CIS-3*')):
+        for key in ('Success', 'Failure'):
+            expected.setdefault(key, []).extend(ret_.get(key, []))
+    assert sorted(ret['Failure']) == sorted(expected['Failure']) == \
+        [{'CIS-1.1': 'telnet'}, {'CIS-2.1': 'telnet'}, {'CIS-3.1': 'telnet'}]
+    assert 'Success' not in ret
+    assert ret['Compliance'] == '0%'
+
+
+def _count_calls(monkeypatch, obj, name):
+    calls = []
+    func = getattr(obj, name)
+
+    def _counted(*args, **kwargs):
+        calls.append(args)
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr(obj, name, _counted)
+    return calls
+
+
+def test_topfile_cache(minion, monkeypatch):
+    minion.profile('top.nova', {'nova': {'*': ['a']}})
+    path = os.path.join(minion.profile_dir, 'top.nova')
+    parsed = _count_calls(monkeypatch, hubble.yaml, 'safe_load')
+
+    assert hubble._load_topfile(path) == {'*': ['a']}
+    assert hubble._load_topfile(path) == {'*': ['a']}
+    assert len(parsed) == 1
+
+    minion.profile('top.nova', {'nova': {'*': ['a', 'b']}})
+    assert hubble._load_topfile(path) == {'*': ['a', 'b']}
+    assert len(parsed) == 2
+
+
+def test_compound_match_cache(minion):
+    matched = []
+    minion.salt['match.compound'] = lambda match: matched.append(match) or \
+        match != 'G@os:Ubuntu'
+    targets = ['*', 'G@os:Ubuntu', 'G@os:CentOS']
+
+    assert hubble._compound_matches(targets) == ['*', 'G@os:CentOS']
+    assert hubble._compound_matches(targets + ['I@role:web']) == \
+        ['*', 'G@os:CentOS', 'I@role:web']
+    assert matched == targets + ['I@role:web']
+
+    # Forgotten when the grains or pillar change
+    minion.pillar['role'] = 'db'
+    hubble._compound_matches(targets)
+    assert matched == targets + ['I@role:web'] + targets
+
+
+def test_plan(minion):
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: pytest.fail('plan ran a check')
+    minion.profile('cis.yaml', _pkg_profile('CIS-1', 'CIS-2', 'CIS-2', 'OTHER-1'))
+    hubble.load()
+    hubble._record_timings({'/pkg.py': {
+        'wall': 3.0, 'cpu': 1.0, 'subprocesses': 2, 'file_reads': 0,
+        'tags': {'CIS-1': {'wall': 2.0, 'cpu': 0.5, 'subprocesses': 1, 'file_reads': 0}}}})
+
+    ret = hubble.plan('cis', tags='CIS-*')
+
+    module_plan = ret['Modules']['/pkg.py']
+    assert module_plan['checks'] == 3
+    assert module_plan['tags'] == {
+        'CIS-1': {'checks': 1, 'wall': 2.0, 'cpu': 0.5, 'subprocesses': 1, 'file_reads': 0},
+        'CIS-2': {'checks': 2}}
+    # The untagged cost plus the tags which have been profiled
+    assert module_plan['wall'] == 3.0
+    assert module_plan['subprocesses'] == 2
+    assert ret['Unknown'] == ['/pkg.py:CIS-2']
+    assert ret['Total'] == {'modules': 1, 'tags': 2, 'checks': 3, 'runtime': 3.0,
+                            'wall': 3.0, 'cpu': 1.0, 'subprocesses': 2, 'file_reads': 0}
+
+
+def test_plan_runtime():
+    assert hubble._plan_runtime([3.0, 1.0, 2.0], 1) == 6.0
+    assert hubble._plan_runtime([3.0, 1.0, 2.0], 2) == 3.0
+    assert hubble._plan_runtime([3.0, 1.0, 2.0, 2.0], 2) == 4.0
+    assert hubble._plan_runtime([], 4) == 0
+
+
+def test_facts_shared_by_modules(minion):
+    calls = []
+
+    def called(name, value):
+        def _call(*args):
+            calls.append((name,) + args)
+            return value
+        return _call
+
+    minion.salt['sysctl.show'] = called('sysctl.show', {'net.ipv4.ip_forward': '0',
+                                                        'kernel.randomize_va_space': '2'})
+    minion.salt['sysctl.get'] = called('sysctl.get', '1')
+    minion.salt['mount.active'] = called('mount.active', {'/': {'opts': ['rw', 'nodev']}})
+    sysctls = dict(
+        (tag, {'data': {'*': [{name: {'tag': tag, 'match_output': value}}]},
+               'description': tag})
+        for tag, name, value in (('CIS-1', 'net.ipv4.ip_forward', '0'),
+                                 ('CIS-2', 'kernel.randomize_va_space', '2'),
+                                 ('CIS-3', 'fs.suid_dumpable', '0')))
+    mounts = dict(
+        (tag, {'data': {'*': [{'/': {'tag': tag, 'attribute': attribute}}]},
+               'description': tag})
+        for tag, attribute in (('CIS-4', 'nodev'), ('CIS-5', 'noexec')))
+    minion.profile('cis.yaml', {'sysctl': sysctls, 'mount': {'whitelist': mounts}})
+
+    ret = hubble.audit('cis')
+
+    assert sorted(ret['Success']) == [{'CIS-1': 'CIS-1'}, {'CIS-2': 'CIS-2'},
+                                      {'CIS-4': 'CIS-4'}]
+    # Gathered once for every check, with a fallback for unlisted parameters
+    assert sorted(calls) == [('mount.active',), ('sysctl.get', 'fs.suid_dumpable'),
+                             ('sysctl.show',)]
+
+    # And again for the next audit
+    hubble.audit('cis')
+    assert len(calls) == 6
+
+
+def test_read_colon_file(tmpdir):
+    path = tmpdir.join('passwd')
+    path.write('root:x:0:0:root:/root:/bin/bash\n\n'
+               'alice:x:1000:1000::/home/alice:/bin/sh\n')
+
+    assert hubble._read_colon_file(str(path)) == [
+        ['root', 'x', '0', '0', 'root', '/root', '/bin/bash'],
+        ['alice', 'x', '1000', '1000', '', '/home/alice', '/bin/sh']]
+    assert hubble._read_colon_file(str(tmpdir.join('missing'))) == []
@@ -0,0 +1,204 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+import os
+import pwd
+import tempfile
+
+import py
+import pytest
+
+
+def test_directory_files_permission(tmpdir, nova_module):
+    misc = nova_module('misc')
+    logs = tmpdir.mkdir('log')
+    logs.join('ok.log').write('')
+    logs.mkdir('app').join('bad.log').write('')
+    os.chmod(str(logs.join('ok.log')), 0o640)
+    os.chmod(str(logs.join('app', 'bad.log')), 0o666)
+
+    # Only the files under path are checked
+    ret = misc.check_directory_files_permission(str(logs), '644')
+    assert ret is not True
+    assert str(logs.join('app', 'bad.log')) in ret
+    assert 'ok.log' not in ret
+
+    os.chmod(str(logs.join('app', 'bad.log')), 0o600)
+    assert misc.check_directory_files_permission(str(logs), '644') is True
+
+
+@pytest.fixture
+def home():
+    # Not under tmpdir, whose path may include "root", which would exclude
+    # the user from the login users' checks
+    home = py.path.local(tempfile.mkdtemp(prefix='hubble-home-'))
+    yield home
+    home.remove(rec=1)
+
+
+def test_users_dot_files_sees_mode_changes(minion, home, nova_module, monkeypatch):
+    misc = nova_module('misc')
+    # Even with the file index on, dot files are checked as they are now
+    minion.config['hubblestack:nova:file_index_max_age'] = 3600
+    home.join('.profile').write('')
+    home.mkdir('.config').join('.netrc').write('')
+    for path in ('.profile', '.config/.netrc'):
+        os.chmod(str(home.join(path)), 0o600)
+    for path in (str(home.join('.config')), str(home)):
+        os.utime(path, (1000000000, 1000000000))
+    monkeypatch.setattr(misc.__facts__, 'passwd',
+                        lambda: [['alice', 'x', '1000', '1000', '', str(home), '/bin/bash']])
+
+    assert misc.check_users_dot_files() is True
+
+    os.chmod(str(home.join('.config', '.netrc')), 0o666)
+    misc.__facts__.clear()
+    ret = misc.check_users_dot_files()
+    assert ret is not True
+    assert 'Other Write permission set on file {0}'.format(home.join('.config', '.netrc')) in ret
+
+
+def test_if_any_pkg_installed(minion, nova_module):
+    misc = nova_module('misc')
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'xinetd': ['2.3']}
+
+    assert misc.check_if_any_pkg_installed('rsh,xinetd') is True
+    assert misc.check_if_any_pkg_installed('rsh,xinet*') is True
+    assert misc.check_if_any_pkg_installed('rsh,telnet*') is False
+
+
+def test_directory_files_permission_with_index(minion, tmpdir, nova_module):
+    misc = nova_module('misc')
+    minion.config['hubblestack:nova:file_index_max_age'] = 3600
+    logs = tmpdir.mkdir('log')
+    logs.join('messages').write('')
+    os.chmod(str(logs.join('messages')), 0o600)
+    os.utime(str(logs), (1000000000, 1000000000))
+    assert misc.check_directory_files_permission(str(logs), '644') is True
+
+    os.chmod(str(logs.join('messages')), 0o666)
+    misc.__facts__.clear()
+    assert str(logs.join('messages')) in misc.check_directory_files_permission(str(logs), '644')
+
+
+def test_find_checks_walk_once(minion, tmpdir, nova_module, monkeypatch):
+    misc = nova_module('misc')
+    root = tmpdir.mkdir('root')
+    root.join('ok').write('')
+    root.join('writable').write('')
+    root.mkdir('shared')
+    root.mkdir('tmp')
+    root.join('tmp', 'orphan').write('')
+    os.chmod(str(root.join('ok')), 0o644)
+    os.chmod(str(root.join('writable')), 0o666)
+    os.chmod(str(root.join('shared')), 0o777)
+    os.chmod(str(root.join('tmp')), 0o1777)
+    if os.getuid() == 0:
+        # A uid and gid no one has
+        os.chown(str(root.join('tmp', 'orphan')), 2 ** 31 - 7, 2 ** 31 - 7)
+    ran = []
+    minion.salt['cmd.run'] = lambda cmd, **kwargs: ran.append(cmd) or str(root)
+    minion.salt['mount.active'] = lambda: {str(root): {'fstype': 'nfs'}}
+    walked = []
+    files = misc.__facts__.files
+    monkeypatch.setattr(misc.__facts__, 'files', lambda root: walked.append(root) or files(root))
+
+    assert misc.world_writable_file() == str(root.join('writable'))
+    assert misc.sticky_bit_on_world_writable_dirs() == 'There are failures'
+    if os.getuid() == 0:
+        assert misc.unowned_files_or_dir() == str(root.join('tmp', 'orphan'))
+        assert misc.ungrouped_files_or_dir() == str(root.join('tmp', 'orphan'))
+        assert misc.check_unowned_files() == str([str(root.join('tmp', 'orphan'))])
+        assert misc.check_ungrouped_files() == str([str(root.join('tmp', 'orphan'))])
+
+    # One df and one walk, however many checks search the root
+    assert len(ran) == 1
+    assert walked == [str(root)]
+
+    os.chmod(str(root.join('shared')), 0o1777)
+    misc.__facts__.clear()
+    assert misc.sticky_bit_on_world_writable_dirs() is True
+    assert walked == [str(root)] * 2
+
+
+PASSWD = [['root', 'x', '0', '0', 'root', '/root', '/bin/bash'],
+          ['sync', 'x', '5', '0', 'sync', '/sbin', '/bin/sync'],
+          ['daemon', 'x', '2', '0', 'daemon', '/sbin', '/bin/bash'],
+          ['nobody', 'x', '99', '0', 'Nobody', '/', '/sbin/nologin'],
+          ['toor', 'x', '0', '2147483640', '', '/root', '/bin/sh'],
+          ['app', 'x', 'abc', '0', '', '/srv', '/bin/bash'],
+          ['daemon', 'x', '1000', '0'],
+          ['+nis']]
+
+GROUP = [['root', 'x', '0', ''],
+         ['daemon', 'x', '2', ''],
+         ['wheel', 'x', '2', 'alice'],
+         ['root', 'x', '10']]
+
+SHADOW = [['root', '$6$hash', '17000', '0', '99999', '7', '', '', ''],
+          ['daemon', '', '17000'],
+          ['app']]
+
+
+def test_account_checks(minion, nova_module, monkeypatch):
+    misc = nova_module('misc')
+    minion.salt['cmd.run'] = lambda cmd, **kwargs: pytest.fail('ran ' + cmd)
+    monkeypatch.setattr(misc.__facts__, 'passwd', lambda: PASSWD)
+    monkeypatch.setattr(misc.__facts__, 'group', lambda: GROUP)
+    monkeypatch.setattr(misc.__facts__, 'shadow', lambda: SHADOW)
+
+    assert misc.check_password_fields_not_empty() == 'daemon does not have a password \napp does not have a password'
+    # awk compares "abc" with 500 as strings, and skips the +nis entry
+    assert misc.system_account_non_login() == \
+        'daemon:x:2:0:daemon:/sbin:/bin/bash\ntoor:x:0:2147483640::/root:/bin/sh'
+    assert misc.default_group_for_root() is True
+    assert misc.root_is_only_uid_0_account() == 'root\ntoor'
+    assert misc.check_duplicate_uids() == str(['0'])
+    assert misc.check_duplicate_gids() == str(['2'])
+    assert misc.check_duplicate_unames() == str(['daemon'])
+    assert misc.check_duplicate_gnames() == str(['root'])
+    assert misc.check_groups_validity() == str(['Invalid groupid: 2147483640 in /etc/passwd file'])
+
+
+def test_home_directory_checks(minion, home, nova_module, monkeypatch):
+    misc = nova_module('misc')
+    minion.salt['cmd.run'] = lambda cmd, **kwargs: pytest.fail('ran ' + cmd)
+    alice = home.mkdir('alice')
+    bob = home.mkdir('bob')
+    alice.join('.forward').write('')
+    alice.join('.netrc').write('')
+    alice.mkdir('.rhosts')
+    bob.join('.rhosts').write('')
+    os.chmod(str(alice), 0o755)
+    os.chmod(str(bob), 0o700)
+    os.chmod(str(alice.join('.netrc')), 0o644)
+    owner = pwd.getpwuid(os.getuid()).pw_name
+    monkeypatch.setattr(misc.__facts__, 'passwd', lambda: [
+        ['alice', 'x', '1000', '1000', '', str(alice), '/bin/bash'],
+        ['bob', 'x', '1001', '1001', '', str(bob), '/bin/bash'],
+        ['carol', 'x', '1002', '1002', '', str(home.join('carol')), '/bin/bash'],
+        [owner, 'x', '1003', '1003', '', str(bob), '/sbin/nologin']])
+    listings = []
+    listdir = misc.os.listdir
+    monkeypatch.setattr(misc.os, 'listdir', lambda path: listings.append(path) or listdir(path))
+
+    assert misc.check_all_users_home_directory('1000') == str(
+        ['Either home directory {0} of user carol is invalid or does not exist.'.format(home.join('carol'))])
+    assert misc.check_users_home_directory_permissions() == str(
+        ['permission on home directory {0} of user alice is wrong: '.format(alice) +
+         misc._check_permissions('755', '750')])
+    assert misc.check_users_own_their_home('1000') == str(
+        ['The home directory {0} of user alice is owned by {1}'.format(alice, owner),
+         'The home directory {0} of user bob is owned by {1}'.format(bob, owner),
+         'Either home directory {0} of user carol is invalid or does not exist.'.format(home.join('carol'))])
+    assert misc.check_users_forward_files() == str(
+        ['Home directory: {0}, for user: alice has {0}/.forward file'.format(alice)])
+    assert misc.check_users_netrc_files() == str(
+        ['Home directory: {0}, for user: alice has .netrc file'.format(alice)])
+    # A .rhosts directory isn't a .rhosts file
+    assert misc.check_users_rhosts_files() == str(
+        ['Home directory: {0}, for user: bob has .rhosts file'.format(bob)])
+    assert misc.check_netrc_files_accessibility() == \
+        'Group Read set on {0}/.netrc\nOther Read set on {0}/.netrc'.format(alice)
+
+    # Each home directory is listed once for all of the checks
+    assert sorted(listings) == [str(alice), str(bob)]
@@ -0,0 +1,47 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+
+import pytest
+import yaml
+
+import nebula_osquery
+
+
+@pytest.fixture
+def nebula(minion, monkeypatch):
+    monkeypatch.setattr(nebula_osquery, '__salt__', minion.salt, raising=False)
+    monkeypatch.setattr(nebula_osquery, '__opts__', minion.opts, raising=False)
+    monkeypatch.setattr(nebula_osquery, '__grains__', minion.grains, raising=False)
+    monkeypatch.setattr(nebula_osquery, '__pillar__', minion.pillar, raising=False)
+    monkeypatch.setattr(nebula_osquery, '_TOP_CACHE', {})
+    monkeypatch.setattr(nebula_osquery, '_MATCH_CACHE', {'context': None, 'matches': {}})
+    return nebula_osquery
+
+
+def test_top_data_is_cached(minion, nebula, tmpdir, monkeypatch):
+    topfile = tmpdir.join('top.nebula')
+    topfile.write(yaml.safe_dump({'nebula': {'*': ['day'], 'G@os:Ubuntu': ['ubuntu']}}))
+    matched = []
+    minion.salt['cp.cache_file'] = lambda path: str(topfile)
+    minion.salt['match.compound'] = lambda match: matched.append(match) or match == '*'
+    parsed = []
+    safe_load = nebula.yaml.safe_load
+    monkeypatch.setattr(nebula.yaml, 'safe_load',
+                        lambda handle: parsed.append(handle) or safe_load(handle))
+
+    assert nebula.get_top_data('salt://top.nebula') == ['day']
+    assert nebula.get_top_data('salt://top.nebula') == ['day']
+    assert len(parsed) == 1
+    assert sorted(matched) == ['*', 'G@os:Ubuntu']
+
+    topfile.write(yaml.safe_dump({'nebula': {'*': ['day', 'hour']}}))
+    assert nebula.get_top_data('salt://top.nebula') == ['day', 'hour']
+    assert len(parsed) == 2
+    assert len(matched) == 2
+
+
+def test_top_data_without_topfile(minion, nebula):
+    # cp.cache_file returns False when the topfile can't be fetched
+    minion.salt['cp.cache_file'] = lambda path: False
+    with pytest.raises(nebula.CommandExecutionError):
+        nebula.get_top_data('salt://top.nebula')
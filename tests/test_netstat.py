@@ -0,0 +1,30 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+
+SOCKETS = [
+    {'proto': 'tcp', 'local-address': '0.0.0.0:22', 'remote-address': '0.0.0.0:*',
+     'state': 'LISTEN', 'program': '1/sshd', 'user': '0', 'inode': '1',
+     'recv-q': '0', 'send-q': '0'},
+    {'proto': 'tcp', 'local-address': '127.0.0.1:25', 'remote-address': '0.0.0.0:*',
+     'state': 'LISTEN', 'program': '2/master', 'user': '0', 'inode': '2',
+     'recv-q': '0', 'send-q': '0'},
+    {'proto': 'udp', 'local-address': '0.0.0.0:68', 'remote-address': '0.0.0.0:*',
+     'program': '3/dhclient', 'user': '0', 'inode': '3', 'recv-q': '0', 'send-q': '0'},
+]
+
+
+def test_audit(nova_module, monkeypatch):
+    netstat = nova_module('netstat')
+    sockets = [dict(sock) for sock in SOCKETS]
+    monkeypatch.setattr(netstat.__facts__, 'sockets', lambda: sockets)
+    profile = {'netstat': {'ssh': {'address': '*:22'},
+                           'smtp': {'address': ['127.0.0.1:25', '::1:25']}}}
+
+    ret = netstat.audit([('ports', profile)], '*')
+
+    assert [(sock['local-address'], sock['description']) for sock in ret['Success']] == \
+        [('0.0.0.0:22', 'ssh'), ('127.0.0.1:25', 'smtp')]
+    assert [(sock['tag'], sock['description']) for sock in ret['Failure']] == \
+        [('0.0.0.0:68', '3/dhclient')]
+    # The shared sockets are left alone
+    assert sockets == SOCKETS
@@ -0,0 +1,209 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+import fnmatch
+import os
+
+import pytest
+
+import hubble
+import nova_loader
+
+
+def _new_loader(monkeypatch):
+    '''
+    Load from scratch, as a new minion job would
+    '''
+    monkeypatch.setattr(hubble, '__nova__', {})
+    hubble.load()
+    return hubble.__nova__
+
+
+def _count_parses(monkeypatch):
+    parsed = []
+    load = nova_loader.yaml.load
+
+    def _load(contents, *args, **kwargs):
+        parsed.append(contents)
+        return load(contents, *args, **kwargs)
+
+    monkeypatch.setattr(nova_loader.yaml, 'load', _load)
+    return parsed
+
+
+def test_profile_cache(minion, monkeypatch):
+    minion.profile('cis/a.yaml', {'pkg': {'blacklist': {}}})
+    path = os.path.join(minion.profile_dir, 'cis', 'a.yaml')
+    parsed = _count_parses(monkeypatch)
+
+    assert _new_loader(monkeypatch).__data__['/cis/a.yaml'] == {'pkg': {'blacklist': {}}}
+    assert len(parsed) == 1
+    assert os.listdir(os.path.join(minion.cachedir, 'hubble', 'nova_profiles'))
+
+    # Unchanged profiles come from the cache
+    assert _new_loader(monkeypatch).__data__['/cis/a.yaml'] == {'pkg': {'blacklist': {}}}
+    assert len(parsed) == 1
+
+    # Rewritten with the same contents, as hubble.sync does: hashed, not parsed
+    minion.profile('cis/a.yaml', {'pkg': {'blacklist': {}}})
+    os.utime(path, (1000000000, 1000000000))
+    assert _new_loader(monkeypatch).__data__['/cis/a.yaml'] == {'pkg': {'blacklist': {}}}
+    assert len(parsed) == 1
+
+    minion.profile('cis/a.yaml', {'pkg': {'whitelist': {}}})
+    assert _new_loader(monkeypatch).__data__['/cis/a.yaml'] == {'pkg': {'whitelist': {}}}
+    assert len(parsed) == 2
+
+
+def test_reload_only_changed_files(minion, monkeypatch):
+    minion.profile('cis/a.yaml', {'pkg': {'blacklist': {}}})
+    minion.profile('cis/b.yaml', {'sysctl': {'blacklist': {}}})
+    hubble.load()
+    loader = hubble.__nova__
+    module = os.path.join(minion.cachedir, 'files', 'base', 'hubblestack_nova', 'pkg.py')
+    listed = []
+    listdir = nova_loader.os.listdir
+
+    def _listdir(path):
+        listed.append(path)
+        return listdir(path)
+
+    monkeypatch.setattr(nova_loader.os, 'listdir', _listdir)
+
+    # Nothing changed, so no directory is listed again and nothing is loaded
+    assert loader.reload() == []
+    assert listed == []
+
+    minion.profile('cis/c.yaml', {'mount': {'blacklist': {}}})
+    minion.profile('cis/a.yaml', {'pkg': {'whitelist': {}}})
+    os.remove(os.path.join(minion.profile_dir, 'cis', 'b.yaml'))
+    # Rewritten, but the same code
+    with open(module) as fh_:
+        code = fh_.read()
+    with open(module, 'w') as fh_:
+        fh_.write(code)
+    os.utime(module, (1000000000, 1000000000))
+
+    assert loader.reload() == ['/cis/a.yaml', '/cis/b.yaml', '/cis/c.yaml']
+    assert listed == [os.path.join(minion.profile_dir, 'cis')]
+    assert sorted(loader.__data__) == ['/cis/a.yaml', '/cis/c.yaml']
+    assert loader.__data__['/cis/a.yaml'] == {'pkg': {'whitelist': {}}}
+    assert '/pkg.py' in loader._dict
+
+
+def test_git_directories_are_skipped(minion):
+    minion.profile('cis/a.yaml', {'pkg': {'blacklist': {}}})
+    minion.profile('.git/b.yaml', {'pkg': {'blacklist': {}}})
+    hubble.load()
+    assert sorted(hubble.__nova__.__data__) == ['/cis/a.yaml']
+
+
+TAGS = ['CIS-1.1', 'CIS-1.10', 'CIS-2.1', 'cis-1.1', 'CIS-[1]', 'CIS-1?1', '']
+
+
+@pytest.mark.parametrize('glob', ['*', 'CIS-1.1', 'CIS-1*', 'CIS-?.1', 'CIS-[12].1',
+                                  'CIS-[!1]*', 'CIS-[[]1]', 'cis-*', ''])
+def test_matcher_tag(glob):
+    matcher = nova_loader.NovaMatcher({})
+    for tag in TAGS:
+        assert matcher.tag(tag, glob) == fnmatch.fnmatch(tag, glob), tag
+
+
+def test_matcher_tag_globs():
+    matcher = nova_loader.NovaMatcher({})
+    assert matcher.tag('CIS-2.1', ('CIS-1*', 'CIS-2*'))
+    assert not matcher.tag('CIS-3.1', ('CIS-1*', 'CIS-2*'))
+
+
+def test_matcher_osfinger():
+    grains = {'osfinger': 'CentOS Linux-7', 'osfullname': 'Microsoft Windows Server 2012'}
+    matcher = nova_loader.NovaMatcher(grains)
+
+    assert matcher.osfinger('CentOS Linux-7')
+    assert matcher.osfinger('Ubuntu-16.04, CentOS*')
+    assert not matcher.osfinger('CentOS Linux-6')
+    assert matcher.osfinger('*Windows*', grain='osfullname')
+    assert not matcher.osfinger('*', grain='missing')
+
+    # Cached results are thrown away when the grain changes
+    grains['osfinger'] = 'CentOS Linux-6'
+    assert matcher.osfinger('CentOS Linux-6')
+    assert not matcher.osfinger('CentOS Linux-7')
+
+
+PKG_PROFILE = {
+    'pkg': {
+        'blacklist': {
+            'telnet': {
+                'data': {'CentOS Linux-6': [{'telnet': 'CIS-6'}],
+                         'CentOS Linux-*': [{'telnet': 'CIS-2.1.1'},
+                                            {'telnet-server': {'tag': 'CIS-2.1.2',
+                                                               'version': '>=1.0'}}],
+                         '*': [{'telnet': 'CIS-ANY'}]},
+                'description': 'telnet',
+            },
+        },
+        'whitelist': {
+            'ssh': {
+                'data': {'Ubuntu-*': [{'openssh': 'CIS-UBUNTU'}],
+                         '*': {'openssh': 'CIS-5.2'}},
+                'description': 'ssh',
+            },
+        },
+    },
+}
+
+
+def _tag_table(grains=None):
+    return nova_loader.NovaTagTable(nova_loader.NovaMatcher(grains or {'osfinger': 'CentOS Linux-7'}))
+
+
+def test_tag_table_list_layout():
+    tags = _tag_table().tags([('cis', PKG_PROFILE)], 'pkg',
+                             toplists=('blacklist', 'whitelist'))
+
+    assert tags == {
+        'CIS-2.1.1': [{'name': 'telnet', 'tag': 'CIS-2.1.1', 'module': 'pkg',
+                       'type': 'blacklist', 'description': 'telnet', 'nova_profile': 'cis'}],
+        'CIS-2.1.2': [{'name': 'telnet-server', 'tag': 'CIS-2.1.2', 'module': 'pkg',
+                       'type': 'blacklist', 'version': '>=1.0', 'description': 'telnet',
+                       'nova_profile': 'cis'}],
+        # No osfinger section matched, and a (malformed) dict instead of a list
+        'CIS-5.2': [{'name': 'openssh', 'tag': 'CIS-5.2', 'module': 'pkg',
+                     'type': 'whitelist', 'description': 'ssh', 'nova_profile': 'cis'}],
+    }
+
+
+def test_tag_table_layouts():
+    table = _tag_table()
+    single = {'sysctl': {'ip_forward': {'data': {'*': {'tag': 'CIS-4.1', 'match_output': '0'}},
+                                        'description': 'forwarding'}}}
+    flat = {'openssl': {'google': {'data': {'tag': 'CERT-1', 'endpoint': 'google.com'},
+                                   'description': 'google'}}}
+
+    assert table.tags([('', single)], 'sysctl', layout='single') == \
+        {'CIS-4.1': [{'tag': 'CIS-4.1', 'module': 'sysctl', 'match_output': '0',
+                      'description': 'forwarding'}]}
+    assert table.tags([('', flat)], 'openssl', layout='flat') == \
+        {'CERT-1': [{'tag': 'CERT-1', 'module': 'openssl', 'endpoint': 'google.com',
+                     'description': 'google'}]}
+
+
+def test_tag_table_is_cached_per_profile():
+    grains = {'osfinger': 'CentOS Linux-7'}
+    table = _tag_table(grains)
+    data_list = [('cis', PKG_PROFILE)]
+    args = {'toplists': ('blacklist', 'whitelist')}
+
+    first = table.tags(data_list, 'pkg', **args)
+    # Copies, so modules can add to them
+    first['CIS-5.2'][0]['found'] = True
+    assert 'found' not in table.tags(data_list, 'pkg', **args)['CIS-5.2'][0]
+    assert len(table._tables) == 1
+
+    # Rebuilt when the grain it was resolved against changes
+    grains['osfinger'] = 'Ubuntu-16.04'
+    assert 'CIS-UBUNTU' in table.tags(data_list, 'pkg', **args)
+    assert len(table._tables) == 1
+
+    table.discard(PKG_PROFILE)
+    assert table._tables == {}
@@ -0,0 +1,108 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+import threading
+import time
+
+import pytest
+
+crypto = pytest.importorskip('OpenSSL.crypto')
+
+PROFILE = {
+    'openssl': {
+        'example': {
+            'data': {'tag': 'CERT-1', 'endpoint': 'example.com', 'not_after': 10},
+            'description': 'example.com certificate',
+        },
+    },
+}
+
+
+def _pem():
+    key = crypto.PKey()
+    key.generate_key(crypto.TYPE_RSA, 1024)
+    cert = crypto.X509()
+    cert.get_subject().CN = 'example.com'
+    cert.set_serial_number(1)
+    cert.gmtime_adj_notBefore(-86400)
+    cert.gmtime_adj_notAfter(365 * 86400)
+    cert.set_issuer(cert.get_subject())
+    cert.set_pubkey(key)
+    cert.sign(key, 'sha256')
+    return crypto.dump_certificate(crypto.FILETYPE_PEM, cert)
+
+
+@pytest.fixture
+def openssl_job(nova_module, monkeypatch):
+    '''
+    Load a fresh copy of the openssl module (as a new minion job would),
+    serving every endpoint the same certificate. Returns the list of
+    endpoints fetched, and the function which loads the module.
+    '''
+    pem = _pem()
+    fetched = []
+
+    def _load():
+        openssl = nova_module('openssl')
+
+        def get_cert(server, port=443, timeout=None):
+            fetched.append((server, port))
+            return pem
+
+        monkeypatch.setattr(openssl, '_get_cert_from_endpoint', get_cert)
+        return openssl
+    return fetched, _load
+
+
+def test_endpoint_cache_survives_the_process(minion, openssl_job):
+    fetched, load = openssl_job
+    data_list = [('cert', PROFILE)]
+
+    ret = load().audit(data_list, '*')
+    assert [tag_data['tag'] for tag_data in ret['Success']] == ['CERT-1']
+    assert fetched == [('example.com', 443)]
+
+    # A new job starts with an empty _X509_CACHE, but reuses the saved pem
+    ret = load().audit(data_list, '*')
+    assert [tag_data['tag'] for tag_data in ret['Success']] == ['CERT-1']
+    assert fetched == [('example.com', 443)]
+
+    minion.config['hubblestack:nova:openssl:cache_ttl'] = 0
+    ret = load().audit(data_list, '*')
+    assert [tag_data['tag'] for tag_data in ret['Success']] == ['CERT-1']
+    assert fetched == [('example.com', 443)] * 2
+
+
+def test_endpoints_fetched_concurrently(minion, nova_module, monkeypatch):
+    openssl = nova_module('openssl')
+    pem = _pem()
+    release = threading.Event()
+
+    def get_cert(server, port=443, timeout=None):
+        if server == 'unreachable.example.com':
+            release.wait(30)
+        else:
+            time.sleep(0.6)
+        return pem
+
+    monkeypatch.setattr(openssl, '_get_cert_from_endpoint', get_cert)
+    minion.config['hubblestack:nova:openssl:workers'] = 4
+    minion.config['hubblestack:nova:openssl:deadline'] = 1
+    minion.config['hubblestack:nova:openssl:cache_ttl'] = 0
+    profile = {'openssl': dict(
+        (server, {'data': {'tag': server, 'endpoint': server}, 'description': server})
+        for server in ('a.example.com', 'b.example.com', 'c.example.com',
+                       'unreachable.example.com'))}
+
+    start = time.time()
+    try:
+        ret = openssl.audit([('cert', profile)], '*')
+    finally:
+        release.set()
+
+    # Fetched one after another, only one endpoint would beat the deadline;
+    # the unreachable one is given up on rather than waited for
+    assert time.time() - start < 2
+    assert sorted(tag_data['tag'] for tag_data in ret['Success']) == \
+        ['a.example.com', 'b.example.com', 'c.example.com']
+    assert [(tag_data['tag'], tag_data['reason']) for tag_data in ret['Failure']] == \
+        [('unreachable.example.com', 'Timed out retrieving the certificate')]
@@ -0,0 +1,74 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+
+import pytest
+
+
+def _profile(toplist, checks):
+    return {'pkg': {toplist: dict(
+        (tag, {'data': {'*': [{name: check}]}, 'description': tag})
+        for tag, name, check in checks)}}
+
+
+def _results(ret):
+    return dict((key, sorted(tag_data['tag'] for tag_data in ret[key]))
+                for key in ('Success', 'Failure'))
+
+
+def test_blacklist(minion, nova_module):
+    pkg = nova_module('pkg')
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'telnet-server': ['1.0'],
+                                                     'xinetd': ['2.3']}
+    profile = _profile('blacklist', [('TELNET', 'telnet', 'TELNET'),
+                                     ('TELNET-GLOB', 'telnet*', 'TELNET-GLOB'),
+                                     ('XINETD-GLOB', 'xinetd*', 'XINETD-GLOB'),
+                                     ('RSH-GLOB', 'rsh*', 'RSH-GLOB')])
+
+    ret = pkg.audit([('blacklist', profile)], '*')
+
+    assert _results(ret) == {'Success': ['RSH-GLOB', 'TELNET'],
+                             'Failure': ['TELNET-GLOB', 'XINETD-GLOB']}
+
+
+def test_whitelist_versions(minion, nova_module):
+    pkg = nova_module('pkg')
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: {'openssh': ['7.4'],
+                                                     'openssh-server': ['7.4']}
+    profile = _profile('whitelist', [
+        ('ANY', 'openssh', 'ANY'),
+        ('MISSING', 'rsh', 'MISSING'),
+        ('GLOB', 'openssh-*', 'GLOB'),
+        ('PEG', 'openssh', {'tag': 'PEG', 'version': '7.4'}),
+        ('PEG-BAD', 'openssh', {'tag': 'PEG-BAD', 'version': '7.3'}),
+        ('MIN', 'openssh', {'tag': 'MIN', 'version': '>=7.0'}),
+        ('MIN-BAD', 'openssh', {'tag': 'MIN-BAD', 'version': '>=7.10'}),
+        ('MAX', 'openssh', {'tag': 'MAX', 'version': '<=7.4'}),
+        ('MAX-BAD', 'openssh', {'tag': 'MAX-BAD', 'version': '<=6.9'}),
+        ('MIN-MISSING', 'rsh', {'tag': 'MIN-MISSING', 'version': '>=1.0'}),
+        ('BAD-MODIFIER', 'openssh', {'tag': 'BAD-MODIFIER', 'version': '~=7.4'}),
+    ])
+
+    ret = pkg.audit([('whitelist', profile)], '*')
+
+    assert _results(ret) == {
+        'Success': ['ANY', 'GLOB', 'MAX', 'MIN', 'PEG'],
+        'Failure': ['BAD-MODIFIER', 'MAX-BAD', 'MIN-BAD', 'MIN-MISSING', 'MISSING', 'PEG-BAD']}
+    error = [tag_data for tag_data in ret['Failure'] if tag_data['tag'] == 'BAD-MODIFIER'][0]
+    assert error['error'] == 'Invalid modifier ~'
+
+
+def test_one_package_listing(minion, nova_module):
+    pkg = nova_module('pkg')
+    listed = []
+    minion.salt['pkg.list_pkgs'] = lambda **kwargs: listed.append(kwargs) or \
+        {'openssh': ['7.4'], 'telnet': ['1.0']}
+    minion.salt['pkg.version'] = lambda *names: pytest.fail('pkg.version called')
+    profile = _profile('whitelist', [('SSH-{0}'.format(index), 'openssh',
+                                      {'tag': 'SSH-{0}'.format(index), 'version': '>=7.{0}'.format(index)})
+                                     for index in range(10)])
+
+    ret = pkg.audit([('whitelist', profile)], '*')
+
+    assert len(ret['Success']) == 5
+    assert len(ret['Failure']) == 5
+    assert listed == [{'versions_as_list': True}]
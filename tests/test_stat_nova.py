@@ -0,0 +1,76 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+import grp
+import os
+import pwd
+
+import pytest
+
+
+def _profile(checks):
+    return {'stat': {'modes': {'data': {'*': [{path: check} for path, check in checks]},
+                               'description': 'file modes'}}}
+
+
+def test_mode_format(tmpdir, nova_module):
+    stat_nova = nova_module('stat_nova')
+    modes = {'none': 0, 'setuid': 0o4755, 'plain': 0o644}
+    for name, mode in modes.items():
+        tmpdir.join(name).write('')
+        os.chmod(str(tmpdir.join(name)), mode)
+    paths = dict((name, str(tmpdir.join(name))) for name in modes)
+
+    # The same strings as file.stats
+    stats = stat_nova._stats(paths.values())
+    assert stats[paths['none']]['mode'] == '0'
+    assert stats[paths['setuid']]['mode'] == '04755'
+    assert stats[paths['plain']]['mode'] == '0644'
+
+    profile = _profile([(paths['none'], {'tag': 'NONE', 'mode': 0}),
+                        (paths['none'], {'tag': 'NONE-STRICT', 'mode': 0,
+                                         'allow_more_strict': True}),
+                        (paths['setuid'], {'tag': 'SETUID', 'mode': 4755}),
+                        (paths['setuid'], {'tag': 'SETUID-STRICT', 'mode': 4755,
+                                           'allow_more_strict': True}),
+                        (paths['plain'], {'tag': 'PLAIN', 'mode': 644}),
+                        (paths['plain'], {'tag': 'PLAIN-BAD', 'mode': 600})])
+    ret = stat_nova.audit([('modes', profile)], '*')
+
+    assert sorted(tag_data['tag'] for tag_data in ret['Success']) == \
+        ['NONE', 'NONE-STRICT', 'PLAIN', 'SETUID', 'SETUID-STRICT']
+    assert [tag_data['tag'] for tag_data in ret['Failure']] == ['PLAIN-BAD']
+
+
+def test_stats(tmpdir, monkeypatch, minion, nova_module):
+    stat_nova = nova_module('stat_nova')
+    minion.salt['file.stats'] = lambda *args, **kwargs: pytest.fail('file.stats called')
+    user = pwd.getpwuid(os.getuid()).pw_name
+    group = grp.getgrgid(os.getgid()).gr_name
+    looked_up = []
+    getpwuid = stat_nova.pwd.getpwuid
+    monkeypatch.setattr(stat_nova.pwd, 'getpwuid', lambda uid: looked_up.append(uid) or getpwuid(uid))
+    paths = [str(tmpdir.join('file{0}'.format(index))) for index in range(20)]
+    for path in paths:
+        open(path, 'w').close()
+    os.symlink(str(tmpdir.join('nowhere')), str(tmpdir.join('broken')))
+
+    stats = stat_nova._stats(paths + [str(tmpdir.join('broken')), str(tmpdir.join('missing'))])
+
+    assert looked_up == [os.getuid()]
+    assert stats[paths[0]] == {'mode': oct(os.stat(paths[0]).st_mode & 0o7777),
+                               'uid': os.getuid(),
+                               'gid': os.getgid(),
+                               'user': user,
+                               'group': group}
+    assert stats[str(tmpdir.join('broken'))]['mode'] == '0777'
+    assert stats[str(tmpdir.join('missing'))] == {}
+
+    profile = _profile([(path, {'tag': 'OWNER', 'user': user, 'uid': os.getuid(),
+                                'group': group, 'gid': os.getgid()})
+                        for path in paths] +
+                       [(paths[0], {'tag': 'OWNER-BAD', 'user': 'nobody-at-all'}),
+                        (str(tmpdir.join('missing')), {'tag': 'MISSING', 'user': user})])
+    ret = stat_nova.audit([('modes', profile)], '*')
+
+    assert len(ret['Success']) == len(paths)
+    assert sorted(tag_data['tag'] for tag_data in ret['Failure']) == ['MISSING', 'OWNER-BAD']
@@ -0,0 +1,40 @@
+# -*- encoding: utf-8 -*-
+from __future__ import absolute_import
+
+import pytest
+
+
+def _profile(key):
+    return {key: {'blacklist': {'telnet': {
+        'data': {'Microsoft Windows Server 2012 R2 Standard': [{'Telnet': 'CIS-1.1'}]},
+        'description': 'telnet',
+        'match_output': '0',
+        'value_type': 'equal'}}}}
+
+
+@pytest.mark.parametrize('name,module', [('win_pkg', 'win_auditpol'),
+                                         ('win_gp', 'win_auditpol'),
+                                         ('win_firewall', 'win_auditpol'),
+                                         ('win_auditpol', 'win_auditpol'),
+                                         ('win_reg', 'win_reg'),
+                                         ('win_secedit', 'win_secedit')])
+def test_reported_module(minion, nova_module, name, module):
+    minion.grains['osfullname'] = 'Microsoft Windows Server 2012 R2 Standard'
+    mod = nova_module(name)
+    data_list = [('windows', _profile(name))]
+
+    tags = mod.__tagtable__.tags(data_list, name, **mod.__nova_tags__)
+
+    assert [tag_data['module'] for tag_data in tags['CIS-1.1']] == [module]
+
+
+def test_win_pkg_audit(minion, nova_module):
+    minion.grains['osfullname'] = 'Microsoft Windows Server 2012 R2 Standard'
+    minion.salt['pkg.list_pkgs'] = lambda: {'Telnet': '1.0'}
+    win_pkg = nova_module('win_pkg')
+
+    ret = win_pkg.audit([('windows', _profile('win_pkg'))], '*')
+
+    assert ret['Success'] == []
+    assert [(tag_data['tag'], tag_data['module']) for tag_data in ret['Failure']] == \
+        [('CIS-1.1', 'win_auditpol')]